@@ -0,0 +1,164 @@
+# backend/api/admission.py
+
+import asyncio
+import collections
+import math
+import os
+import time
+from typing import Any, Deque, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+QUEUE_WAIT = Histogram("travel_admission_wait_seconds", "规划请求在准入队列中的等待时间（秒）",
+                       buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+REJECTED = Counter("travel_admission_rejected_total", "准入控制拒绝的请求数", ["reason"])
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳（排队已满或排队超时），retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """一次被接纳的执行，release 可重复调用（只生效一次）"""
+
+    def __init__(self, controller: "AdmissionController", admitted_at: float):
+        self._controller = controller
+        self.admitted_at = admitted_at
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    进程内的准入控制：限制同时执行的规划数量，超出的请求进入有界的 FIFO 等待队列
+
+    - 队列已满时立即拒绝（429 + Retry-After），而不是让所有请求一起变慢
+    - 每个请求在队列中有等待期限，超时同样拒绝
+    - 统计队列深度、等待时间与拒绝次数
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, queue_timeout: float = 30,
+                 window: int = 256):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._wait_times: Deque[float] = collections.deque(maxlen=window)
+        self._service_times: Deque[float] = collections.deque(maxlen=window)
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.completed = 0
+
+    def retry_after(self) -> int:
+        """按最近的平均执行时间估算排队中的请求全部完成所需的秒数"""
+        if not self._service_times:
+            return 5
+        average = sum(self._service_times) / len(self._service_times)
+        estimate = average * (len(self._waiters) + 1) / max(self.max_concurrent, 1)
+        return int(min(max(math.ceil(estimate), 1), 120))
+
+    async def acquire(self, timeout: Optional[float] = None) -> AdmissionTicket:
+        """
+        申请执行名额：有空闲名额时立即返回，否则排队等待
+
+        Args:
+            timeout: 排队期限（秒），默认使用 queue_timeout
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        start = time.monotonic()
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            return self._admit(start)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            REJECTED.labels("queue_full").inc()
+            raise AdmissionRejected("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout or self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # 超时的同时恰好轮到该请求：名额已经转交，直接使用
+                return self._admit(start, handed_off=True)
+            waiter.cancel()
+            self.rejected_timeout += 1
+            REJECTED.labels("queue_timeout").inc()
+            raise AdmissionRejected("queue_timeout", self.retry_after())
+        except BaseException:
+            # 客户端断开等导致的取消：已经转交的名额要交还
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake_next()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return self._admit(start, handed_off=True)
+
+    def _admit(self, start: float, handed_off: bool = False) -> AdmissionTicket:
+        # 由 _wake_next 转交的名额已经计入 in_flight
+        if not handed_off:
+            self.in_flight += 1
+        self.admitted += 1
+        now = time.monotonic()
+        self._wait_times.append(now - start)
+        QUEUE_WAIT.observe(now - start)
+        return AdmissionTicket(self, now)
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        self.completed += 1
+        self._service_times.append(time.monotonic() - ticket.admitted_at)
+        self.in_flight -= 1
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        """把空出的名额直接转交给队首仍在等待的请求"""
+        while self._waiters and self.in_flight < self.max_concurrent:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds_avg": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "wait_seconds_p95": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)], 4) if waits else 0.0,
+            "wait_seconds_max": round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+# 进程内共享的准入控制器
+plan_admission = AdmissionController(
+    max_concurrent=int(os.environ.get("PLAN_MAX_CONCURRENT", "4")),
+    max_queue=int(os.environ.get("PLAN_MAX_QUEUE", "16")),
+    queue_timeout=float(os.environ.get("PLAN_QUEUE_TIMEOUT", "30")),
+)
+
+Gauge("travel_admission_in_flight", "正在执行的规划数量").set_function(lambda: plan_admission.in_flight)
+Gauge("travel_admission_queue_depth", "准入队列中等待的请求数量").set_function(lambda: len(plan_admission._waiters))
@@ -0,0 +1,91 @@
+# backend/api/runtime.py
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from config.agent_workflow import TravelAgent
+from config.mcp_pool import close_mcp_pool
+
+# ------------------------------------------------------------------
+# 进程内唯一的 Agent 实例及其初始化状态
+# ------------------------------------------------------------------
+travel_agent_instance = TravelAgent()
+
+# status: pending / initializing / ready / failed
+init_state: Dict[str, Any] = {
+    "status": "pending",
+    "error": None,
+    "started_at": None,
+    "ready_at": None,
+    "duration_seconds": None,
+}
+
+_init_task: Optional[asyncio.Task] = None
+
+# 模型连通性检查结果缓存，避免每次健康检查都调用大模型
+_model_check: Dict[str, Any] = {"checked_at": 0.0, "reachable": None, "error": None}
+MODEL_CHECK_INTERVAL = float(os.environ.get("HEALTH_MODEL_CHECK_INTERVAL", "60"))
+MODEL_CHECK_TIMEOUT = float(os.environ.get("HEALTH_MODEL_CHECK_TIMEOUT", "10"))
+
+
+async def _initialize() -> None:
+    init_state.update(status="initializing", error=None, started_at=time.time())
+    print("Initializing TravelAgent...")
+    start = time.monotonic()
+    try:
+        # 这一步会启动 MCP 服务子进程（npx）
+        await travel_agent_instance.initialize()
+    except Exception as e:
+        init_state.update(status="failed", error=str(e))
+        print(f"FATAL: Agent initialization failed: {e}")
+        raise
+    init_state.update(status="ready", ready_at=time.time(),
+                      duration_seconds=round(time.monotonic() - start, 3))
+    print(f"TravelAgent initialized and ready in {init_state['duration_seconds']}s.")
+
+
+async def ensure_agent_initialized() -> TravelAgent:
+    """
+    单飞初始化：并发调用共享同一个初始化任务，整个进程只初始化一次；
+    上一次初始化失败时，下一次调用会重新尝试
+
+    Raises:
+        初始化失败时抛出原始异常
+    """
+    global _init_task
+    if init_state["status"] == "ready":
+        return travel_agent_instance
+
+    if _init_task is None or (_init_task.done() and init_state["status"] != "ready"):
+        _init_task = asyncio.ensure_future(_initialize())
+    # shield：某个请求被取消时不应该打断共享的初始化任务
+    await asyncio.shield(_init_task)
+    return travel_agent_instance
+
+
+def start_agent_initialization() -> None:
+    """在后台触发初始化（不等待结果），用于就绪检查时重试失败的初始化"""
+    if init_state["status"] in ("pending", "failed") and (_init_task is None or _init_task.done()):
+        task = asyncio.ensure_future(ensure_agent_initialized())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def check_model_reachable(force: bool = False) -> Dict[str, Any]:
+    """检查大模型是否可用（结果缓存 MODEL_CHECK_INTERVAL 秒）"""
+    if not force and time.monotonic() - _model_check["checked_at"] < MODEL_CHECK_INTERVAL:
+        return dict(_model_check)
+    try:
+        await asyncio.wait_for(travel_agent_instance.output_model.ainvoke("ping"), MODEL_CHECK_TIMEOUT)
+        _model_check.update(reachable=True, error=None)
+    except Exception as e:
+        _model_check.update(reachable=False, error=str(e) or e.__class__.__name__)
+    _model_check["checked_at"] = time.monotonic()
+    return dict(_model_check)
+
+
+async def shutdown_agent() -> None:
+    """进程退出时停止后台任务、关闭检查点数据库（结束其工作线程）并关闭 MCP 会话"""
+    await travel_agent_instance.close()
+    await close_mcp_pool()
@@ -0,0 +1,94 @@
+# backend/api/streaming.py
+
+import asyncio
+import contextlib
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+# 可以合并的增量事件类型
+COALESCE_TYPES = ("token", "plan_token")
+
+
+def format_sse(event: Dict[str, Any]) -> bytes:
+    """将事件编码为一条 Server-Sent Events 消息"""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event.get('type', 'message')}\ndata: {payload}\n\n".encode("utf-8")
+
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]],
+                     min_chars: int = 48,
+                     max_delay: float = 0.05,
+                     heartbeat_interval: float = 15) -> AsyncIterator[bytes]:
+    """
+    将代理事件流转换为 SSE 字节流
+
+    - 连续的 token / plan_token 小片段会被合并，累计到 min_chars 个字符或等待超过 max_delay 秒后再发送
+    - 长时间没有事件时发送注释行作为心跳，避免负载均衡器空闲超时断开连接
+
+    Args:
+        events: TravelAgent.stream_events 产生的事件
+        min_chars: 合并后最少的字符数
+        max_delay: 增量片段最长的等待时间（秒）
+        heartbeat_interval: 心跳间隔（秒）
+    """
+    iterator = events.__aiter__()
+    pending: Optional[asyncio.Task] = None
+    buffer: Optional[Dict[str, Any]] = None
+    loop = asyncio.get_running_loop()
+    buffered_at = 0.0
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            timeout = heartbeat_interval
+            if buffer is not None:
+                timeout = max(0.0, buffered_at + max_delay - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                # 等待超时：先发出已缓冲的增量，没有缓冲时发送心跳
+                if buffer is not None:
+                    yield format_sse(buffer)
+                    buffer = None
+                else:
+                    yield b": keep-alive\n\n"
+                continue
+
+            try:
+                event = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+
+            if event.get("type") in COALESCE_TYPES:
+                if buffer is not None and buffer["type"] == event["type"]:
+                    buffer["content"] += event.get("content", "")
+                else:
+                    if buffer is not None:
+                        yield format_sse(buffer)
+                    buffer = dict(event)
+                    buffered_at = loop.time()
+                if len(buffer["content"]) >= min_chars:
+                    yield format_sse(buffer)
+                    buffer = None
+                continue
+
+            if buffer is not None:
+                yield format_sse(buffer)
+                buffer = None
+            yield format_sse(event)
+
+        if buffer is not None:
+            yield format_sse(buffer)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            # 等待被取消的 __anext__ 真正结束后才能关闭生成器
+            with contextlib.suppress(BaseException):
+                await pending
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
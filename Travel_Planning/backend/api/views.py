@@ -1,35 +1,84 @@
 # backend/api/views.py
 
-from django.http import StreamingHttpResponse, JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 import asyncio
+import contextlib
 import json
-from config.agent_workflow import TravelAgent
+import uuid
+import weakref
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from config.answer_cache import answer_cache
+from config.tool_cache import tool_result_cache
+from config.tool_coalesce import tool_coalescer
+from .runtime import (
+    travel_agent_instance, init_state, ensure_agent_initialized,
+    start_agent_initialization, check_model_reachable
+)
+from .admission import AdmissionRejected, plan_admission
+from .streaming import sse_stream, format_sse
 
 # ------------------------------------------------------------------
 # Agent 初始化逻辑
 # ------------------------------------------------------------------
-# 1. 在全局范围创建 Agent 实例和事件标志
-travel_agent_instance = TravelAgent()
-agent_initialized = asyncio.Event()
+# Agent 实例与单飞初始化逻辑在 runtime 模块中：ASGI 启动时（backend/asgi.py）预热，
+# 未经过 lifespan 启动（例如 runserver）时由第一个请求触发。
+# 确保这里没有任何 asyncio.run(...) 的调用！
+# ------------------------------------------------------------------
 
 
-async def initialize_agent():
-    """异步初始化 Agent，并设置事件标志"""
-    # 这个 if 语句可以防止在并发请求下被重复执行
-    if not agent_initialized.is_set():
-        print("Initializing TravelAgent for the first time...")
-        try:
-            # 这一步会启动 npx 进程并打印日志
-            await travel_agent_instance.initialize()
-            agent_initialized.set()  # 设置标志，表示初始化已完成
-            print("TravelAgent initialized and ready.")
-        except Exception as e:
-            print(f"FATAL: Agent initialization failed: {e}")
+def is_complete_answer(done_event, chunks) -> bool:
+    """
+    判断回答是否可以写入缓存：预算耗尽提前结束或包含错误信息的回答是降级结果，
+    缓存后会在 TTL 内反复回放给其他用户，应在下次请求时重新运行代理
+    """
+    if (done_event.get("budget") or {}).get("stopped_early"):
+        return False
+    return "[错误]" not in "".join(chunks)
 
 
-# 2. 确保这里没有任何 asyncio.run(...) 的调用！
-# ------------------------------------------------------------------
+async def answer_events(query: str, cached_chunks=None, ticket=None, request_id=None, thread_id=None,
+                        use_cache=True):
+    """
+    在 TravelAgent.stream_events 之前加一层整句回答缓存：
+    命中时直接从内存回放最终回答，未命中时运行代理并在完成后写入缓存
+
+    Args:
+        query: 用户查询
+        cached_chunks: 回答缓存命中时的回答分片
+        ticket: 准入控制的执行名额，代理运行结束（或中途断开）时释放
+        request_id: 请求 ID，同时作为追踪的 traceId
+        thread_id: 会话 ID
+        use_cache: 是否写入回答缓存（客户端指定会话时，回答依赖会话上下文，不写入；降级回答也不写入）
+    """
+    try:
+        if cached_chunks is not None:
+            for chunk in cached_chunks:
+                yield {"type": "token", "content": chunk}
+            yield {"type": "done", "cached": True, "thread_id": thread_id}
+            return
+
+        chunks = []
+        # 客户端断开时 Django 会取消响应任务，aclosing 保证取消立即传递到代理的运行
+        agent_events = travel_agent_instance.stream_events(query, request_id=request_id, thread_id=thread_id)
+        async with contextlib.aclosing(agent_events) as agent_events:
+            async for event in agent_events:
+                if event["type"] == "token":
+                    chunks.append(event["content"])
+                elif event["type"] == "done" and use_cache and is_complete_answer(event, chunks):
+                    answer_cache.set(query, chunks)
+                yield event
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def too_many_requests(error: AdmissionRejected):
+    """过载时快速拒绝，告知客户端多久后重试"""
+    response = JsonResponse({"error": "Server is busy, please retry later", "reason": error.reason},
+                            status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
 
 
 @csrf_exempt
@@ -40,23 +89,65 @@ async def plan_travel_view(request):
     if request.method != 'POST':
         return JsonResponse({"error": "Only POST method is allowed"}, status=405)
 
-    # 3. 在处理请求前，检查并等待初始化完成
-    # 这个逻辑确保了初始化只在第一个请求时执行一次。
-    if not agent_initialized.is_set():
-        await initialize_agent()
+    # 在处理请求前，检查并等待初始化完成（并发请求共享同一次初始化）
+    try:
+        await ensure_agent_initialized()
+    except Exception:
+        response = JsonResponse({"error": "Agent is not ready, please retry later"}, status=503)
+        response['Retry-After'] = '5'
+        return response
 
     try:
         data = json.loads(request.body)
         query = data.get('query')
+        # 会话 ID：同一会话中的请求是多轮对话，中断的请求用同一会话 ID 重新提交时从检查点继续
+        client_thread_id = data.get('thread_id') or data.get('session_id')
         if not query:
             return JsonResponse({"error": "Query not provided in request body"}, status=400)
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON in request body"}, status=400)
 
+    # 回答缓存命中时不运行代理，无需占用执行名额；否则先排队申请名额，过载时直接返回 429
+    # 指定会话的请求（追问、继续中断的运行）依赖会话上下文，不使用回答缓存
+    ticket = None
+    cached_chunks = answer_cache.get(query) if not client_thread_id else None
+    if cached_chunks is None:
+        try:
+            ticket = await plan_admission.acquire()
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+    # 请求 ID 通过响应头返回，可用 python -m config.waterfall <请求 ID> 查看该请求的瀑布图
+    request_id = uuid.uuid4().hex
+    # 会话 ID 通过响应头返回，客户端追问时带上即可
+    thread_id = str(client_thread_id or uuid.uuid4().hex)
+    events = answer_events(query, cached_chunks, ticket, request_id, thread_id, use_cache=not client_thread_id)
+
+    # 客户端声明接受 text/event-stream 时，以 SSE 形式推送执行进度事件
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        async def event_stream_generator():
+            try:
+                async for message in sse_stream(events):
+                    yield message
+            except Exception as e:
+                import traceback
+                print("Error during agent processing:")
+                traceback.print_exc()
+                yield format_sse({"type": "error", "message": "抱歉，处理您的请求时发生内部错误。"})
+
+        response = StreamingHttpResponse(release_ticket_after(event_stream_generator(), ticket),
+                                         content_type="text/event-stream; charset=utf-8")
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # 关闭 nginx 等反向代理的缓冲
+        response['X-Request-ID'] = request_id
+        response['X-Thread-ID'] = thread_id
+        return response
+
     async def stream_response_generator():
         try:
-            async for chunk in travel_agent_instance.process_query(query):
-                yield chunk.encode('utf-8')
+            async with contextlib.aclosing(events):
+                async for event in events:
+                    if event["type"] == "token":
+                        yield event["content"].encode('utf-8')
         except Exception as e:
             import traceback
             print("Error during agent processing:")
@@ -64,4 +155,80 @@ async def plan_travel_view(request):
             error_message = f"抱歉，处理您的请求时发生内部错误。"
             yield error_message.encode('utf-8')
 
-    return StreamingHttpResponse(stream_response_generator(), content_type="text/plain; charset=utf-8")
\ No newline at end of file
+    response = StreamingHttpResponse(release_ticket_after(stream_response_generator(), ticket),
+                                     content_type="text/plain; charset=utf-8")
+    response['X-Request-ID'] = request_id
+    response['X-Thread-ID'] = thread_id
+    return response
+
+
+def release_ticket_after(iterator, ticket):
+    """
+    包装响应的流式内容，流结束、出错或被取消（客户端断开）时释放执行名额（release 可重复调用）
+
+    客户端在流开始前断开时生成器从未运行，finally 不会执行：生成器被回收时由 weakref.finalize 释放名额
+    """
+    if ticket is None:
+        return iterator
+
+    async def stream():
+        try:
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            ticket.release()
+
+    wrapped = stream()
+    weakref.finalize(wrapped, ticket.release)
+    return wrapped
+
+
+async def ready_view(request):
+    """
+    就绪检查：Agent 初始化完成（MCP 工具已加载）才返回 200，
+    滚动发布时负载均衡器据此决定是否向该进程转发流量
+    """
+    if init_state["status"] != "ready":
+        # 初始化失败时在后台重试
+        start_agent_initialization()
+        return JsonResponse({"ready": False, "status": init_state["status"], "error": init_state["error"]},
+                            status=503)
+    return JsonResponse({"ready": True, "tools": travel_agent_instance.tool_counts})
+
+
+async def health_view(request):
+    """
+    健康检查：报告初始化状态、各 MCP 服务的工具数量与会话状态、大模型连通性、缓存与会话检查点统计
+    """
+    ready = init_state["status"] == "ready"
+    model = await check_model_reachable() if ready else {"reachable": None, "error": None}
+    pool = getattr(travel_agent_instance, "mcp_pool", None)
+    healthy = ready and model["reachable"] is not False
+
+    return JsonResponse({
+        "status": "ok" if healthy else "degraded",
+        "agent": init_state,
+        "tools": travel_agent_instance.tool_counts,
+        "tool_catalog": travel_agent_instance.catalog_status,
+        "tool_pruning": {name: expert.summary() for name, expert in travel_agent_instance.experts.items()},
+        "mcp_sessions": pool.stats() if pool is not None else {},
+        "model": {"reachable": model["reachable"], "error": model["error"]},
+        "tool_cache": tool_result_cache.stats(),
+        "tool_coalescing": tool_coalescer.stats(),
+        "answer_cache": answer_cache.stats(),
+        "place_index": await asyncio.to_thread(travel_agent_instance.places.stats),
+        "station_catalog": travel_agent_instance.stations.stats(),
+        "transfer_planner": travel_agent_instance.transfers.stats(),
+        "door_to_door": travel_agent_instance.door_to_door.stats(),
+        "admission": plan_admission.stats(),
+        "runs": travel_agent_instance.run_stats,
+        "checkpoints": {**await travel_agent_instance.checkpointer.stats(), **travel_agent_instance.thread_stats},
+    }, status=200 if healthy else 503)
+
+
+async def metrics_view(request):
+    """
+    Prometheus 指标：按节点统计的 token、费用、模型与工具调用次数及耗时，
+    请求耗时与结果，以及准入队列的深度和等待时间
+    """
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
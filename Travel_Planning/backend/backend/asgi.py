@@ -13,4 +13,33 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.runtime import ensure_agent_initialized, shutdown_agent  # noqa: E402  需要在 Django 初始化之后导入
+
+
+async def application(scope, receive, send):
+    """
+    在 Django ASGI 应用外处理 lifespan 协议：
+    进程启动时预热 TravelAgent（启动 MCP 服务、加载工具、编译图），退出时关闭 MCP 会话。
+    预热失败不会阻止进程启动，/api/ready 会返回 503 并在后台重试。
+    """
+    if scope["type"] != "lifespan":
+        await django_application(scope, receive, send)
+        return
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await ensure_agent_initialized()
+            except Exception as e:
+                print(f"TravelAgent warmup failed during startup: {e}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await shutdown_agent()
+            except Exception as e:
+                print(f"Failed to shut down MCP sessions: {e}")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -46,6 +46,8 @@ STATIC_URL = 'static/'
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:5173", "http://localhost:5173"
 ]
+# 允许前端读取请求 ID（用于查询追踪数据）、会话 ID（用于多轮对话）与过载时的重试间隔
+CORS_EXPOSE_HEADERS = ["X-Request-ID", "X-Thread-ID", "Retry-After"]
 CSRF_TRUSTED_ORIGINS = [
     "http://127.0.0.1:5173", "http://localhost:5173"
 ]
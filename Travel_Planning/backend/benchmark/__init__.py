@@ -0,0 +1,2 @@
+# benchmark/__init__.py
+# 离线基准测试：本地替身 MCP 服务、确定性聊天模型与压测脚本（python -m benchmark.run）
@@ -0,0 +1,20 @@
+# benchmark/corpus.py
+
+# 基准测试的代表性查询：(类别, 查询)
+# - navigation / ticket：信息完整，走快速通道直接分发给专家
+# - mixed：同时需要路线和车票，supervisor 并行分发
+# - open_ended：推荐、攻略类请求，由 supervisor 综合规划
+QUERIES = [
+    ("navigation", "从长沙火车站驾车去岳麓山怎么走"),
+    ("navigation", "我在杭州东站，步行去西湖的路线"),
+    ("navigation", "北京南站到故宫坐地铁怎么走"),
+    ("navigation", "从成都东站骑行去宽窄巷子的路线"),
+    ("ticket", "查一下明天长沙到黄山的高铁票"),
+    ("ticket", "2025-08-01北京到上海的动车余票"),
+    ("ticket", "后天从广州去深圳的车次"),
+    ("mixed", "明天从长沙坐高铁去武汉，到站后怎么去黄鹤楼"),
+    ("mixed", "查询后天上海到杭州的车票，以及杭州东站到灵隐寺的公交路线"),
+    ("open_ended", "我现在在湖南长沙，需要去黄山，给我推荐一下怎么去以及旅游方案"),
+    ("open_ended", "五一从南京去苏州玩三天，帮我规划一下行程"),
+    ("open_ended", "从西安出发去成都旅游，推荐一下交通方式"),
+]
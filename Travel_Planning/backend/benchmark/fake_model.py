@@ -0,0 +1,192 @@
+# benchmark/fake_model.py
+
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from config.agents_config import current_turn
+from config.context_builder import estimate_tokens
+from config.query_parser import parse_query
+
+# 通过系统提示词识别当前扮演的角色
+ROLE_MARKERS = (
+    ("navigation_expert", "身份标识为 `navigation_expert`"),
+    ("ticketing_expert", "身份标识为 `ticketing_expert`"),
+    ("supervisor", "任务分配中枢supervisor"),
+    ("final", "你将接收两部分输入"),
+)
+
+EXPERTS = ("navigation_expert", "ticketing_expert")
+
+ROUTE_TOOLS = {
+    "driving": "maps_direction_driving",
+    "walking": "maps_direction_walking",
+    "bicycling": "maps_direction_bicycling",
+    "transit": "maps_direction_transit_integrated",
+}
+
+
+def _fake_location(place: str) -> str:
+    digest = int(hashlib.md5(place.encode()).hexdigest()[:8], 16)
+    return f"{100 + digest % 2200 / 100:.6f},{22 + digest % 1900 / 100:.6f}"
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    确定性的本地聊天模型，替代 ChatTongyi 进行离线基准测试
+
+    - supervisor：按规则解析的查询类别分发任务（单个或 PARALLEL），专家返回结果后输出 FINAL ANSWER
+    - 专家：按固定脚本依次调用工具（地理编码 -> 路线规划 / 车站编码 -> 余票查询），最后输出结果摘要
+    - 最终回答：输出 answer_chars 个字符的回答
+
+    延迟模型：first_token_latency 秒后输出第一个分片，之后每个分片（chunk_chars 个字符）间隔 chunk_latency 秒
+    """
+
+    first_token_latency: float = 0.3
+    chunk_latency: float = 0.01
+    chunk_chars: int = 8
+    answer_chars: int = 600
+    expert_result_chars: int = 300
+    bound_tools: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "scripted-fake"}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "ScriptedChatModel":
+        names = [getattr(tool, 'name', None) or tool.get("name") for tool in tools]
+        return self.model_copy(update={"bound_tools": names})
+
+    # ------------------------------------------------------------------
+    # 脚本
+    # ------------------------------------------------------------------
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        system = str(messages[0].content) if messages and messages[0].type == "system" else ""
+        role = next((role for role, marker in ROLE_MARKERS if marker in system), None)
+        if role in EXPERTS:
+            return self._expert(role, messages)
+        if role == "supervisor":
+            return self._supervisor(messages)
+        if role == "final":
+            return AIMessage(content=self._text("【出行建议】根据查询结果，推荐如下行程安排。", self.answer_chars))
+        return AIMessage(content="pong")
+
+    def _supervisor(self, messages: List[BaseMessage]) -> AIMessage:
+        # 多轮会话中只看当前轮次：追问时重新分发本轮的子任务
+        turn = current_turn(messages)
+        if any(getattr(msg, 'name', None) in EXPERTS for msg in turn):
+            return AIMessage(content="所有子任务均已完成。\nFINAL ANSWER")
+
+        query = next((str(msg.content) for msg in turn if msg.type == "human"), "")
+        parsed = parse_query(query)
+        origin, destination = parsed.origin or "长沙", parsed.destination or "黄山"
+        date = parsed.date or "2025-07-07"
+        navigation = f"navigation_expert: 当前任务是{origin}到{destination}的驾车路线规划。"
+        ticketing = f"ticketing_expert: 当前任务是查询{date}从{origin}到{destination}的车票信息及车次。"
+        if parsed.category == "navigation":
+            return AIMessage(content=f"{navigation}\nnavigation_expert")
+        if parsed.category == "ticket":
+            return AIMessage(content=f"{ticketing}\nticketing_expert")
+        return AIMessage(content=f"任务拆分如下：\n{navigation}\n{ticketing}\nPARALLEL")
+
+    def _expert(self, role: str, messages: List[BaseMessage]) -> AIMessage:
+        task = next((str(msg.content) for msg in messages[1:] if msg.type in ("human", "ai")), "")
+        # supervisor 的分发内容可能包含多行 "专家名: 任务"，只取本专家的那一行
+        lines = [line.split(":", 1)[-1] for line in task.splitlines()
+                 if line.startswith(role) and ":" in line] or [task]
+        parsed = parse_query(lines[0].replace("当前任务是", "").strip())
+        origin, destination = parsed.origin or "长沙", parsed.destination or "黄山"
+
+        if role == "navigation_expert":
+            mode = parsed.transport_mode if parsed.transport_mode in ROUTE_TOOLS else "driving"
+            route_args = {"origin": _fake_location(origin), "destination": _fake_location(destination)}
+            if mode == "transit":
+                route_args.update(city=origin, cityd=destination)
+            # 每一轮的工具调用：起点和终点的地理编码互不依赖，同一轮并行发起
+            plan = [
+                [("maps_geo", {"address": origin}), ("maps_geo", {"address": destination})],
+                [(ROUTE_TOOLS[mode], route_args)],
+            ]
+        else:
+            plan = [
+                [("get-station-code-of-citys", {"citys": f"{origin}|{destination}"})],
+                [("get-tickets", {"date": parsed.date or "2025-07-07", "fromStation": "AAA", "toStation": "BBB"})],
+            ]
+            if "车站编码（本地车站目录）" in task:
+                # 任务已附带车站编码，直接查询余票
+                plan = plan[1:]
+        plan = [calls for calls in ([(name, args) for name, args in calls if name in self.bound_tools]
+                                    for calls in plan) if calls]
+
+        steps_done = sum(1 for msg in messages if msg.type == "tool")
+        for calls in plan:
+            if steps_done < len(calls):
+                return AIMessage(content="", tool_calls=[
+                    {"name": name, "args": args, "id": f"call_{steps_done + index}"}
+                    for index, (name, args) in enumerate(calls)])
+            steps_done -= len(calls)
+        return AIMessage(content=self._text(f"{origin}到{destination}的查询结果：", self.expert_result_chars))
+
+    @staticmethod
+    def _text(prefix: str, chars: int) -> str:
+        body = "按推荐方案出行，注意提前规划时间。"
+        return (prefix + body * (chars // len(body) + 1))[:max(chars, len(prefix))]
+
+    def _with_usage(self, message: AIMessage, messages: List[BaseMessage]) -> AIMessage:
+        input_tokens = sum(estimate_tokens(str(msg.content)) for msg in messages)
+        output_tokens = estimate_tokens(str(message.content)) + 20 * len(message.tool_calls)
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens}
+        return message
+
+    # ------------------------------------------------------------------
+    # BaseChatModel 接口
+    # ------------------------------------------------------------------
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = self._with_usage(self._respond(messages), messages)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = self._with_usage(self._respond(messages), messages)
+        chunks = max(len(str(message.content)) // max(self.chunk_chars, 1), 1)
+        await asyncio.sleep(self.first_token_latency + (chunks - 1) * self.chunk_latency)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._with_usage(self._respond(messages), messages)
+        await asyncio.sleep(self.first_token_latency)
+
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False),
+                                   "id": call["id"], "index": index}
+                                  for index, call in enumerate(message.tool_calls)],
+                usage_metadata=message.usage_metadata,
+            ))
+            return
+
+        content = str(message.content)
+        for start in range(0, len(content), self.chunk_chars):
+            if start:
+                await asyncio.sleep(self.chunk_latency)
+            last = start + self.chunk_chars >= len(content)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=content[start:start + self.chunk_chars],
+                usage_metadata=message.usage_metadata if last else None,
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
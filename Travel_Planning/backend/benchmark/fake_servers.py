@@ -0,0 +1,251 @@
+# benchmark/fake_servers.py
+"""
+本地替身 MCP 服务：模仿高德地图（amap-maps）与 12306（12306-mcp）的工具名称和参数 schema，
+返回确定性的模拟数据，延迟与返回内容大小可配置
+
+用法（在 backend 目录下）：
+    python -m benchmark.fake_servers amap-maps                      # stdio
+    python -m benchmark.fake_servers 12306-mcp --transport http --port 8931
+
+环境变量：
+    BENCH_TOOL_LATENCY   每次工具调用的基础延迟（秒），默认 0.2
+    BENCH_TOOL_JITTER    延迟的随机抖动比例（0~1），默认 0.2
+    BENCH_PAYLOAD_CHARS  每次工具调用返回内容的目标字符数，默认 2000
+"""
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+from mcp.server.fastmcp import FastMCP
+
+TOOL_LATENCY = float(os.environ.get("BENCH_TOOL_LATENCY", "0.2"))
+TOOL_JITTER = float(os.environ.get("BENCH_TOOL_JITTER", "0.2"))
+PAYLOAD_CHARS = int(os.environ.get("BENCH_PAYLOAD_CHARS", "2000"))
+
+
+def _seed(*parts: Any) -> int:
+    return int(hashlib.md5(json.dumps(parts, ensure_ascii=False, default=str).encode()).hexdigest()[:8], 16)
+
+
+async def _simulate(tool: str, arguments: Dict[str, Any], data: Dict[str, Any]) -> str:
+    """按配置等待，并把返回内容填充到目标大小（相同参数返回相同内容）"""
+    rng = random.Random(_seed(tool, arguments))
+    await asyncio.sleep(max(TOOL_LATENCY * (1 + TOOL_JITTER * (2 * rng.random() - 1)), 0))
+    text = json.dumps(data, ensure_ascii=False)
+    if len(text) < PAYLOAD_CHARS:
+        data["padding"] = "说明" * ((PAYLOAD_CHARS - len(text)) // 2)
+        text = json.dumps(data, ensure_ascii=False)
+    return text
+
+
+def _location(place: str) -> str:
+    rng = random.Random(_seed(place))
+    return f"{rng.uniform(100, 122):.6f},{rng.uniform(22, 41):.6f}"
+
+
+def _steps(origin: str, destination: str, mode: str, count: int = 6) -> Dict[str, Any]:
+    rng = random.Random(_seed(origin, destination, mode))
+    return {
+        "origin": origin,
+        "destination": destination,
+        "paths": [{
+            "distance": str(rng.randint(2000, 900000)),
+            "duration": str(rng.randint(600, 36000)),
+            "steps": [{"instruction": f"沿道路{index + 1}行驶{rng.randint(100, 20000)}米",
+                       "road": f"道路{index + 1}", "distance": str(rng.randint(100, 20000))}
+                      for index in range(count)],
+        }],
+    }
+
+
+def build_amap_server(**settings: Any) -> FastMCP:
+    server = FastMCP("amap-maps", **settings)
+
+    @server.tool(name="maps_geo", description="将详细的结构化地址转换为经纬度坐标。支持对地标性名胜景区、建筑物名称解析为经纬度坐标")
+    async def maps_geo(address: str, city: Optional[str] = None) -> str:
+        return await _simulate("maps_geo", {"address": address, "city": city}, {
+            "results": [{"country": "中国", "city": city or address[:2], "formatted_address": address,
+                         "location": _location(address), "level": "兴趣点"}]})
+
+    @server.tool(name="maps_regeocode", description="将一个高德经纬度坐标转换为行政区划地址信息")
+    async def maps_regeocode(location: str) -> str:
+        return await _simulate("maps_regeocode", {"location": location}, {
+            "province": "模拟省", "city": "模拟市", "district": "模拟区", "location": location})
+
+    @server.tool(name="maps_ip_location", description="IP 定位根据用户输入的 IP 地址，定位 IP 的所在位置")
+    async def maps_ip_location(ip: str) -> str:
+        return await _simulate("maps_ip_location", {"ip": ip}, {"province": "模拟省", "city": "模拟市"})
+
+    @server.tool(name="maps_weather", description="根据城市名称或者标准adcode查询指定城市的天气")
+    async def maps_weather(city: str) -> str:
+        rng = random.Random(_seed(city))
+        today = datetime.date.today()
+        return await _simulate("maps_weather", {"city": city}, {"city": city, "forecasts": [
+            {"date": (today + datetime.timedelta(days=i)).isoformat(), "dayweather": rng.choice(["晴", "多云", "小雨"]),
+             "daytemp": str(rng.randint(10, 35)), "nighttemp": str(rng.randint(0, 20))} for i in range(4)]})
+
+    @server.tool(name="maps_search_detail", description="查询关键词搜或者周边搜获取到的POI ID的详细信息")
+    async def maps_search_detail(id: str) -> str:
+        return await _simulate("maps_search_detail", {"id": id}, {
+            "id": id, "name": f"地点{id[-4:]}", "location": _location(id), "address": "模拟地址", "rating": "4.6"})
+
+    @server.tool(name="maps_direction_bicycling", description="骑行路径规划用于规划骑行通勤方案，规划时会考虑天桥、单行线、封路等情况。最大支持 500km 的骑行路线规划")
+    async def maps_direction_bicycling(origin: str, destination: str) -> str:
+        return await _simulate("maps_direction_bicycling", {"origin": origin, "destination": destination},
+                               _steps(origin, destination, "bicycling"))
+
+    @server.tool(name="maps_direction_walking", description="步行路径规划 API 可以根据输入起点终点经纬度坐标规划100km 以内的步行通勤方案，并且返回通勤方案的数据")
+    async def maps_direction_walking(origin: str, destination: str) -> str:
+        return await _simulate("maps_direction_walking", {"origin": origin, "destination": destination},
+                               _steps(origin, destination, "walking"))
+
+    @server.tool(name="maps_direction_driving", description="驾车路径规划 API 可以根据用户起终点经纬度坐标规划以小客车、轿车通勤出行的方案，并且返回通勤方案的数据。")
+    async def maps_direction_driving(origin: str, destination: str) -> str:
+        return await _simulate("maps_direction_driving", {"origin": origin, "destination": destination},
+                               _steps(origin, destination, "driving", 10))
+
+    @server.tool(name="maps_direction_transit_integrated", description="公交路径规划 API 可以根据用户起终点经纬度坐标规划综合各类公共（火车、公交、地铁）交通方式的通勤方案，并且返回通勤方案的数据，跨城场景下必须传起点城市与终点城市")
+    async def maps_direction_transit_integrated(origin: str, destination: str, city: str, cityd: str) -> str:
+        return await _simulate("maps_direction_transit_integrated",
+                               {"origin": origin, "destination": destination, "city": city, "cityd": cityd},
+                               _steps(origin, destination, "transit", 8))
+
+    @server.tool(name="maps_distance", description="距离测量 API 可以测量两个经纬度坐标之间的距离,支持驾车、步行以及球面距离测量")
+    async def maps_distance(origins: str, destination: str, type: str = "1") -> str:
+        # 与高德一致：origins 可以用 | 分隔多个起点，每个起点返回一条结果
+        results = []
+        for index, origin in enumerate(origins.split("|")):
+            rng = random.Random(_seed(origin, destination, type))
+            results.append({"origin_id": str(index + 1), "distance": str(rng.randint(100, 900000)),
+                            "duration": str(rng.randint(60, 36000))})
+        return await _simulate("maps_distance", {"origins": origins, "destination": destination, "type": type},
+                               {"results": results})
+
+    @server.tool(name="maps_text_search", description="关键词搜，根据用户传入关键词，搜索出相关的POI")
+    async def maps_text_search(keywords: str, city: Optional[str] = None, types: Optional[str] = None) -> str:
+        rng = random.Random(_seed(keywords, city))
+        return await _simulate("maps_text_search", {"keywords": keywords, "city": city, "types": types}, {
+            "pois": [{"id": f"B0{rng.randint(10000000, 99999999)}", "name": f"{keywords}{index + 1}",
+                      "address": f"{city or ''}模拟路{index + 1}号", "location": _location(f"{keywords}{index}")}
+                     for index in range(10)]})
+
+    @server.tool(name="maps_around_search", description="周边搜，根据用户传入关键词以及坐标location，搜索出radius半径范围的POI")
+    async def maps_around_search(location: str, keywords: Optional[str] = None, radius: Optional[str] = None) -> str:
+        return await _simulate("maps_around_search", {"location": location, "keywords": keywords, "radius": radius}, {
+            "pois": [{"id": f"B1{index:08d}", "name": f"{keywords or '地点'}{index + 1}",
+                      "location": _location(f"{location}{index}")} for index in range(10)]})
+
+    return server
+
+
+def _station_code(name: str) -> str:
+    rng = random.Random(_seed(name))
+    return "".join(rng.choice("ABCDEFGHJKLMNOPQRSTUVWXYZ") for _ in range(3))
+
+
+def _trains(date: str, from_station: str, to_station: str, limit: int) -> List[Dict[str, Any]]:
+    rng = random.Random(_seed(date, from_station, to_station))
+    trains = []
+    for index in range(limit):
+        depart = rng.randint(6 * 60, 21 * 60)
+        duration = rng.randint(60, 600)
+        code = f"{rng.choice('GDK')}{rng.randint(1, 9999)}"
+        # 与真实 12306 的字段一致：train_no 是内部编号，车次号在 start_train_code，车站名与电报码分开
+        trains.append({
+            "train_no": f"{index:02d}0000{code:0>6}0I",
+            "start_train_code": code,
+            "from_station": f"车站{from_station}", "from_station_telecode": from_station,
+            "to_station": f"车站{to_station}", "to_station_telecode": to_station,
+            "start_time": f"{depart // 60:02d}:{depart % 60:02d}",
+            "arrive_time": f"{(depart + duration) // 60 % 24:02d}:{(depart + duration) % 60:02d}",
+            "lishi": f"{duration // 60:02d}:{duration % 60:02d}",
+            "prices": [{"seat_name": seat, "num": rng.choice(["有", "无", str(rng.randint(1, 20))]),
+                        "price": rng.randint(50, 1500)} for seat in ("商务座", "一等座", "二等座")],
+        })
+    return trains
+
+
+def build_12306_server(**settings: Any) -> FastMCP:
+    server = FastMCP("12306-mcp", **settings)
+
+    @server.tool(name="get-current-date", description="获取当前日期，以上海时区（Asia/Shanghai, UTC+8）为准，返回的日期格式为 \"yyyy-MM-dd\"。")
+    async def get_current_date() -> str:
+        return datetime.date.today().isoformat()
+
+    @server.tool(name="get-stations-code-in-city", description="通过中文城市名查询该城市 **所有** 火车站的名称及其对应的 `station_code`，结果是一个包含多个车站信息的列表。")
+    async def get_stations_code_in_city(city: str) -> str:
+        return await _simulate("get-stations-code-in-city", {"city": city}, {"stations": [
+            {"station_code": _station_code(city + suffix), "station_name": city + suffix, "city": city}
+            for suffix in ("", "东", "西", "南", "北")]})
+
+    @server.tool(name="get-station-code-of-citys", description="通过中文城市名查询代表该城市的 `station_code`。此接口主要用于在用户提供**城市名**作为出发地或到达地时，为接口准备 `station_code` 参数。")
+    async def get_station_code_of_citys(citys: str) -> str:
+        return await _simulate("get-station-code-of-citys", {"citys": citys}, {
+            city: {"station_code": _station_code(city), "station_name": city} for city in citys.split("|")})
+
+    @server.tool(name="get-station-code-by-names", description="通过具体的中文车站名查询其 `station_code` 和车站名。此接口主要用于在用户提供**具体车站名**作为出发地或到达地时，为接口准备 `station_code` 参数。")
+    async def get_station_code_by_names(stationNames: str) -> str:
+        return await _simulate("get-station-code-by-names", {"stationNames": stationNames}, {
+            name: {"station_code": _station_code(name), "station_name": name} for name in stationNames.split("|")})
+
+    @server.tool(name="get-station-by-telecode", description="通过车站的 `station_telecode` 查询车站的详细信息，包括名称、拼音、所属城市等。")
+    async def get_station_by_telecode(stationTelecode: str) -> str:
+        return await _simulate("get-station-by-telecode", {"stationTelecode": stationTelecode}, {
+            "station_code": stationTelecode, "station_name": f"车站{stationTelecode}"})
+
+    @server.tool(name="get-tickets", description="查询12306余票信息。")
+    async def get_tickets(date: str, fromStation: str, toStation: str, trainFilterFlags: str = "",
+                          sortFlag: str = "", sortReverse: bool = False, limitedNum: int = 0) -> str:
+        arguments = {"date": date, "fromStation": fromStation, "toStation": toStation,
+                     "trainFilterFlags": trainFilterFlags}
+        return await _simulate("get-tickets", arguments, {"tickets": _trains(date, fromStation, toStation,
+                                                                             limitedNum or 12)})
+
+    @server.tool(name="get-interline-tickets", description="查询12306中转余票信息。尚且只支持查询前十条。")
+    async def get_interline_tickets(date: str, fromStation: str, toStation: str, middleStation: str = "",
+                                    showWZ: bool = False, trainFilterFlags: str = "", sortFlag: str = "",
+                                    sortReverse: bool = False, limitedNum: int = 10) -> str:
+        arguments = {"date": date, "fromStation": fromStation, "toStation": toStation, "middleStation": middleStation}
+        return await _simulate("get-interline-tickets", arguments, {"interlines": [
+            {"first": first, "second": second} for first, second in zip(
+                _trains(date, fromStation, "ZZZ", limitedNum), _trains(date, "ZZZ", toStation, limitedNum))]})
+
+    @server.tool(name="get-train-route-stations", description="查询特定列车车次在指定区间内的途径车站、到站时间、出发时间及停留时间等详细经停信息。")
+    async def get_train_route_stations(trainNo: str, fromStationTelecode: str, toStationTelecode: str,
+                                       departDate: str) -> str:
+        arguments = {"trainNo": trainNo, "from": fromStationTelecode, "to": toStationTelecode, "date": departDate}
+        return await _simulate("get-train-route-stations", arguments, {"stations": [
+            {"station_name": f"经停站{index + 1}", "arrive_time": f"{8 + index:02d}:00",
+             "start_time": f"{8 + index:02d}:03"} for index in range(8)]})
+
+    return server
+
+
+SERVER_BUILDERS = {
+    "amap-maps": build_amap_server,
+    "12306-mcp": build_12306_server,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地替身 MCP 服务")
+    parser.add_argument("server", choices=sorted(SERVER_BUILDERS))
+    parser.add_argument("--transport", choices=("stdio", "http"), default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8930)
+    args = parser.parse_args(argv)
+
+    if args.transport == "stdio":
+        SERVER_BUILDERS[args.server](log_level="WARNING").run("stdio")
+    else:
+        SERVER_BUILDERS[args.server](host=args.host, port=args.port, log_level="WARNING").run("streamable-http")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# benchmark/replay.py
+"""
+录制 / 回放一次或多次查询的模型与 MCP 工具调用
+
+用法（在 backend 目录下）：
+    # 连接 DashScope、高德与 12306 录制（--fake 使用本地模型与替身服务）
+    python -m benchmark.replay record "从长沙驾车去岳麓山怎么走" "明天长沙到黄山的高铁票" --file slow.json.gz
+    # 离线回放：--speed 1 按原始耗时，--speed 0 不等待（只测图本身的开销）
+    python -m benchmark.replay replay slow.json.gz --speed 0 --repeat 5
+
+线上服务设置 CASSETTE_MODE=record 与 CASSETTE_FILE 后，同样会把所有请求录制到磁带，
+取回磁带后用 replay 子命令在本地复现。
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("TRACE_FILE", "")
+
+from config import Cassette, TravelAgent, close_mcp_pool  # noqa: E402
+from config.tool_cache import tool_result_cache  # noqa: E402
+
+from .fake_model import ScriptedChatModel  # noqa: E402
+from .run import percentile, start_fake_servers  # noqa: E402
+
+
+async def run_one(agent: TravelAgent, query: str) -> Dict[str, Any]:
+    result = {"query": query, "latency": None, "first_chunk": None, "error": None}
+    start = time.perf_counter()
+    try:
+        async for event in agent.stream_events(query):
+            if event.get("type") == "token" and result["first_chunk"] is None:
+                result["first_chunk"] = time.perf_counter() - start
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["latency"] = time.perf_counter() - start
+    return result
+
+
+async def record(args: argparse.Namespace) -> None:
+    cassette = Cassette(args.file, "record")
+    processes, agent = [], None
+    with tempfile.TemporaryDirectory() as config_dir:
+        try:
+            if args.fake:
+                config_path, processes = await start_fake_servers("stdio", {}, config_dir)
+                agent = TravelAgent(model=ScriptedChatModel(), servers_config=config_path, cassette=cassette)
+            else:
+                agent = TravelAgent(cassette=cassette)
+            # 先完成初始化，录制的请求耗时不包含启动 MCP 服务
+            await agent.initialize()
+            for query in args.queries:
+                result = await run_one(agent, query)
+                print(f"{result['latency']:7.2f}s  {query}" + (f"  [{result['error']}]" if result["error"] else ""))
+        finally:
+            if agent is not None:
+                await agent.close()
+            await close_mcp_pool()
+            for process in processes:
+                process.terminate()
+                await process.wait()
+    print(f"已录制 {cassette.stats['llm_recorded']} 次模型调用、{cassette.stats['tool_recorded']} 次工具调用 -> {args.file}")
+
+
+async def replay(args: argparse.Namespace) -> None:
+    latencies: List[float] = []
+    for round_index in range(args.repeat):
+        # 每轮使用新的磁带实例，保证每条记录都能被再次回放
+        cassette = Cassette(args.file, "replay", speed=args.speed)
+        agent = TravelAgent(cassette=cassette)
+        try:
+            await agent.initialize()
+            # 工具结果缓存是进程内共享的，清空后每轮的工具调用都从磁带回放
+            tool_result_cache.clear()
+            recorded = cassette.data["requests"]
+            queries = [request["query"] for request in recorded]
+            results = await asyncio.gather(*(run_one(agent, query) for query in queries)) if args.concurrent \
+                else [await run_one(agent, query) for query in queries]
+        finally:
+            await agent.close()
+
+        print(f"\n第 {round_index + 1} 轮（speed={args.speed}）")
+        for request, result in zip(recorded, results):
+            first_chunk = f"{result['first_chunk']:.2f}s" if result["first_chunk"] is not None else "-"
+            print(f"  录制 {request['duration']:7.2f}s  回放 {result['latency']:7.2f}s  首个分片 {first_chunk:>7}  "
+                  f"{request['query'][:40]}" + (f"  [{result['error']}]" if result["error"] else ""))
+            if not result["error"]:
+                latencies.append(result["latency"])
+        print(f"  磁带统计: {cassette.stats}")
+
+    if latencies:
+        print(f"\n回放耗时 mean {statistics.mean(latencies):.3f}s  p50 {percentile(latencies, 50):.3f}s  "
+              f"p95 {percentile(latencies, 95):.3f}s  max {max(latencies):.3f}s")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="录制 / 回放模型与 MCP 工具调用")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="运行查询并录制到磁带")
+    record_parser.add_argument("queries", nargs="+", help="要录制的查询")
+    record_parser.add_argument("--file", default="cassette.json.gz", help="磁带文件（.gz 结尾时压缩）")
+    record_parser.add_argument("--fake", action="store_true", help="使用本地模型与替身 MCP 服务录制")
+
+    replay_parser = subparsers.add_parser("replay", help="离线回放磁带中录制的查询")
+    replay_parser.add_argument("file", help="磁带文件")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0 表示不等待")
+    replay_parser.add_argument("--repeat", type=int, default=1, help="回放轮数")
+    replay_parser.add_argument("--concurrent", action="store_true", help="同时回放磁带中的所有查询")
+
+    args = parser.parse_args(argv)
+    asyncio.run(record(args) if args.command == "record" else replay(args))
+
+
+if __name__ == "__main__":
+    main()
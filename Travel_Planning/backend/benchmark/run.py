@@ -0,0 +1,344 @@
+# benchmark/run.py
+"""
+离线基准测试：用确定性的本地聊天模型替代 ChatTongyi、用本地替身 MCP 服务替代高德与 12306，
+按给定并发执行查询语料，统计吞吐量、延迟分位数、首个分片时间以及各图节点的耗时构成
+
+用法（在 backend 目录下）：
+    python -m benchmark.run --requests 48 --concurrency 8
+    python -m benchmark.run --transport http --tool-latency 0.5 --payload-chars 8000 --json result.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认不写追踪文件，避免基准测试产生大量 traces.jsonl；须在导入 config 之前设置
+os.environ.setdefault("TRACE_FILE", "")
+# 替身服务的工具目录快照写到临时目录，不覆盖 backend 下真实服务的快照
+os.environ.setdefault("TOOL_CATALOG_FILE", os.path.join(tempfile.gettempdir(), "travel_benchmark_tool_catalog.json"))
+
+from config import (  # noqa: E402
+    TravelAgent, PlaceIndex, RequestTrace, StationCatalog, ThreadCheckpointer, TraceCallbackHandler, close_mcp_pool
+)
+from config.accounting import FINAL_SYNTHESIS_NODE  # noqa: E402
+from config.tool_cache import tool_result_cache  # noqa: E402
+from config.tool_coalesce import tool_coalescer  # noqa: E402
+
+from .corpus import QUERIES  # noqa: E402
+from .fake_model import ScriptedChatModel  # noqa: E402
+from .fake_servers import SERVER_BUILDERS  # noqa: E402
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(max(math.ceil(pct / 100 * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(port: int, timeout: float = 15) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"替身 MCP 服务未能在 {timeout} 秒内监听端口 {port}")
+            await asyncio.sleep(0.1)
+
+
+async def start_fake_servers(transport: str, server_env: Dict[str, str],
+                             config_dir: str) -> Tuple[str, List[asyncio.subprocess.Process]]:
+    """
+    启动替身 MCP 服务并写出对应的服务配置文件
+
+    stdio 模式由会话池按配置自行启动子进程；http 模式在这里启动 streamable-http 服务子进程。
+
+    Returns:
+        (配置文件路径, 需要在结束时关闭的子进程)
+    """
+    env = {**server_env, "PYTHONPATH": BACKEND_DIR}
+    servers, processes = {}, []
+    for name in SERVER_BUILDERS:
+        if transport == "stdio":
+            servers[name] = {"command": sys.executable, "args": ["-m", "benchmark.fake_servers", name],
+                             "env": {**os.environ, **env}, "cwd": BACKEND_DIR, "transport": "stdio"}
+            continue
+        port = _free_port()
+        processes.append(await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "benchmark.fake_servers", name, "--transport", "http", "--port", str(port),
+            cwd=BACKEND_DIR, env={**os.environ, **env},
+        ))
+        await _wait_for_port(port)
+        servers[name] = {"url": f"http://127.0.0.1:{port}/mcp", "transport": "streamable_http"}
+
+    path = os.path.join(config_dir, "servers_config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"mcpServers": servers}, f, ensure_ascii=False, indent=2)
+    return path, processes
+
+
+def node_breakdown(trace: RequestTrace, usage: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """
+    按图节点拆分一次请求的耗时（秒）：节点总耗时、其中模型调用与工具调用的耗时，
+    其余部分（提示词构造、状态合并、调度等）计为框架开销
+    """
+    result = {}
+    for span in trace.spans:
+        if not span.name.startswith("node ") or span.end_ns is None:
+            continue
+        name = span.name[len("node "):]
+        node = result.setdefault(name, {"runs": 0, "wall": 0.0})
+        node["runs"] += 1
+        node["wall"] += (span.end_ns - span.start_ns) / 1e9
+    # 最终回答不在图中运行，只有模型调用
+    final = usage.get("nodes", {}).get(FINAL_SYNTHESIS_NODE)
+    if final and final.get("llm_calls"):
+        result[FINAL_SYNTHESIS_NODE] = {"runs": final["llm_calls"], "wall": final["llm_seconds"]}
+    for name, node in result.items():
+        node_usage = usage.get("nodes", {}).get(name, {})
+        node["llm"] = node_usage.get("llm_seconds", 0.0)
+        node["tool"] = node_usage.get("tool_seconds", 0.0)
+        node["overhead"] = max(node["wall"] - node["llm"] - node["tool"], 0.0)
+    return result
+
+
+async def run_query(agent: TravelAgent, category: str, query: str, no_tool_cache: bool) -> Dict[str, Any]:
+    """执行一次查询，记录首个事件、首个回答分片与总耗时"""
+    if no_tool_cache:
+        tool_result_cache.clear()
+    trace = RequestTrace()
+    result = {"category": category, "query": query, "error": None,
+              "first_event": None, "first_chunk": None, "latency": None, "nodes": {}}
+    start = time.perf_counter()
+    usage = {}
+    try:
+        async for event in agent.stream_events(query, callbacks=[TraceCallbackHandler(trace)]):
+            elapsed = time.perf_counter() - start
+            if result["first_event"] is None:
+                result["first_event"] = elapsed
+            if event.get("type") == "token" and result["first_chunk"] is None:
+                result["first_chunk"] = elapsed
+            if event.get("type") == "done":
+                usage = event.get("usage") or {}
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+    result["latency"] = time.perf_counter() - start
+    result["nodes"] = node_breakdown(trace, usage)
+    return result
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    server_env = {
+        "BENCH_TOOL_LATENCY": str(args.tool_latency),
+        "BENCH_TOOL_JITTER": str(args.tool_jitter),
+        "BENCH_PAYLOAD_CHARS": str(args.payload_chars),
+    }
+    if args.pool_size:
+        os.environ["MCP_POOL_SIZE"] = str(args.pool_size)
+    if args.max_in_flight:
+        os.environ["MCP_SESSION_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    if args.no_coalesce:
+        tool_coalescer.enabled = False
+    # 高峰期场景：所有请求都是同一条车票查询（相同线路和日期）
+    queries = [next(item for item in QUERIES if item[0] == "ticket")] if args.same_query else QUERIES
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        config_path, processes = await start_fake_servers(args.transport, server_env, config_dir)
+        agent = None
+        try:
+            model = ScriptedChatModel(first_token_latency=args.model_latency, chunk_latency=args.chunk_latency,
+                                      answer_chars=args.answer_chars)
+            # 检查点写入临时目录，与线上一样每个节点完成后保存一次（--no-checkpoint 关闭）
+            checkpoint_db = None if args.no_checkpoint else os.path.join(config_dir, "checkpoints.sqlite")
+            checkpointer = ThreadCheckpointer(checkpoint_db)
+            # 地点索引同样放在临时目录，替身服务的坐标不会写进线上的索引
+            places = PlaceIndex(None if args.no_place_index else os.path.join(config_dir, "place_index.sqlite"))
+            # 车站目录也放在临时目录，从替身 12306 服务刷新
+            stations = StationCatalog(None if args.no_station_catalog
+                                      else os.path.join(config_dir, "station_catalog.json"))
+            agent = TravelAgent(model=model, servers_config=config_path, checkpointer=checkpointer, places=places,
+                                stations=stations)
+
+            init_start = time.perf_counter()
+            await agent.initialize()
+            init_seconds = time.perf_counter() - init_start
+            # 等待车站目录首次刷新完成再计时（线上由上次保存的快照提供）
+            while stations.enabled and stations.refreshed_at is None and not agent.station_refresh.done():
+                await asyncio.sleep(0.05)
+
+            for category, query in QUERIES[:args.warmup]:
+                await run_query(agent, category, query, args.no_tool_cache)
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(index: int) -> Dict[str, Any]:
+                category, query = queries[index % len(queries)]
+                async with semaphore:
+                    return await run_query(agent, category, query, args.no_tool_cache)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(bounded(index) for index in range(args.requests)))
+            wall = time.perf_counter() - start
+            pruning = {name: expert.summary() for name, expert in agent.experts.items()}
+            place_stats = places.stats()
+            station_stats = stations.stats()
+            pool_stats = agent.mcp_pool.stats() if agent.mcp_pool is not None else {}
+            coalesce_stats = tool_coalescer.stats()
+        finally:
+            if agent is not None:
+                await agent.close()
+            await close_mcp_pool()
+            for process in processes:
+                process.terminate()
+                await process.wait()
+
+    report = summarize(results, wall, init_seconds, args)
+    report["tool_pruning"] = pruning
+    report["place_index"] = place_stats
+    report["station_catalog"] = station_stats
+    report["mcp_sessions"] = pool_stats
+    report["tool_coalescing"] = coalesce_stats
+    return report
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(statistics.mean(values), 4) if values else 0.0,
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+def summarize(results: List[Dict[str, Any]], wall: float, init_seconds: float,
+              args: argparse.Namespace) -> Dict[str, Any]:
+    ok = [result for result in results if not result["error"]]
+    nodes: Dict[str, Dict[str, float]] = {}
+    for result in ok:
+        for name, node in result["nodes"].items():
+            total = nodes.setdefault(name, {"runs": 0, "wall": 0.0, "llm": 0.0, "tool": 0.0, "overhead": 0.0})
+            for key, value in node.items():
+                total[key] += value
+
+    categories = {}
+    for result in ok:
+        categories.setdefault(result["category"], []).append(result["latency"])
+
+    return {
+        "settings": {key: value for key, value in vars(args).items() if key != "json"},
+        "init_seconds": round(init_seconds, 4),
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({result["error"] for result in results if result["error"]})[:5],
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(ok) / wall, 4) if wall else 0.0,
+        "latency": _stats([result["latency"] for result in ok]),
+        "first_event": _stats([result["first_event"] for result in ok if result["first_event"] is not None]),
+        "first_chunk": _stats([result["first_chunk"] for result in ok if result["first_chunk"] is not None]),
+        "latency_by_category": {name: _stats(values) for name, values in sorted(categories.items())},
+        # 每个节点单次运行的平均耗时（秒）
+        "nodes": {name: {"runs": int(node["runs"]),
+                         **{key: round(node[key] / node["runs"], 4) for key in ("wall", "llm", "tool", "overhead")}}
+                  for name, node in sorted(nodes.items()) if node["runs"]},
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"请求数 {report['requests']}，失败 {report['errors']}，并发 {report['settings']['concurrency']}，"
+          f"传输 {report['settings']['transport']}，初始化 {report['init_seconds']:.2f}s")
+    for error in report["error_samples"]:
+        print(f"  错误示例: {error}")
+    print(f"总耗时 {report['wall_seconds']:.2f}s，吞吐量 {report['throughput_rps']:.2f} req/s")
+
+    print(f"\n{'指标':<16}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [("latency", report["latency"]), ("first_event", report["first_event"]),
+            ("first_chunk", report["first_chunk"])]
+    rows += [(f"  {name}", stats) for name, stats in report["latency_by_category"].items()]
+    for label, stats in rows:
+        print(f"{label:<16}" + "".join(f"{stats[key]:>9.3f}" for key in ("mean", "p50", "p95", "p99", "max")))
+
+    print(f"\n{'节点（单次平均）':<22}{'runs':>6}{'wall':>9}{'llm':>9}{'tool':>9}{'overhead':>10}")
+    for name, node in report["nodes"].items():
+        print(f"{name:<24}{node['runs']:>6}" + "".join(f"{node[key]:>9.3f}" for key in ("wall", "llm", "tool"))
+              + f"{node['overhead']:>10.3f}")
+
+    print()
+    for name, pruning in report.get("tool_pruning", {}).items():
+        print(f"{name} 工具裁剪：{pruning['pruned']}/{pruning['calls']} 次使用子集，"
+              f"完整提示词约 {pruning['full_prompt_tokens']} tokens，"
+              f"平均每次模型调用节省 {pruning['saved_per_llm_call']} tokens")
+    places = report.get("place_index")
+    if places and places["enabled"]:
+        print(f"本地地点索引：{places['entries']} 个名称，命中 {places['hits']} 次（模糊 {places['fuzzy_hits']} 次），"
+              f"未命中 {places['misses']} 次，命中率 {places['hit_rate']:.1%}")
+    stations = report.get("station_catalog")
+    if stations and stations["enabled"]:
+        print(f"本地车站目录：{stations['stations']} 个车站（{stations['cities']} 个城市），"
+              f"代替 12306 查询 {stations['hits']} 次，未命中 {stations['misses']} 次，命中率 {stations['hit_rate']:.1%}")
+    coalescing = report.get("tool_coalescing")
+    if coalescing and coalescing["enabled"]:
+        print(f"相同工具调用合并：发往 MCP 服务 {coalescing['upstream_calls']} 次，合并 {coalescing['coalesced']} 次，"
+              f"合并率 {coalescing['coalesce_rate']:.1%}")
+    for name, pool in report.get("mcp_sessions", {}).items():
+        average_wait = pool["lease_wait_seconds"] / pool["leases"] * 1000 if pool["leases"] else 0.0
+        print(f"MCP 会话池 {name}：{pool['size']} 个会话，并发上限 {pool['limit']}，调用 {pool['leases']} 次，"
+              f"最多同时 {pool['peak_in_flight']} 个，排队 {pool['queued']} 次（平均 {average_wait:.1f}ms，"
+              f"最长 {pool['max_wait_seconds'] * 1000:.1f}ms）")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="TravelAgent 离线基准测试")
+    parser.add_argument("--requests", type=int, default=len(QUERIES) * 2, help="请求总数（循环使用查询语料）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的请求数")
+    parser.add_argument("--transport", choices=("stdio", "http"), default="stdio", help="替身 MCP 服务的传输方式")
+    parser.add_argument("--tool-latency", type=float, default=0.2, help="工具调用的基础延迟（秒）")
+    parser.add_argument("--tool-jitter", type=float, default=0.2, help="工具延迟的随机抖动比例")
+    parser.add_argument("--payload-chars", type=int, default=2000, help="工具返回内容的字符数")
+    parser.add_argument("--model-latency", type=float, default=0.3, help="模型输出首个分片前的延迟（秒）")
+    parser.add_argument("--chunk-latency", type=float, default=0.01, help="模型输出分片之间的间隔（秒）")
+    parser.add_argument("--answer-chars", type=int, default=600, help="最终回答的字符数")
+    parser.add_argument("--pool-size", type=int, default=0, help="每个 MCP 服务的会话数（默认按 MCP_POOL_SIZE）")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="每个会话同时进行的请求数（默认按 MCP_SESSION_MAX_IN_FLIGHT，设为 1 即独占会话）")
+    parser.add_argument("--warmup", type=int, default=1, help="正式计时前预热执行的查询数")
+    parser.add_argument("--no-tool-cache", action="store_true", help="每次请求前清空工具结果缓存")
+    parser.add_argument("--no-coalesce", action="store_true", help="不合并同时进行的相同工具调用")
+    parser.add_argument("--same-query", action="store_true", help="所有请求使用同一条车票查询（模拟高峰期的相同查询）")
+    parser.add_argument("--no-checkpoint", action="store_true", help="不保存会话检查点")
+    parser.add_argument("--no-place-index", action="store_true", help="不使用本地地点索引")
+    parser.add_argument("--no-station-catalog", action="store_true", help="不使用本地车站目录")
+    parser.add_argument("--json", help="把完整结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
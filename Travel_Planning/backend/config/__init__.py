@@ -1,11 +1,39 @@
 # config/__init__.py
 
+from .accounting import RequestUsage, UsageCallbackHandler
 from .agent_workflow import TravelAgent
 from .agents_config import (
-    agent_node, supervisor_router,
-    list_and_return_tools, load_single_mcp_config,
-    save_graph_visualization, parse_messages
+    agent_node, supervisor_router, parse_parallel_tasks,
+    list_and_return_tools, format_tools_info, load_single_mcp_config,
+    save_graph_visualization, parse_messages,
+    wrap_tool_coroutine, get_request_budget
 )
+from .answer_cache import AnswerCache, answer_cache, normalize_query
+from .background_runtime import BackgroundAgentRuntime
+from .budget import RequestBudget, budget_config, wrap_tools_with_budget
+from .cassette import Cassette, CassetteMiss
+from .checkpoint import ThreadCheckpointer
+from .context_builder import (
+    build_compact_context, estimate_tokens
+)
+from .door_to_door import DoorToDoorOptimizer, DoorToDoorPlanner, door_to_door_node
+from .mcp_pool import MCPSessionPool, get_mcp_pool, close_mcp_pool
+from .place_index import PlaceIndex, place_index, wrap_tools_with_place_index
+from .query_parser import ParsedQuery, parse_query, build_fast_path_task
+from .station_catalog import (
+    Station, StationCatalog, station_catalog,
+    wrap_tools_with_station_catalog, build_station_tools
+)
+from .tool_cache import (
+    ToolResultCache, tool_result_cache,
+    wrap_tools_with_cache, make_tool_key
+)
+from .tool_catalog import ToolCatalog, tool_catalog
+from .tool_coalesce import ToolCallCoalescer, tool_coalescer, wrap_tools_with_coalescing
+from .tool_selector import PrunedExpert, select_navigation_tools, select_ticketing_tools
+from .tracing import RequestTrace, TraceCallbackHandler, trace_exporter
+from .ticket_parser import TrainLeg, parse_tickets
+from .transfer_planner import TransferPlanner, build_transfer_tool, join_transfers
 from .promptstemp import (
     navigation_prompt, ticketing_prompt,
     supervisor_prompt, system_prompt_template,
@@ -13,10 +41,30 @@ from .promptstemp import (
 )
 
 __all__ = [
-    'TravelAgent',
-    'agent_node', 'supervisor_router',
-    'list_and_return_tools', 'load_single_mcp_config',
+    'TravelAgent', 'BackgroundAgentRuntime',
+    'RequestUsage', 'UsageCallbackHandler',
+    'RequestTrace', 'TraceCallbackHandler', 'trace_exporter',
+    'agent_node', 'supervisor_router', 'parse_parallel_tasks',
+    'list_and_return_tools', 'format_tools_info', 'load_single_mcp_config',
     'save_graph_visualization', 'parse_messages',  # 保持带 z 的拼写
+    'wrap_tool_coroutine', 'get_request_budget',
+    'RequestBudget', 'budget_config', 'wrap_tools_with_budget',
+    'Cassette', 'CassetteMiss',
+    'ThreadCheckpointer',
+    'ToolResultCache', 'tool_result_cache',
+    'wrap_tools_with_cache', 'make_tool_key',
+    'ToolCatalog', 'tool_catalog',
+    'ToolCallCoalescer', 'tool_coalescer', 'wrap_tools_with_coalescing',
+    'PrunedExpert', 'select_navigation_tools', 'select_ticketing_tools',
+    'MCPSessionPool', 'get_mcp_pool', 'close_mcp_pool',
+    'PlaceIndex', 'place_index', 'wrap_tools_with_place_index',
+    'Station', 'StationCatalog', 'station_catalog',
+    'wrap_tools_with_station_catalog', 'build_station_tools',
+    'TrainLeg', 'TransferPlanner', 'build_transfer_tool', 'join_transfers', 'parse_tickets',
+    'DoorToDoorOptimizer', 'DoorToDoorPlanner', 'door_to_door_node',
+    'build_compact_context', 'estimate_tokens',
+    'ParsedQuery', 'parse_query', 'build_fast_path_task',
+    'AnswerCache', 'answer_cache', 'normalize_query',
     'navigation_prompt', 'ticketing_prompt',
     'supervisor_prompt', 'system_prompt_template',
     'question_prompt_template'
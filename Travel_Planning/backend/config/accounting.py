@@ -0,0 +1,206 @@
+# accounting.py
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import Counter, Histogram
+
+from .context_builder import estimate_tokens
+
+# 最终回答不在图中运行，调用时在 metadata 中以该键指定所属节点
+NODE_METADATA_KEY = "graph_node"
+FINAL_SYNTHESIS_NODE = "final_synthesis"
+
+# 每千 token 的价格（元），默认按 qwen-turbo 计价
+PROMPT_PRICE_PER_1K = float(os.environ.get("LLM_PROMPT_PRICE_PER_1K", "0.0003"))
+COMPLETION_PRICE_PER_1K = float(os.environ.get("LLM_COMPLETION_PRICE_PER_1K", "0.0006"))
+
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# ------------------------------------------------------------------
+# Prometheus 指标（进程内默认 registry，由 /api/metrics 导出）
+# ------------------------------------------------------------------
+REQUESTS = Counter("travel_requests_total", "规划请求数", ["outcome"])
+REQUEST_DURATION = Histogram("travel_request_duration_seconds", "规划请求总耗时（秒）",
+                             buckets=LATENCY_BUCKETS)
+REQUEST_TOKENS = Histogram("travel_request_tokens", "单个请求在各节点消耗的 token 数", ["node"],
+                           buckets=TOKEN_BUCKETS)
+REQUEST_COST = Histogram("travel_request_cost_yuan", "单个请求的模型费用（元）",
+                         buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+NODE_TOKENS = Counter("travel_node_tokens_total", "各节点累计消耗的 token", ["node", "kind"])
+NODE_COST = Counter("travel_node_cost_yuan_total", "各节点累计的模型费用（元）", ["node"])
+NODE_LLM_CALLS = Counter("travel_node_llm_calls_total", "各节点的模型调用次数", ["node"])
+NODE_TOOL_CALLS = Counter("travel_node_tool_calls_total", "各节点的工具调用次数", ["node", "status"])
+NODE_LLM_LATENCY = Histogram("travel_node_llm_latency_seconds", "单次模型调用耗时（秒）", ["node"],
+                             buckets=LATENCY_BUCKETS)
+NODE_TOOL_LATENCY = Histogram("travel_node_tool_latency_seconds", "单次工具调用耗时（秒）", ["node"],
+                              buckets=LATENCY_BUCKETS)
+# 最终回答的上下文：baseline 为 parse_messages 的估算，compact 为实际使用的精简上下文
+CONTEXT_TOKENS = Counter("travel_final_context_tokens_total", "生成最终回答时上下文的累计 token 数", ["kind"])
+
+
+def get_graph_node(metadata: Dict[str, Any]) -> str:
+    """从回调元数据中取出事件所属的顶层图节点（专家代理内部的子图事件也归属到该专家）"""
+    if metadata.get(NODE_METADATA_KEY):
+        return metadata[NODE_METADATA_KEY]
+    checkpoint_ns = metadata.get("langgraph_checkpoint_ns") or metadata.get("checkpoint_ns") or ""
+    return checkpoint_ns.split("|")[0].split(":")[0] or metadata.get("langgraph_node", "")
+
+
+def llm_result_usage(response: LLMResult, prompt_estimate: int = 0) -> Tuple[int, int]:
+    """
+    从模型结果中读取 (输入 token, 输出 token)
+
+    依次使用消息的 usage_metadata、llm_output 中的 token_usage，
+    都没有时用 prompt_estimate 和输出文本的估算值
+    """
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if prompt_tokens or completion_tokens:
+        return prompt_tokens, completion_tokens
+
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    prompt_tokens = token_usage.get("prompt_tokens", token_usage.get("input_tokens", 0))
+    completion_tokens = token_usage.get("completion_tokens", token_usage.get("output_tokens", 0))
+    if prompt_tokens or completion_tokens:
+        return prompt_tokens, completion_tokens
+
+    completion_tokens = sum(estimate_tokens(generation.text or "")
+                            for generations in response.generations for generation in generations)
+    return prompt_estimate, completion_tokens
+
+
+def estimate_prompt_tokens(messages: List[List[Any]]) -> int:
+    """估算 on_chat_model_start 收到的消息的 token 数"""
+    return sum(estimate_tokens(str(getattr(msg, 'content', ''))) for batch in messages for msg in batch)
+
+
+def token_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * PROMPT_PRICE_PER_1K + completion_tokens * COMPLETION_PRICE_PER_1K) / 1000
+
+
+class RequestUsage:
+    """单个请求按图节点汇总的 token、调用次数与耗时"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.nodes: Dict[str, Dict[str, float]] = {}
+
+    def node(self, name: str) -> Dict[str, float]:
+        return self.nodes.setdefault(name or "other", {
+            "prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0, "llm_seconds": 0.0,
+            "tool_calls": 0, "tool_errors": 0, "tool_seconds": 0.0,
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        prompt_tokens = sum(node["prompt_tokens"] for node in self.nodes.values())
+        completion_tokens = sum(node["completion_tokens"] for node in self.nodes.values())
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_yuan": round(token_cost(prompt_tokens, completion_tokens), 6),
+            "nodes": {name: {key: round(value, 3) if isinstance(value, float) else value
+                             for key, value in node.items()}
+                      for name, node in self.nodes.items()},
+        }
+
+    def record(self, outcome: str) -> None:
+        """请求结束时写入 Prometheus 指标（outcome: completed / cancelled / failed）"""
+        REQUESTS.labels(outcome).inc()
+        REQUEST_DURATION.observe(time.monotonic() - self.started_at)
+        total_cost = 0.0
+        for name, node in self.nodes.items():
+            cost = token_cost(node["prompt_tokens"], node["completion_tokens"])
+            total_cost += cost
+            if node["llm_calls"]:
+                REQUEST_TOKENS.labels(name).observe(node["prompt_tokens"] + node["completion_tokens"])
+                NODE_COST.labels(name).inc(cost)
+        REQUEST_COST.observe(total_cost)
+
+
+def record_context_tokens(stats: Dict[str, Any]) -> None:
+    """把 build_compact_context 的统计写入 Prometheus 指标"""
+    CONTEXT_TOKENS.labels("compact").inc(stats["tokens"])
+    if "baseline_tokens" in stats:
+        CONTEXT_TOKENS.labels("baseline").inc(stats["baseline_tokens"])
+
+
+class UsageCallbackHandler(AsyncCallbackHandler):
+    """
+    按图节点统计模型调用（输入/输出 token、次数、耗时）和工具调用（次数、失败、耗时）
+
+    节点由回调元数据中的 checkpoint_ns 确定；每次调用结束即累加到 Prometheus 计数器，
+    同时汇总到当前请求的 RequestUsage
+    """
+
+    def __init__(self, usage: RequestUsage):
+        self.usage = usage
+        self._runs: Dict[UUID, Tuple[str, float, int]] = {}
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]], prompt_estimate: int = 0) -> None:
+        self._runs[run_id] = (get_graph_node(metadata or {}), time.monotonic(), prompt_estimate)
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                                  run_id: UUID, metadata: Optional[Dict[str, Any]] = None,
+                                  **kwargs: Any) -> None:
+        self._start(run_id, metadata, estimate_prompt_tokens(messages))
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *,
+                           run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, metadata, sum(estimate_tokens(prompt) for prompt in prompts))
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._runs:
+            return
+        name, started_at, prompt_estimate = self._runs.pop(run_id)
+        prompt_tokens, completion_tokens = llm_result_usage(response, prompt_estimate)
+        elapsed = time.monotonic() - started_at
+
+        node = self.usage.node(name)
+        node["prompt_tokens"] += prompt_tokens
+        node["completion_tokens"] += completion_tokens
+        node["llm_calls"] += 1
+        node["llm_seconds"] += elapsed
+
+        NODE_TOKENS.labels(name, "prompt").inc(prompt_tokens)
+        NODE_TOKENS.labels(name, "completion").inc(completion_tokens)
+        NODE_LLM_CALLS.labels(name).inc()
+        NODE_LLM_LATENCY.labels(name).observe(elapsed)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *,
+                            run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, metadata)
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        # 被处理的 ToolException（如预算超时）以 status="error" 的 ToolMessage 返回，未处理的异常走 on_tool_error
+        self._end_tool(run_id, getattr(output, 'status', None) == "error")
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, True)
+
+    def _end_tool(self, run_id: UUID, failed: bool) -> None:
+        if run_id not in self._runs:
+            return
+        name, started_at, _ = self._runs.pop(run_id)
+        elapsed = time.monotonic() - started_at
+
+        node = self.usage.node(name)
+        node["tool_calls"] += 1
+        node["tool_errors"] += int(failed)
+        node["tool_seconds"] += elapsed
+
+        NODE_TOOL_CALLS.labels(name, "error" if failed else "ok").inc()
+        NODE_TOOL_LATENCY.labels(name).observe(elapsed)
@@ -1,10 +1,13 @@
 # agent_workflow.py
 
 from langgraph.graph import END, StateGraph, START
+import asyncio
+import contextlib
 import functools
+import time
+import uuid
 from langchain.schema import HumanMessage, SystemMessage
 from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain.chat_models import init_chat_model
 # from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
@@ -13,17 +16,38 @@ from dotenv import load_dotenv
 from langchain_community.chat_models import ChatTongyi
 from langchain_community.llms import Tongyi
 from .agents_config import (
-    agent_node, supervisor_router,
-    list_and_return_tools, load_single_mcp_config,
-    parse_messages
+    agent_node, supervisor_router, current_turn,
+    list_and_return_tools, load_single_mcp_config
 )
+from .accounting import (
+    FINAL_SYNTHESIS_NODE, NODE_METADATA_KEY, RequestUsage, UsageCallbackHandler, get_graph_node,
+    record_context_tokens
+)
+from .budget import RequestBudget, budget_config, wrap_tools_with_budget
+from .cassette import Cassette
+from .checkpoint import ThreadCheckpointer
+from .context_builder import build_compact_context
+from .door_to_door import DoorToDoorPlanner, door_to_door_node
+from .mcp_pool import MCPSessionPool, get_mcp_pool
+from .place_index import PlaceIndex, place_index, wrap_tools_with_place_index
+from .query_parser import preparse_node, preparse_router, expert_router
+from .station_catalog import (
+    NEAREST_STATIONS_TOOL, SEARCH_STATIONS_TOOL, StationCatalog,
+    build_station_tools, station_catalog, wrap_tools_with_station_catalog
+)
+from .tool_cache import tool_result_cache, wrap_tools_with_cache
+from .tool_catalog import tool_catalog
+from .tool_coalesce import tool_coalescer, wrap_tools_with_coalescing
+from .tool_selector import PrunedExpert
+from .tracing import RequestTrace, TraceCallbackHandler, trace_exporter
+from .transfer_planner import TransferPlanner, build_transfer_tool
 from .promptstemp import (
     navigation_prompt, ticketing_prompt,
     supervisor_prompt, system_prompt_template,
     question_prompt_template
 )
 import operator
-from typing import Annotated, Sequence, TypedDict, List
+from typing import Annotated, Sequence, TypedDict, List, Dict, Any, Optional
 from langchain_core.messages import BaseMessage
 
 load_dotenv(override=True)
@@ -34,55 +58,292 @@ class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], operator.add]
     # sender 用于存储当前消息的发送者。通过这个字段，系统可以知道当前消息是由哪个代理生成的。
     sender: Annotated[List[str], operator.add]
+    # fast_path 记录规则预处理命中的快速通道（直达的专家名称），未命中时为 None
+    fast_path: Optional[str]
+
+
+# 工作流中的图节点
+GRAPH_NODES = ("preparser", "supervisor", "navigation_expert", "ticketing_expert", "door_to_door")
+
+# 产生任务规划的节点
+PLANNING_NODES = ("preparser", "supervisor")
+
+# 执行子任务的专家节点（door_to_door 为确定性的门到门规划，不经过 LLM）
+EXPERT_NODES = ("navigation_expert", "ticketing_expert", "door_to_door")
+
+
+def answer_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    最终回答使用的消息：当前轮次的全部消息，加上之前轮次中本轮没有重新执行的专家的结果
+    （例如追问“换成后天的车票”时，沿用上一轮的路线结果，丢弃过期的车票结果）
+    """
+    turn = current_turn(messages)
+    history = list(messages[:len(messages) - len(turn)])
+    rerun = {getattr(msg, 'name', None) for msg in turn}
+    latest = {}
+    for msg in history:
+        name = getattr(msg, 'name', None)
+        if name in EXPERT_NODES and name not in rerun:
+            latest[name] = msg
+    reused = {id(msg) for msg in latest.values()}
+    return [msg for msg in history if id(msg) in reused] + turn
+
+
+def conversation_query(messages: Sequence[BaseMessage], query: str) -> str:
+    """多轮会话中交给最终回答的问题：带上之前轮次的用户问题，追问才有完整的语义"""
+    turn = current_turn(messages)
+    previous = [str(msg.content) for msg in messages[:len(messages) - len(turn)]
+                if msg.__class__.__name__ == 'HumanMessage']
+    if not previous:
+        return query
+    return "之前的问题：" + "；".join(previous) + f"\n当前问题：{query}"
 
 
 class TravelAgent:
-    def __init__(self):
+    def __init__(self, model=None, servers_config: str = "servers_config.json",
+                 cassette: Optional[Cassette] = None, checkpointer: Optional[ThreadCheckpointer] = None,
+                 places: Optional[PlaceIndex] = None, stations: Optional[StationCatalog] = None):
+        """
+        Args:
+            model: 代理与最终回答使用的聊天模型，默认 ChatTongyi(qwen-turbo-latest)；基准测试时可替换为本地模型
+            servers_config: MCP 服务配置文件路径
+            cassette: 录制 / 回放模型与工具调用的磁带，默认按 CASSETTE_MODE 环境变量创建（未设置时不启用）；
+                回放时不连接 DashScope 和 MCP 服务
+            checkpointer: 会话检查点存储，默认按 CHECKPOINT_DB 环境变量创建
+            places: 本地地点索引，默认使用进程内共享的索引；使用磁带时不使用索引（保证录制的调用完整）
+            stations: 本地车站目录，默认使用进程内共享的目录；使用磁带时不使用目录
+        """
         self.app = None  # 图应用
-        self.output_model = ChatTongyi(model='qwen-turbo-latest')
+        self.servers_config = servers_config
+        self.tool_counts = {}  # 各 MCP 服务加载到的工具数量
+        self.mcp_pool = None  # 共享的 MCP 会话池
+        # 工具定义的来源（snapshot：磁盘快照 / live：MCP 服务）及后台校验结果
+        self.catalog_status = {"source": None, "verified": False, "changes": [], "error": None}
+        self.catalog_check: Optional[asyncio.Task] = None  # 后台校验快照的任务
+        self.experts: Dict[str, PrunedExpert] = {}  # 按任务裁剪工具的专家代理
+        # 运行统计：客户端中途断开导致的取消计入 cancelled
+        self.run_stats = {"started": 0, "completed": 0, "cancelled": 0, "failed": 0}
+        self.cassette = cassette if cassette is not None else Cassette.from_env()
+        self.checkpointer = checkpointer if checkpointer is not None else ThreadCheckpointer.from_env()
+        if places is None:
+            places = PlaceIndex() if self.cassette is not None else place_index
+        self.places = places
+        if stations is None:
+            stations = StationCatalog() if self.cassette is not None else station_catalog
+        self.stations = stations
+        self.station_refresh: Optional[asyncio.Task] = None  # 后台定期刷新车站目录的任务
+        self._station_source = None  # 刷新车站目录时调用的 12306 工具（未经缓存与预算包装）
+        # 确定性的中转规划（挑选中转城市、并行查询两段余票并拼接），按 TRANSFER_* 环境变量配置
+        self.transfers = TransferPlanner.from_env(catalog=self.stations)
+        # 确定性的门到门规划（接驳 + 车次 + 接驳），按 DOOR_TO_DOOR_* 环境变量配置
+        self.door_to_door = DoorToDoorPlanner.from_env(self.stations, self.transfers)
+        self.thread_stats = {"resumed": 0, "follow_ups": 0}  # 中断后继续的运行、追问的次数
+        replaying = self.cassette is not None and self.cassette.replaying
+        self.output_model = model or (None if replaying else ChatTongyi(model='qwen-turbo-latest'))
+        if self.cassette is not None:
+            self.output_model = self.cassette.wrap_model(self.output_model)
         self.final_prompt = ChatPromptTemplate.from_messages([
             ('system', system_prompt_template),
             ('human', question_prompt_template)
         ])
 
     async def initialize(self):
-        """初始化代理和工作流"""
-        # 进入
-        client_map = MultiServerMCPClient(await load_single_mcp_config("amap-maps"))
-        client_mcp = MultiServerMCPClient(await load_single_mcp_config("12306-mcp"))
+        """
+        初始化代理和工作流
 
-        tools_map, tools_map_info = await list_and_return_tools(client_map)
-        tools_mcp, tools_mcp_info = await list_and_return_tools(client_mcp)
+        工具目录快照与当前 MCP 配置匹配时，直接用快照中的工具定义构建工作流，
+        MCP 服务在后台并行启动，连上后校验快照（工具定义或服务版本变化时更新快照并重建工作流）；
+        没有可用快照时等待 MCP 服务启动，并把工具定义写入快照。
+        """
+        if self.cassette is not None and self.cassette.replaying:
+            # 回放：工具 schema 与调用结果都来自磁带，不启动 MCP 服务
+            self.catalog_status.update(source="cassette", verified=True)
+            await self._build_app(self.cassette.tool_source("amap-maps"), self.cassette.tool_source("12306-mcp"))
+            return
 
-        # 创建各个专家代理
-        agent_map = create_react_agent(
-            model=self.output_model,
-            name="navigation_expert",
-            tools=tools_map,
-            prompt=SystemMessage(content=(navigation_prompt(tools_map_info)))
-        )
+        # 车站目录从快照加载到内存（进程内只加载一次），之后在后台定期从 12306 刷新
+        if self.stations.enabled and not self.stations.stations:
+            count = self.stations.load()
+            await self.stations.fill_locations(self.places)
+            print(f"车站目录已加载 {count} 个车站")
 
-        agent_mcp = create_react_agent(
-            model=self.output_model,
-            name="ticketing_expert",
-            tools=tools_mcp,
-            prompt=SystemMessage(content=(ticketing_prompt(tools_mcp_info)))
-        )
+        # 进程内共享的 MCP 会话池（MCP 服务只在首次建池时启动）
+        pool = self.mcp_pool = await get_mcp_pool(self.servers_config, start=False)
+        snapshot = tool_catalog.load(pool.connections)
+        if snapshot is not None:
+            for server_name, mcp_tools in snapshot.items():
+                pool.load_tools(server_name, mcp_tools)
+            self.catalog_status.update(source="snapshot", verified=False, changes=[], error=None)
+            if self.catalog_check is None or self.catalog_check.done():
+                self.catalog_check = asyncio.create_task(self._verify_catalog(pool), name="tool-catalog-check")
+        else:
+            live = await self._list_live_tools(pool)
+            for server_name, mcp_tools in live.items():
+                pool.load_tools(server_name, mcp_tools)
+            tool_catalog.save(pool.connections, live,
+                              {server_name: pool.server_info(server_name) for server_name in live})
+            self.catalog_status.update(source="live", verified=True, changes=[], error=None)
+
+        await self._build_app(pool.server("amap-maps"), pool.server("12306-mcp"))
+        if self.stations.enabled and (self.station_refresh is None or self.station_refresh.done()):
+            self.station_refresh = asyncio.create_task(self._refresh_stations(), name="station-catalog-refresh")
+
+    async def _refresh_stations(self) -> None:
+        """后台定期从 12306 刷新车站目录（快照未过期时等到过期再刷新），刷新后补全坐标并写入快照"""
+        while True:
+            await asyncio.sleep(self.stations.next_refresh_delay())
+            try:
+                count = await self.stations.refresh(self._station_source)
+            except Exception as e:
+                print(f"车站目录刷新失败（12306 服务不可用）: {str(e) or e.__class__.__name__}")
+                # 失败后过一段时间重试，不等到下一个刷新周期
+                await asyncio.sleep(min(self.stations.refresh_interval, 600))
+                continue
+            await self.stations.fill_locations(self.places)
+            self.stations.save()
+            print(f"车站目录已刷新: {count} 个车站，目录共 {len(self.stations.stations)} 个车站")
+
+    async def _list_live_tools(self, pool: MCPSessionPool) -> Dict[str, Any]:
+        """启动会话池，并行查询各 MCP 服务的工具定义"""
+        await pool.start()
+        server_names = list(pool.connections)
+        results = await asyncio.gather(*(pool.list_mcp_tools(server_name) for server_name in server_names))
+        return dict(zip(server_names, results))
+
+    async def _verify_catalog(self, pool: MCPSessionPool) -> None:
+        """后台校验工具目录快照：工具定义或服务版本变化时更新快照，并用实时的工具定义重建工作流"""
+        try:
+            live = await self._list_live_tools(pool)
+        except Exception as e:
+            self.catalog_status["error"] = str(e) or e.__class__.__name__
+            print(f"工具目录快照校验失败（MCP 服务不可用）: {self.catalog_status['error']}")
+            return
+
+        changes = {
+            server_name: tool_catalog.diff(server_name, pool.connections[server_name], mcp_tools,
+                                           pool.server_info(server_name))
+            for server_name, mcp_tools in live.items()
+        }
+        changes = {server_name: diff for server_name, diff in changes.items() if diff}
+        self.catalog_status.update(verified=True, changes=[f"{server_name}: {change}"
+                                                           for server_name, diff in changes.items()
+                                                           for change in diff])
+        if not changes:
+            return
+
+        print(f"工具目录快照已过期，更新快照并重建工作流: {self.catalog_status['changes']}")
+        tool_catalog.save(pool.connections, live, {server_name: pool.server_info(server_name) for server_name in live})
+        for server_name, mcp_tools in live.items():
+            pool.load_tools(server_name, mcp_tools)
+        # 进行中的请求继续使用旧的工作流，新请求使用重建后的工作流
+        await self._build_app(pool.server("amap-maps"), pool.server("12306-mcp"))
+
+    async def close(self):
+        """
+        停止后台的快照校验与车站目录刷新，保存车站目录并关闭检查点数据库
+        （进程退出时调用，MCP 会话由 close_mcp_pool 关闭）
+        """
+        for task in (self.catalog_check, self.station_refresh):
+            if task is not None and not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        if self.stations.dirty:
+            self.stations.save()
+        await self.checkpointer.close()
+
+    async def _build_app(self, amap_source, ticket_source):
+        """用两个工具来源（会话池中的服务或回放磁带）构建专家代理与工作流"""
+        tools_map, _ = await list_and_return_tools(amap_source)
+        tools_mcp, _ = await list_and_return_tools(ticket_source)
+        self.tool_counts = {"amap-maps": len(tools_map), "12306-mcp": len(tools_mcp)}
+
+        if self.cassette is not None and self.cassette.recording:
+            # 录制：最内层记录真实的 MCP 调用（缓存命中的调用不经过 MCP，也不记录）
+            self.cassette.record_tool_specs("amap-maps", tools_map)
+            self.cassette.record_tool_specs("12306-mcp", tools_mcp)
+            tools_map = self.cassette.wrap_tools(tools_map)
+            tools_mcp = self.cassette.wrap_tools(tools_mcp)
+
+        # 不同请求同时发起的相同调用（工具名 + 规范化参数）合并为一次 MCP 调用
+        tools_map = wrap_tools_with_coalescing(tools_map, tool_coalescer)
+        tools_mcp = wrap_tools_with_coalescing(tools_mcp, tool_coalescer)
+
+        # 刷新车站目录直接调用 12306 工具（结果不进入缓存，也不占用请求预算）
+        ticket_tools = {tool.name: tool for tool in tools_mcp}
+
+        async def call_ticket_tool(name: str, arguments: Dict[str, Any]) -> Optional[str]:
+            return await ticket_tools[name].ainvoke(arguments)
+
+        self._station_source = call_ticket_tool
+
+        # 地理编码先查本地地点索引，实时结果写入索引
+        tools_map = wrap_tools_with_place_index(tools_map, self.places)
+        # 车站编码先查本地车站目录，实时结果写入目录
+        tools_mcp = wrap_tools_with_station_catalog(tools_mcp, self.stations)
+
+        # 为工具加上进程内共享的结果缓存
+        tools_map = wrap_tools_with_cache(tools_map, tool_result_cache)
+        tools_mcp = wrap_tools_with_cache(tools_mcp, tool_result_cache)
+        # 最外层按请求预算限制工具调用时间（超时结果不会进入缓存）
+        tools_map = wrap_tools_with_budget(tools_map)
+        tools_mcp = wrap_tools_with_budget(tools_mcp)
+        # 本地车站目录的工具：票务专家按拼音 / 前缀查找车站，导航专家查找最近的车站
+        station_tools = build_station_tools(self.stations)
+        if station_tools:
+            tools_mcp = tools_mcp + [station_tools[SEARCH_STATIONS_TOOL]]
+            tools_map = tools_map + [station_tools[NEAREST_STATIONS_TOOL]]
+        # 中转规划通过带缓存与预算的 get-tickets 查询两段余票
+        transfer_tool = build_transfer_tool(self.transfers, tools_mcp)
+        if transfer_tool is not None:
+            tools_mcp = tools_mcp + [transfer_tool]
+
+        # 门到门规划节点直接调用带索引、缓存与预算的导航 / 票务工具
+        planner_tools = {tool.name: tool for tool in tools_map + tools_mcp}
+
+        async def call_planner_tool(name: str, arguments: Dict[str, Any]) -> Optional[str]:
+            if name not in planner_tools:
+                return None
+            return await planner_tools[name].ainvoke(arguments)
+
+        # 创建各个专家代理：每个任务只绑定相关的工具子集，系统提示词中也只列出这些工具
+        def expert_builder(name, render_prompt):
+            def build(tools, tools_info):
+                return create_react_agent(
+                    model=self.output_model,
+                    name=name,
+                    tools=tools,
+                    prompt=SystemMessage(content=render_prompt(tools_info)),
+                    # 检查点以工作流节点为粒度，专家内部的 ReAct 循环不单独保存
+                    checkpointer=False
+                )
+            return build
+
+        agent_map = PrunedExpert("navigation_expert", tools_map,
+                                 expert_builder("navigation_expert", navigation_prompt), navigation_prompt)
+        agent_mcp = PrunedExpert("ticketing_expert", tools_mcp,
+                                 expert_builder("ticketing_expert", ticketing_prompt), ticketing_prompt)
+        self.experts = {"navigation_expert": agent_map, "ticketing_expert": agent_mcp}
 
         supervisor = create_react_agent(
             tools=[],
             model=self.output_model,
             name="supervisor",
             prompt=SystemMessage(content=supervisor_prompt()),
+            checkpointer=False,
         )
 
         # 创建工作流
         workflow = StateGraph(AgentState)
 
         # 添加节点
+        workflow.add_node("preparser", functools.partial(preparse_node, stations=self.stations,
+                                                         door_to_door=self.door_to_door.enabled))
         workflow.add_node("supervisor", functools.partial(agent_node, agent=supervisor, name="supervisor"))
         workflow.add_node("navigation_expert", functools.partial(agent_node, agent=agent_map, name="navigation_expert"))
         workflow.add_node("ticketing_expert", functools.partial(agent_node, agent=agent_mcp, name="ticketing_expert"))
+        workflow.add_node("door_to_door", functools.partial(door_to_door_node, planner=self.door_to_door,
+                                                            call_tool=call_planner_tool))
 
         # 添加边
         workflow.add_conditional_edges(
@@ -94,32 +355,178 @@ class TravelAgent:
                 "__end__": END
             }
         )
-        workflow.add_edge("navigation_expert", "supervisor")
-        workflow.add_edge("ticketing_expert", "supervisor")
-        workflow.add_edge(START, "supervisor")
+        # 专家完成后：快速通道的任务直接结束，否则回到 supervisor
+        for expert in EXPERT_NODES:
+            workflow.add_conditional_edges(
+                expert,
+                expert_router,
+                {"supervisor": "supervisor", "__end__": END}
+            )
 
-        self.app = workflow.compile(name="travel_agent")
+        # 规则预处理：简单查询跳过 supervisor 直达专家
+        workflow.add_conditional_edges(
+            "preparser",
+            preparse_router,
+            {
+                "supervisor": "supervisor",
+                "navigation_expert": "navigation_expert",
+                "ticketing_expert": "ticketing_expert",
+                "door_to_door": "door_to_door"
+            }
+        )
+        workflow.add_edge(START, "preparser")
 
-    async def process_query(self, query: str) -> AsyncGenerator[str, None]:
-        """处理用户查询并返回流式响应"""
+        # 每个节点完成后按会话（thread_id）保存检查点
+        self.app = workflow.compile(name="travel_agent", checkpointer=await self.checkpointer.open())
+
+    async def stream_events(self, query: str, budget: Optional[RequestBudget] = None,
+                            request_id: Optional[str] = None,
+                            callbacks: Optional[List[Any]] = None,
+                            thread_id: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        处理用户查询，按执行顺序流式返回带类型的进度事件
+
+        事件类型：
+            plan_token        supervisor 规划内容的增量输出
+            plan              supervisor 一轮规划完成（完整内容）
+            subtask_started   专家代理开始执行子任务
+            tool_call         专家代理发起工具调用
+            subtask_finished  专家代理完成子任务
+            resumed           会话上次的运行中断，从最后完成的节点继续（附带待执行的节点）
+            token             最终回答的增量输出
+            done              全部完成（附带请求 ID、会话 ID、预算与 token 使用情况）
+
+        调用方停止迭代（aclose）或所在任务被取消（例如客户端断开连接）时，
+        取消会传递到 LangGraph 的运行、专家代理的 ainvoke 以及进行中的 MCP 工具调用。
+
+        Args:
+            query: 用户查询
+            budget: 请求的时间与 token 预算，默认按环境变量创建；预算所剩无几时停止分发子任务，
+                直接用已有结果生成最终回答
+            request_id: 请求 ID（追踪的 traceId，32 位十六进制），默认自动生成
+            callbacks: 额外的回调处理器（例如基准测试统计各节点耗时），作用于工作流和最终回答
+            thread_id: 会话 ID，默认新建会话；同一会话中的查询是多轮对话，
+                会话上次的运行中断且查询相同时从最后完成的节点继续
+        """
+        self.run_stats["started"] += 1
+        thread_id = thread_id or uuid.uuid4().hex
+        # 按节点统计 token、模型与工具调用，请求结束时写入 Prometheus 指标
+        usage = RequestUsage()
+        # 请求级追踪：图节点、模型调用和工具调用的 span 挂在请求的根 span 下
+        trace = RequestTrace(request_id, {"request.query": query})
+        outcome = "failed"
+        try:
+            events = self._stream_events(query, budget or RequestBudget.from_env(), usage, trace, callbacks or [],
+                                         thread_id)
+            async with contextlib.aclosing(events) as events:
+                async for event in events:
+                    yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            print(f"查询已取消（客户端断开）: {query[:50]}")
+            raise
+        else:
+            outcome = "completed"
+        finally:
+            self.run_stats[outcome] += 1
+            usage.record(outcome)
+            summary = usage.summary()
+            trace.finish(outcome, {"request.prompt_tokens": summary["prompt_tokens"],
+                                   "request.completion_tokens": summary["completion_tokens"]})
+            trace_exporter.submit(trace)
+            if outcome == "completed":
+                # 中断的运行保留全部检查点以便继续，完成后只保留最新状态
+                await self.checkpointer.prune(thread_id)
+            if self.cassette is not None and self.cassette.recording:
+                # 每个请求结束后写一次磁带，进程异常退出时已完成的请求不会丢失
+                self.cassette.record_request(query, trace.request_id, time.monotonic() - usage.started_at, outcome)
+                self.cassette.save()
+
+    async def _stream_events(self, query: str, budget: RequestBudget, usage: RequestUsage,
+                             trace: RequestTrace, callbacks: List[Any],
+                             thread_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """stream_events 的实际实现"""
         if not self.app:
             await self.initialize()
 
-        # 第一步：获取原始响应
-        agent_response = await self.app.ainvoke(
-            {"messages": [HumanMessage(content=query)]}
-        )
-        print(agent_response)
-        formatted_response = await parse_messages(agent_response['messages'])
-        # print("_________1_______")
-        # print(formatted_response)
-        # print("_________2_______")
-        # print("以上是原始响应")
+        # 预算通过 configurable 传递到各节点、路由和工具，token 用量由回调计入预算
+        config = budget_config(budget)
+        config["configurable"]["thread_id"] = thread_id
+        config["callbacks"].append(UsageCallbackHandler(usage))
+        config["callbacks"].append(TraceCallbackHandler(trace))
+        config["callbacks"].extend(callbacks)
+
+        graph_input = {"messages": [HumanMessage(content=query)]}
+        if self.checkpointer.enabled:
+            snapshot = await self.app.aget_state(config)
+            messages = snapshot.values.get("messages") or []
+            turn = current_turn(messages)
+            if snapshot.next and turn and turn[0].content == query:
+                # 同一查询的上次运行中断：已完成节点的结果在检查点中，只执行剩下的节点
+                graph_input = None
+                self.thread_stats["resumed"] += 1
+                print(f"会话 {thread_id} 从检查点继续，待执行节点: {list(snapshot.next)}")
+                yield {"type": "resumed", "thread_id": thread_id, "nodes": list(snapshot.next)}
+            elif messages:
+                # 追问：supervisor 能看到之前轮次的专家结果；上次未完成的节点会被丢弃
+                self.thread_stats["follow_ups"] += 1
+
+        final_state = None
+        # 第一步：运行多代理工作流，边运行边转发进度事件
+        async for event in self.app.astream_events(
+                graph_input,
+                config=config,
+                version="v2"
+        ):
+            kind = event["event"]
+            name = event.get("name")
+            data = event.get("data", {})
+            # 图节点的事件只有一层父级（即整个图的运行）
+            is_node = len(event.get("parent_ids", [])) == 1 and name in GRAPH_NODES
+            node = get_graph_node(event.get("metadata", {}))
+
+            if kind == "on_chat_model_stream" and node == "supervisor":
+                content = getattr(data.get("chunk"), "content", "")
+                if content:
+                    yield {"type": "plan_token", "node": node, "content": content}
+            elif kind == "on_chain_start" and is_node and name not in PLANNING_NODES:
+                input_messages = (data.get("input") or {}).get("messages") or []
+                task = (data.get("input") or {}).get("subtask") or (
+                    input_messages[-1].content if input_messages else "")
+                yield {"type": "subtask_started", "node": name, "task": task}
+            elif kind == "on_tool_start":
+                yield {"type": "tool_call", "node": node, "tool": name, "args": data.get("input")}
+            elif kind == "on_chain_end" and is_node:
+                output_messages = (data.get("output") or {}).get("messages") or []
+                content = output_messages[-1].content if output_messages else ""
+                if name in PLANNING_NODES:
+                    if content:
+                        yield {"type": "plan", "node": name, "content": content}
+                else:
+                    yield {"type": "subtask_finished", "node": name, "content": content}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                final_state = data.get("output")
+
+        # 只保留专家结果，丢弃路由信息和元数据，并控制在 token 预算内；追问时沿用之前轮次的结果
+        messages = (final_state or {}).get('messages', [])
+        formatted_response, context_stats = await build_compact_context(answer_messages(messages))
+        record_context_tokens(context_stats)
 
         # 第二步：使用大模型生成最终响应
         chain = self.final_prompt | self.output_model
         async for chunk in chain.astream({
-            "query": query,
+            "query": conversation_query(messages, query),
             "context": formatted_response
-        }):
-            yield chunk.content
+        }, config={"callbacks": config["callbacks"], "metadata": {NODE_METADATA_KEY: FINAL_SYNTHESIS_NODE}}):
+            if chunk.content:
+                yield {"type": "token", "content": chunk.content}
+
+        yield {"type": "done", "request_id": trace.request_id, "thread_id": thread_id,
+               "budget": budget.stats(), "usage": usage.summary()}
+
+    async def process_query(self, query: str) -> AsyncGenerator[str, None]:
+        """处理用户查询并返回流式响应（只输出最终回答的文本）"""
+        async with contextlib.aclosing(self.stream_events(query)) as events:
+            async for event in events:
+                if event["type"] == "token":
+                    yield event["content"]
@@ -1,14 +1,22 @@
 # agents_config.py
 
+import asyncio
 import os
 from typing import Literal
 from langchain.schema import AIMessage
 import re
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Callable, Optional, Sequence, Union
 import json
 import aiofiles
 from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage
+from langchain_core.tools import BaseTool, StructuredTool
+from langgraph.config import get_config
+from langgraph.errors import GraphRecursionError
+from langgraph.types import Send
+
+# 请求预算（budget.RequestBudget）在 RunnableConfig["configurable"] 中的键名
+BUDGET_CONFIG_KEY = "request_budget"
 
 
 async def load_single_mcp_config(key: str, file_path: str = "servers_config.json") -> str:
@@ -161,16 +169,31 @@ async def list_and_return_tools(client):
         tuple: (工具列表, 格式化字符串)
     """
     tools = await client.get_tools()
-    output_lines = []
     valid_tools = []
-    # 构建工具信息字符串
-    # output_lines.append("────────────────────")
-    for i, tool in enumerate(tools, 1):
+    for tool in tools:
         if isinstance(tool, str):
             # 如果是字符串，打印一个警告，并跳过这个错误的元素
             print(f"警告：工具列表中发现一个无效的字符串元素 '{tool}'，已自动忽略。请检查后台服务或客户端配置。")
             continue  # 跳过当前循环的剩余部分
         valid_tools.append(tool)  # 将有效的工具添加到新列表中
+
+    return valid_tools, format_tools_info(valid_tools)  # 返回工具列表和格式化字符串
+
+
+def format_tools_info(tools: List[BaseTool]) -> str:
+    """
+    把工具列表格式化为嵌入系统提示词的说明（名称、描述、参数）
+
+    Args:
+        tools: 工具列表
+
+    Returns:
+        格式化字符串
+    """
+    output_lines = []
+    # 构建工具信息字符串
+    # output_lines.append("────────────────────")
+    for i, tool in enumerate(tools, 1):
         output_lines.append(f"\n{i}. {tool.name.upper()}")
         output_lines.append(f"   {tool.description}")
 
@@ -184,9 +207,33 @@ async def list_and_return_tools(client):
         # output_lines.append("────────────────────")
 
     # 将列表合并为字符串
-    tools_info = "\n".join(output_lines)
+    return "\n".join(output_lines)
 
-    return valid_tools, tools_info  # 返回工具列表和格式化字符串
+
+def wrap_tool_coroutine(tool: BaseTool, make_coroutine: Callable) -> BaseTool:
+    """
+    替换工具的异步执行函数，返回一个新的工具对象（名称、描述、参数 schema 保持不变）
+
+    Args:
+        tool: 原始工具（通常是 MCP 适配器生成的 StructuredTool）
+        make_coroutine: 形如 make_coroutine(tool, call_next) 的工厂函数，
+            call_next 为原始的异步执行函数，返回值为新的 async def (**arguments)
+
+    Returns:
+        包装后的新工具；没有异步执行函数的工具原样返回
+    """
+    call_next = getattr(tool, 'coroutine', None)
+    if call_next is None:
+        return tool
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        coroutine=make_coroutine(tool, call_next),
+        response_format=tool.response_format,
+        metadata=tool.metadata,
+    )
 
 
 async def keep_last_message(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -217,18 +264,64 @@ async def keep_last_message(state: Dict[str, Any]) -> Dict[str, Any]:
     return new_state
 
 
-async def agent_node(state, agent, name):
-    # 调用代理
-    if name == "supervisor":
-        agent_response = await agent.ainvoke(state)
+def current_turn(messages: Sequence[Any]) -> List[Any]:
+    """多轮会话中当前轮次的消息：最后一条用户消息及其之后的消息（没有用户消息时为全部消息）"""
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].__class__.__name__ == 'HumanMessage':
+            return list(messages[index:])
+    return list(messages)
 
-    else:
-        new_state = await keep_last_message(state)
-        agent_response = await agent.ainvoke(new_state)
 
-    # agent_response = await agent.ainvoke(state)
+def get_request_budget(config: Optional[Dict[str, Any]] = None):
+    """
+    获取当前请求的预算（budget.RequestBudget）：优先从传入的 config 读取，否则从当前运行上下文中读取；
+    不在图的运行中或请求没有设置预算时返回 None
+    """
+    if config is None:
+        try:
+            config = get_config()
+        except RuntimeError:
+            return None
+    return (config.get("configurable") or {}).get(BUDGET_CONFIG_KEY)
+
+
+async def agent_node(state, agent, name, config=None):
+    # 请求预算：限制本节点的运行时间，专家的 ReAct 循环按剩余 token 限制步数
+    budget = get_request_budget(config)
+    invoke_config = None
+    timeout = None
+    if budget is not None:
+        timeout = budget.node_timeout()
+        if name != "supervisor":
+            invoke_config = {"recursion_limit": budget.expert_recursion_limit()}
 
-    agent_response_content = agent_response['messages'][-1].content
+    # 调用代理
+    try:
+        if name == "supervisor":
+            agent_response = await asyncio.wait_for(agent.ainvoke(state), timeout)
+
+        else:
+            new_state = await keep_last_message(state)
+            new_state.pop("subtask", None)
+            agent_response = await asyncio.wait_for(agent.ainvoke(new_state, invoke_config), timeout)
+
+        # agent_response = await agent.ainvoke(state)
+
+        agent_response_content = agent_response['messages'][-1].content
+    except (asyncio.TimeoutError, GraphRecursionError) as e:
+        # 预算用尽：不再等待，带着已有结果进入最终回答
+        if budget is not None:
+            budget.stopped_early = True
+        reason = "请求时间预算已用尽" if isinstance(e, asyncio.TimeoutError) else "执行步数达到上限"
+        print(f"{name} 提前结束：{reason}")
+        agent_response_content = f"[错误] 任务未完成（{reason}）"
+        if name == "supervisor":
+            agent_response_content += "\nFINAL ANSWER"
+
+    # 并行分发的子任务：在结果前标注对应的子任务，方便 supervisor 汇总
+    subtask = state.get("subtask") if isinstance(state, dict) else None
+    if subtask:
+        agent_response_content = f"【子任务】{subtask}\n{agent_response_content}"
 
     return {
         "messages": [AIMessage(content=str(agent_response_content), name=name)],
@@ -236,12 +329,43 @@ async def agent_node(state, agent, name):
     }
 
 
-async def supervisor_router(state) -> Literal["navigation_expert", "ticketing_expert", "__end__"]:
+# 并行子任务行，例如 "navigation_expert: 当前任务是……"
+PARALLEL_TASK_PATTERN = re.compile(r'^\s*[-*]?\s*(navigation_expert|ticketing_expert)\s*[:：]\s*(.+?)\s*$')
+
+
+def parse_parallel_tasks(content: str) -> List[tuple]:
+    """
+    从 supervisor 的输出中解析并行子任务
+
+    Args:
+        content: supervisor 输出的文本
+
+    Returns:
+        [(代理名称, 子任务描述), ...]，没有并行子任务时返回空列表
+    """
+    tasks = []
+    for line in content.splitlines():
+        match = PARALLEL_TASK_PATTERN.match(line)
+        if match:
+            task = re.sub(r'^当前任务是\s*[:：]?\s*', '', match.group(2))
+            tasks.append((match.group(1), task))
+    return tasks
+
+
+async def supervisor_router(state, config=None) -> Union[Literal["navigation_expert", "ticketing_expert", "__end__"], List[Send]]:
     messages = state["messages"]
     if not messages:
         return "__end__"  # 空消息直接终止
 
+    # 剩余预算只够生成最终回答：不再分发新的子任务
+    budget = get_request_budget(config)
+    if budget is not None and budget.is_low():
+        budget.stopped_early = True
+        return "__end__"
+
     last_message = messages[-1]
+    # 循环调用保护只统计当前轮次（多轮会话中之前轮次的调用不计入）
+    turn = current_turn(messages)
 
     # 内容提取与清洗
     content = last_message.content.strip() if hasattr(last_message, 'content') else ""
@@ -253,19 +377,33 @@ async def supervisor_router(state) -> Literal["navigation_expert", "ticketing_ex
 
     # 指令正则匹配（严格模式）
     final_answer_pattern = r'^final\s+answer$'
+    parallel_pattern = r'^parallel$'
     nav_pattern = r'^navigation_expert$'
     ticket_pattern = r'^ticketing_expert$'
 
     # 优先级判定
     if re.match(final_answer_pattern, last_line):
         return "__end__"
+    elif re.match(parallel_pattern, last_line) or len(parse_parallel_tasks(content)) > 1:
+        # 并行分发：每个相互独立的子任务发送给对应代理，结果在下一步一起合并回 AgentState
+        sends = []
+        for expert, task in parse_parallel_tasks(content):
+            expert_calls = sum(1 for msg in turn if expert in getattr(msg, 'content', ''))
+            if expert_calls >= 7:
+                continue
+            sends.append(Send(expert, {
+                "messages": [AIMessage(content=f"当前任务是：{task}", name="supervisor")],
+                "sender": [],
+                "subtask": task,
+            }))
+        return sends or "__end__"
     elif re.match(nav_pattern, last_line):
         # 循环调用保护（示例阈值3次）
-        nav_calls = sum(1 for msg in messages if 'navigation_expert' in getattr(msg, 'content', ''))
+        nav_calls = sum(1 for msg in turn if 'navigation_expert' in getattr(msg, 'content', ''))
         return "navigation_expert" if nav_calls < 7 else "__end__"
     elif re.match(ticket_pattern, last_line):
         # 循环调用保护
-        ticket_calls = sum(1 for msg in messages if 'ticketing_expert' in getattr(msg, 'content', ''))
+        ticket_calls = sum(1 for msg in turn if 'ticketing_expert' in getattr(msg, 'content', ''))
         return "ticketing_expert" if ticket_calls < 7 else "__end__"
 
     # 模糊决策（根据提示词建议优先导航）
@@ -0,0 +1,184 @@
+# answer_cache.py
+
+import datetime
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .query_parser import parse_date, parse_query, strip_dates
+
+# 地名别称 -> 规范名称
+PLACE_ALIASES = {
+    "魔都": "上海",
+    "帝都": "北京",
+    "羊城": "广州",
+    "鹏城": "深圳",
+    "星城": "长沙",
+    "蓉城": "成都",
+    "山城": "重庆",
+    "江城": "武汉",
+    "泉城": "济南",
+    "春城": "昆明",
+    "高铁站": "站",
+    "火车站": "站",
+    "动车站": "站",
+}
+ALIAS_PATTERN = re.compile("|".join(sorted(map(re.escape, PLACE_ALIASES), key=len, reverse=True)))
+
+# 对语义没有影响的客套词
+FILLER_PATTERN = re.compile(r'查询一下|查一下|查询|查查|请问|请|麻烦|帮我|帮忙|给我|一下|谢谢|你好|您好|吗|呢|吧|啊|呀')
+
+# 标点与空白
+PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+', re.UNICODE)
+
+# 回答中包含余票信息时，缓存时间要短
+TICKET_AVAILABILITY_PATTERN = re.compile(r'余票|有票|无票|候补|剩余\s*\d+\s*张|\d+\s*张|商务座|一等座|二等座|硬卧|软卧|硬座')
+
+
+def normalize_query(query: str, today: Optional[datetime.date] = None) -> str:
+    """
+    规范化查询：统一全角半角和大小写、相对日期换算为绝对日期、替换地名别称、去掉空白标点和客套词
+
+    Args:
+        query: 用户原始查询
+        today: 当前日期，默认取系统日期
+
+    Returns:
+        规范化后的查询字符串（日期以 @YYYY-MM-DD 结尾）
+    """
+    today = today or datetime.date.today()
+    text = unicodedata.normalize("NFKC", query).lower().strip()
+    date = parse_date(text, today)
+    text = strip_dates(text)
+    text = ALIAS_PATTERN.sub(lambda match: PLACE_ALIASES[match.group(0)], text)
+    text = FILLER_PATTERN.sub("", text)
+    text = PUNCTUATION_PATTERN.sub("", text)
+    return f"{text}@{date.isoformat()}" if date else text
+
+
+def char_ngram_embedding(text: str, n: int = 2) -> Dict[str, float]:
+    """本地的字符 n-gram 向量（L2 归一化），无需任何模型即可粗略衡量两个查询的相似度"""
+    grams = Counter(text[i:i + n] for i in range(max(len(text) - n + 1, 1)))
+    norm = math.sqrt(sum(v * v for v in grams.values())) or 1.0
+    return {gram: count / norm for gram, count in grams.items()}
+
+
+def cosine_similarity(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(key, 0.0) for key, value in a.items())
+
+
+def query_signature(query: str, today: Optional[datetime.date] = None) -> Tuple:
+    """查询的结构化要素，相似度匹配时要求完全一致，防止不同路线被误判为同义"""
+    parsed = parse_query(query, today)
+    return (parsed.origin, parsed.destination, parsed.date,
+            parsed.transport_mode, tuple(parsed.train_types), tuple(parsed.excluded_train_types),
+            tuple(parsed.seat_types), tuple(parsed.excluded_seat_types), parsed.category)
+
+
+class AnswerCache:
+    """
+    整个查询的最终回答缓存
+
+    - 以规范化后的查询作为缓存键
+    - 可选：结构化要素一致时，用本地向量相似度匹配措辞不同的同义查询
+    - 回答包含余票信息时使用短 TTL，否则使用长 TTL
+    - 存储流式输出的分片，命中时按原样回放
+    """
+
+    def __init__(self, max_entries: int = 512,
+                 ttl: float = 6 * 3600,
+                 ticket_ttl: float = 120,
+                 similarity_threshold: Optional[float] = None,
+                 embed: Optional[Callable[[str], Dict[str, float]]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ticket_ttl = ticket_ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed or char_ngram_embedding
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry["expires_at"] <= now]:
+            del self._entries[key]
+
+    def get(self, query: str) -> Optional[List[str]]:
+        """查询缓存，命中时返回回答分片列表"""
+        self._expire()
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+
+        if entry is None and self.similarity_threshold is not None and self._entries:
+            signature = query_signature(query)
+            vector = self.embed(key)
+            best_score, best_key = 0.0, None
+            for candidate_key, candidate in self._entries.items():
+                if candidate["signature"] != signature:
+                    continue
+                score = cosine_similarity(vector, candidate["vector"])
+                if score > best_score:
+                    best_score, best_key = score, candidate_key
+            if best_key is not None and best_score >= self.similarity_threshold:
+                key, entry = best_key, self._entries[best_key]
+                self.similar_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(entry["chunks"])
+
+    def set(self, query: str, chunks: List[str]) -> None:
+        """写入最终回答，按是否包含余票信息决定 TTL"""
+        answer = "".join(chunks)
+        if not answer.strip() or self.max_entries <= 0:
+            return
+        ttl = self.ticket_ttl if TICKET_AVAILABILITY_PATTERN.search(answer) else self.ttl
+        if ttl <= 0:
+            return
+
+        key = normalize_query(query)
+        self._entries[key] = {
+            "chunks": list(chunks),
+            "expires_at": time.monotonic() + ttl,
+            "signature": query_signature(query) if self.similarity_threshold is not None else None,
+            "vector": self.embed(key) if self.similarity_threshold is not None else None,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _similarity_threshold_from_env() -> Optional[float]:
+    value = os.environ.get("ANSWER_CACHE_SIMILARITY")
+    return float(value) if value else None
+
+
+# 进程内共享的回答缓存
+answer_cache = AnswerCache(
+    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", str(6 * 3600))),
+    ticket_ttl=float(os.environ.get("ANSWER_CACHE_TICKET_TTL", "120")),
+    similarity_threshold=_similarity_threshold_from_env(),
+)
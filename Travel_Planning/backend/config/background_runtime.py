@@ -0,0 +1,102 @@
+# background_runtime.py
+
+import asyncio
+import contextlib
+import queue
+import threading
+from typing import Any, Callable, Coroutine, Dict, Iterator, Optional
+
+from .agent_workflow import TravelAgent
+from .mcp_pool import close_mcp_pool
+
+# 队列中表示事件流结束的标记
+_END = object()
+
+
+class BackgroundAgentRuntime:
+    """
+    在专用后台线程的事件循环上运行进程内共享的 TravelAgent，供同步调用方（例如 Streamlit）使用
+
+    MCP 的 stdio 会话、会话池和检查点数据库都绑定在创建它们的事件循环上，
+    所有调用都提交到同一个常驻的循环：进程内只启动一次 MCP 服务、只编译一次工作流，
+    不同用户的对话通过 thread_id 区分。
+    """
+
+    def __init__(self, agent_factory: Callable[[], TravelAgent] = TravelAgent):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="travel-agent-loop", daemon=True)
+        self.thread.start()
+        self.agent = agent_factory()
+        self.active_streams = 0  # 正在进行的流式请求数
+        self.closed = False
+        # 调用方（例如 Streamlit）退出前不会调用 close：主线程结束后由这个线程关闭代理，
+        # 否则检查点数据库的工作线程会让进程卡在退出阶段
+        threading.Thread(target=self._close_on_exit, name="travel-agent-exit").start()
+
+    def _close_on_exit(self) -> None:
+        threading.main_thread().join()
+        if not self.closed:
+            self.close()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """在后台循环上执行协程并等待结果（阻塞当前线程）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def initialize(self) -> None:
+        """初始化代理（启动 MCP 服务、构建工作流），已初始化时直接返回"""
+        if self.agent.app is None:
+            self.run(self.agent.initialize())
+
+    def stream_events(self, query: str, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        同步迭代 TravelAgent.stream_events 的事件
+
+        代理在后台循环上运行，事件经队列交给调用线程；调用方提前停止迭代（例如 Streamlit 中断脚本）时，
+        取消会传递到后台的运行和进行中的 MCP 工具调用。
+        """
+        events: "queue.Queue[Any]" = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async with contextlib.aclosing(self.agent.stream_events(query, **kwargs)) as agent_events:
+                    async for event in agent_events:
+                        events.put(event)
+            except Exception as e:
+                events.put(e)
+            finally:
+                events.put(_END)
+
+        self.active_streams += 1
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = events.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.active_streams -= 1
+            if not future.done():
+                future.cancel()
+
+    def close(self, timeout: float = 10) -> None:
+        """关闭代理和 MCP 会话池并停止后台循环"""
+        if self.closed:
+            return
+        self.closed = True
+
+        async def shutdown() -> None:
+            await self.agent.close()
+            await close_mcp_pool()
+
+        try:
+            self.run(shutdown(), timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
@@ -0,0 +1,158 @@
+# budget.py
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tools import BaseTool, ToolException
+
+from .accounting import estimate_prompt_tokens, llm_result_usage
+from .agents_config import BUDGET_CONFIG_KEY, get_request_budget, wrap_tool_coroutine
+from .context_builder import estimate_tokens
+
+
+@dataclass
+class RequestBudget:
+    """
+    单个请求的时间与 token 预算
+
+    - deadline_seconds: 从请求开始到最终回答完成的时间上限
+    - token_budget: 整个请求（规划、专家、最终回答）可使用的 token 总数
+    - reserve_seconds / reserve_tokens: 为最终回答预留的部分，剩余预算低于预留值时不再分发新的子任务
+    """
+    deadline_seconds: float = 120
+    token_budget: int = 60000
+    reserve_seconds: float = 20
+    reserve_tokens: int = 8000
+    max_expert_steps: int = 8
+    tokens_per_step: int = 3000
+    tool_timeout: float = 30
+    started_at: float = field(default_factory=time.monotonic)
+    tokens_used: int = 0
+    llm_calls: int = 0
+    stopped_early: bool = False
+
+    @classmethod
+    def from_env(cls) -> "RequestBudget":
+        """按环境变量创建预算（未设置时使用默认值）"""
+        return cls(
+            deadline_seconds=float(os.environ.get("REQUEST_DEADLINE_SECONDS", "120")),
+            token_budget=int(os.environ.get("REQUEST_TOKEN_BUDGET", "60000")),
+            reserve_seconds=float(os.environ.get("REQUEST_RESERVE_SECONDS", "20")),
+            reserve_tokens=int(os.environ.get("REQUEST_RESERVE_TOKENS", "8000")),
+            max_expert_steps=int(os.environ.get("EXPERT_MAX_STEPS", "8")),
+            tool_timeout=float(os.environ.get("TOOL_CALL_TIMEOUT", "30")),
+        )
+
+    def remaining_seconds(self) -> float:
+        return self.deadline_seconds - (time.monotonic() - self.started_at)
+
+    def remaining_tokens(self) -> int:
+        return self.token_budget - self.tokens_used
+
+    def is_low(self) -> bool:
+        """剩余预算只够生成最终回答"""
+        return (self.remaining_seconds() <= self.reserve_seconds
+                or self.remaining_tokens() <= self.reserve_tokens)
+
+    def node_timeout(self) -> float:
+        """单个图节点最多可以运行的秒数（扣除最终回答的预留时间）"""
+        return max(self.remaining_seconds() - self.reserve_seconds, 0.0)
+
+    def expert_recursion_limit(self) -> int:
+        """
+        专家 ReAct 循环的 recursion_limit：可用步数由剩余 token 决定，不超过 max_expert_steps。
+        每一步是一次模型调用加一次工具调用（两个超步），最后还要一次模型调用输出结果
+        """
+        spendable = self.remaining_tokens() - self.reserve_tokens
+        steps = min(self.max_expert_steps, max(spendable // self.tokens_per_step, 1))
+        return 2 * steps + 1
+
+    def tool_call_timeout(self) -> float:
+        return max(min(self.tool_timeout, self.node_timeout()), 0.0)
+
+    def charge(self, tokens: int) -> None:
+        self.tokens_used += max(int(tokens), 0)
+        self.llm_calls += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 3),
+            "deadline_seconds": self.deadline_seconds,
+            "tokens_used": self.tokens_used,
+            "token_budget": self.token_budget,
+            "llm_calls": self.llm_calls,
+            "stopped_early": self.stopped_early,
+        }
+
+
+def budget_config(budget: RequestBudget) -> Dict[str, Any]:
+    """生成携带预算的 RunnableConfig：预算通过 configurable 传递到各节点和工具，token 用量由回调统计"""
+    return {
+        "configurable": {BUDGET_CONFIG_KEY: budget},
+        "callbacks": [BudgetCallbackHandler(budget)],
+    }
+
+
+class BudgetCallbackHandler(AsyncCallbackHandler):
+    """
+    统计模型调用消耗的 token 并计入请求预算
+
+    优先使用模型返回的用量（usage_metadata 或 llm_output.token_usage），
+    没有用量信息时按输入与输出文本估算
+    """
+
+    def __init__(self, budget: RequestBudget):
+        self.budget = budget
+        self._prompt_tokens: Dict[UUID, int] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                                  run_id: UUID, **kwargs: Any) -> None:
+        self._prompt_tokens[run_id] = estimate_prompt_tokens(messages)
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *,
+                           run_id: UUID, **kwargs: Any) -> None:
+        self._prompt_tokens[run_id] = sum(estimate_tokens(prompt) for prompt in prompts)
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+        self.budget.charge(sum(llm_result_usage(response, prompt_tokens)))
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._prompt_tokens.pop(run_id, None)
+
+
+def wrap_tools_with_budget(tools: List[BaseTool]) -> List[BaseTool]:
+    """
+    为工具调用加上请求预算的时间限制：预算已用尽时不再调用，
+    超时抛出 ToolException；包装后的工具处理该异常（handle_tool_error），
+    专家收到错误信息后可以据此结束任务，回调收到 status="error" 的 ToolMessage
+    """
+
+    def make_coroutine(tool, call_next):
+        async def budgeted_call(**arguments):
+            budget = get_request_budget()
+            if budget is None:
+                return await call_next(**arguments)
+            timeout = budget.tool_call_timeout()
+            if timeout <= 0:
+                raise ToolException(f"[错误] 请求时间预算已用尽，未调用工具 {tool.name}")
+            try:
+                return await asyncio.wait_for(call_next(**arguments), timeout)
+            except asyncio.TimeoutError:
+                raise ToolException(f"[错误] 工具 {tool.name} 调用超时（{timeout:.0f} 秒）")
+
+        return budgeted_call
+
+    wrapped = []
+    for tool in tools:
+        budgeted = wrap_tool_coroutine(tool, make_coroutine)
+        if budgeted is not tool:
+            budgeted.handle_tool_error = True
+        wrapped.append(budgeted)
+    return wrapped
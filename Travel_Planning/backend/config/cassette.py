@@ -0,0 +1,415 @@
+# cassette.py
+
+import asyncio
+import collections
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message, message_to_dict, messages_from_dict
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+from .agents_config import wrap_tool_coroutine
+from .tool_cache import make_tool_key
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMiss(Exception):
+    """回放时磁带中找不到对应的模型或工具调用"""
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _jsonable(value: Any) -> Any:
+    """把工具结果（文本、内容块、MCP 资源对象）转换成可写入 JSON 的结构"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    """参与匹配的消息内容（忽略消息 ID、工具调用 ID 等每次运行都会变化的字段）"""
+    return {
+        "type": message.type,
+        "name": getattr(message, 'name', None),
+        "content": message.content,
+        "tool_calls": [{"name": call["name"], "args": call["args"]}
+                       for call in getattr(message, 'tool_calls', None) or []],
+    }
+
+
+class Cassette:
+    """
+    模型与 MCP 工具调用的录制 / 回放磁带
+
+    - record：透传到真实的模型和 MCP 服务，同时记录每次模型调用（输入消息、输出消息、流式分片及其间隔）
+      和每次工具调用（参数、结果、耗时），以及各服务的工具 schema
+    - replay：不连接 DashScope 和 MCP 服务，按原始耗时（除以 speed）从磁带返回结果；
+      speed=0 时不等待
+
+    回放按输入内容精确匹配；相对日期等导致输入变化时，退回到同一角色（系统提示词 + 可用工具）
+    或同名工具按录制顺序的下一条记录，并计入 fuzzy_matches。
+
+    文件为 JSON，路径以 .gz 结尾时使用 gzip 压缩。
+    """
+
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的磁带模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self.data: Dict[str, Any] = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "tools": {}, "requests": [], "llm": [], "tool_calls": [],
+        }
+        self.stats = {"llm_recorded": 0, "tool_recorded": 0, "llm_replayed": 0, "tool_replayed": 0,
+                      "fuzzy_matches": 0, "misses": 0}
+        if self.replaying:
+            self.load()
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """按 CASSETTE_MODE（record / replay）、CASSETTE_FILE、CASSETTE_SPEED 创建，未设置模式时返回 None"""
+        mode = os.environ.get("CASSETTE_MODE", "").strip().lower()
+        if not mode:
+            return None
+        return cls(os.environ.get("CASSETTE_FILE", "cassette.json.gz"), mode,
+                   float(os.environ.get("CASSETTE_SPEED", "1")))
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    # ------------------------------------------------------------------
+    # 文件读写
+    # ------------------------------------------------------------------
+    def _open(self, path: str, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(path, mode + "t", encoding="utf-8")
+        return open(path, mode, encoding="utf-8")
+
+    def load(self) -> None:
+        with self._open(self.path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"不支持的磁带版本: {data.get('version')}")
+        self.data = data
+        # 精确匹配与按角色 / 工具名的顺序匹配共用同一条记录，used 标记已回放
+        self._llm_by_key: Dict[str, Deque[Dict]] = collections.defaultdict(collections.deque)
+        self._llm_by_role: Dict[str, Deque[Dict]] = collections.defaultdict(collections.deque)
+        for entry in data["llm"]:
+            entry["used"] = False
+            self._llm_by_key[entry["key"]].append(entry)
+            self._llm_by_role[entry["role"]].append(entry)
+        self._tools_by_key: Dict[str, Deque[Dict]] = collections.defaultdict(collections.deque)
+        self._tools_by_name: Dict[str, Deque[Dict]] = collections.defaultdict(collections.deque)
+        for entry in data["tool_calls"]:
+            entry["used"] = False
+            self._tools_by_key[entry["key"]].append(entry)
+            self._tools_by_name[entry["tool"]].append(entry)
+
+    def save(self) -> None:
+        """写入磁带文件（先写临时文件再替换，中途失败不会损坏已有的磁带）"""
+        with self._lock:
+            payload = json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))
+        tmp_path = f"{self.path}.tmp"
+        with self._open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _offset(self) -> float:
+        return round(time.monotonic() - self._started_at, 4)
+
+    async def _sleep(self, seconds: float) -> None:
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    def _sleep_sync(self, seconds: float) -> None:
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    @staticmethod
+    def _take(primary: Deque[Dict], fallback: Deque[Dict]) -> tuple:
+        """取第一条未回放的记录，返回 (记录, 是否为顺序匹配)"""
+        for queue, fuzzy in ((primary, False), (fallback, True)):
+            while queue and queue[0]["used"]:
+                queue.popleft()
+            if queue:
+                entry = queue.popleft()
+                entry["used"] = True
+                return entry, fuzzy
+        return None, False
+
+    # ------------------------------------------------------------------
+    # 请求
+    # ------------------------------------------------------------------
+    def record_request(self, query: str, request_id: str, duration: float, outcome: str) -> None:
+        """记录一次完整请求（回放命令按这些查询重新运行工作流）"""
+        if self.recording:
+            with self._lock:
+                self.data["requests"].append({"query": query, "request_id": request_id,
+                                              "duration": round(duration, 4), "outcome": outcome})
+
+    # ------------------------------------------------------------------
+    # 模型调用
+    # ------------------------------------------------------------------
+    def wrap_model(self, model: Optional[BaseChatModel]) -> "CassetteChatModel":
+        """包装聊天模型；回放时不需要真实模型，可以传入 None"""
+        return CassetteChatModel(inner=model, cassette=self)
+
+    @staticmethod
+    def llm_keys(messages: List[BaseMessage], tool_names: List[str]) -> tuple:
+        system = next((str(msg.content) for msg in messages if msg.type == "system"), "")
+        return (_digest({"messages": [_message_key(msg) for msg in messages], "tools": tool_names}),
+                _digest({"system": system, "tools": tool_names}))
+
+    def record_llm(self, messages: List[BaseMessage], tool_names: List[str], message: AIMessage,
+                   started: float, first_chunk: Optional[float], duration: float,
+                   chunks: Optional[List[List[Any]]] = None) -> None:
+        key, role = self.llm_keys(messages, tool_names)
+        with self._lock:
+            self.data["llm"].append({
+                "key": key, "role": role, "started": started,
+                "first_chunk": round(first_chunk, 4) if first_chunk is not None else None,
+                "duration": round(duration, 4),
+                "message": message_to_dict(message),
+                "chunks": chunks,
+            })
+            self.stats["llm_recorded"] += 1
+
+    def replay_llm(self, messages: List[BaseMessage], tool_names: List[str]) -> Dict[str, Any]:
+        key, role = self.llm_keys(messages, tool_names)
+        entry, fuzzy = self._take(self._llm_by_key[key], self._llm_by_role[role])
+        if entry is None:
+            self.stats["misses"] += 1
+            last = str(messages[-1].content)[:80] if messages else ""
+            raise CassetteMiss(f"磁带中没有匹配的模型调用（最后一条消息: {last}）")
+        self.stats["llm_replayed"] += 1
+        self.stats["fuzzy_matches"] += int(fuzzy)
+        return entry
+
+    # ------------------------------------------------------------------
+    # 工具调用
+    # ------------------------------------------------------------------
+    def record_tool_specs(self, server_name: str, tools: List[BaseTool]) -> None:
+        """记录服务的工具 schema，回放时据此重建工具（不需要启动 MCP 服务）"""
+        self.data["tools"][server_name] = [{
+            "name": tool.name,
+            "description": tool.description,
+            "args_schema": tool.args_schema if isinstance(tool.args_schema, dict)
+            else tool.args_schema.model_json_schema(),
+            "response_format": tool.response_format,
+        } for tool in tools]
+
+    def tool_source(self, server_name: str) -> "CassetteToolSource":
+        """回放时代替 MCP 会话池中的服务，get_tools 返回从磁带重建的工具"""
+        if server_name not in self.data["tools"]:
+            raise CassetteMiss(f"磁带中没有 MCP 服务 {server_name} 的工具列表")
+        return CassetteToolSource(self, server_name)
+
+    def wrap_tools(self, tools: List[BaseTool]) -> List[BaseTool]:
+        """录制模式下记录每次工具调用的参数、结果和耗时"""
+
+        def make_coroutine(tool, call_next):
+            async def recorded_call(**arguments):
+                started, start = self._offset(), time.monotonic()
+                entry = {"key": make_tool_key(tool.name, arguments), "tool": tool.name,
+                         "arguments": _jsonable(arguments), "started": started}
+                try:
+                    value = await call_next(**arguments)
+                except Exception as e:
+                    entry["error"] = f"{e.__class__.__name__}: {e}"
+                    raise
+                else:
+                    entry["result"] = _jsonable(value)
+                    return value
+                finally:
+                    # 取消（客户端断开、超时）的调用没有结果，不记录
+                    if "result" in entry or "error" in entry:
+                        entry["duration"] = round(time.monotonic() - start, 4)
+                        with self._lock:
+                            self.data["tool_calls"].append(entry)
+                            self.stats["tool_recorded"] += 1
+
+            return recorded_call
+
+        return [wrap_tool_coroutine(tool, make_coroutine) for tool in tools]
+
+    async def replay_tool(self, tool_name: str, arguments: Dict[str, Any],
+                          response_format: str = "content") -> Any:
+        key = make_tool_key(tool_name, arguments)
+        entry, fuzzy = self._take(self._tools_by_key[key], self._tools_by_name[tool_name])
+        if entry is None:
+            self.stats["misses"] += 1
+            raise ToolException(f"磁带中没有工具 {tool_name} 的调用记录（参数: {arguments}）")
+        self.stats["tool_replayed"] += 1
+        self.stats["fuzzy_matches"] += int(fuzzy)
+        await self._sleep(entry["duration"])
+        if "error" in entry:
+            raise ToolException(entry["error"])
+        result = entry["result"]
+        return tuple(result) if response_format == "content_and_artifact" else result
+
+
+class CassetteToolSource:
+    """回放模式下与 MCP 服务端 get_tools 接口一致的工具来源"""
+
+    def __init__(self, cassette: Cassette, server_name: str):
+        self.cassette = cassette
+        self.server_name = server_name
+
+    async def get_tools(self) -> List[BaseTool]:
+        tools = []
+        for spec in self.cassette.data["tools"][self.server_name]:
+            async def replayed_call(_spec=spec, **arguments):
+                return await self.cassette.replay_tool(_spec["name"], arguments, _spec["response_format"])
+
+            tools.append(StructuredTool(
+                name=spec["name"],
+                description=spec["description"],
+                args_schema=spec["args_schema"],
+                coroutine=replayed_call,
+                response_format=spec["response_format"],
+            ))
+        return tools
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    录制 / 回放模型调用的聊天模型包装
+
+    bind_tools 交给内层模型处理，绑定参数（如 ChatTongyi 的 tools）在调用内层模型时传入
+    """
+
+    inner: Optional[Any] = None
+    cassette: Any = None
+    bind_kwargs: Dict[str, Any] = {}
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        inner_type = getattr(self.inner, '_llm_type', 'replay')
+        return f"cassette-{inner_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        params = dict(getattr(self.inner, '_identifying_params', {}) or {})
+        params.setdefault("model_name", f"cassette:{os.path.basename(self.cassette.path)}")
+        return params
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any) -> "CassetteChatModel":
+        names = [getattr(tool, 'name', None) or tool.get("name") for tool in tools]
+        if self.inner is None:
+            return self.model_copy(update={"tool_names": names})
+        bound = self.inner.bind_tools(tools, **kwargs)
+        if isinstance(bound, BaseChatModel):
+            return self.model_copy(update={"inner": bound, "tool_names": names})
+        return self.model_copy(update={"inner": bound.bound, "tool_names": names,
+                                       "bind_kwargs": {**self.bind_kwargs, **bound.kwargs}})
+
+    @staticmethod
+    def _replayed_result(entry: Dict[str, Any]) -> ChatResult:
+        message = messages_from_dict([entry["message"]])[0]
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        # 回放数据都在内存中，同步调用直接查找磁带；录制时调用内层模型的同步接口
+        if self.cassette.replaying:
+            entry = self.cassette.replay_llm(messages, self.tool_names)
+            self.cassette._sleep_sync(entry["duration"])
+            return self._replayed_result(entry)
+
+        started, start = self.cassette._offset(), time.monotonic()
+        result = self.inner._generate(messages, stop=stop, **{**self.bind_kwargs, **kwargs})
+        duration = time.monotonic() - start
+        self.cassette.record_llm(messages, self.tool_names, result.generations[0].message,
+                                 started, None, duration)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.cassette.replaying:
+            entry = self.cassette.replay_llm(messages, self.tool_names)
+            await self.cassette._sleep(entry["duration"])
+            return self._replayed_result(entry)
+
+        started, start = self.cassette._offset(), time.monotonic()
+        result = await self.inner._agenerate(messages, stop=stop, **{**self.bind_kwargs, **kwargs})
+        duration = time.monotonic() - start
+        self.cassette.record_llm(messages, self.tool_names, result.generations[0].message,
+                                 started, None, duration)
+        return result
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.cassette.replaying:
+            async for chunk in self._replay_stream(messages):
+                yield chunk
+            return
+
+        started, start = self.cassette._offset(), time.monotonic()
+        merged, chunks, first_chunk, last = None, [], None, start
+        async for chunk in self.inner._astream(messages, stop=stop, **{**self.bind_kwargs, **kwargs}):
+            now = time.monotonic()
+            if first_chunk is None:
+                first_chunk = now - start
+            if chunk.message.content:
+                chunks.append([round(now - last, 4), chunk.message.content])
+                last = now
+            merged = chunk.message if merged is None else merged + chunk.message
+            yield chunk
+        if merged is not None:
+            self.cassette.record_llm(messages, self.tool_names, message_chunk_to_message(merged),
+                                     started, first_chunk, time.monotonic() - start, chunks)
+
+    async def _replay_stream(self, messages: List[BaseMessage]) -> AsyncIterator[ChatGenerationChunk]:
+        entry = self.cassette.replay_llm(messages, self.tool_names)
+        message = messages_from_dict([entry["message"]])[0]
+        chunks = entry.get("chunks") or []
+        if message.tool_calls or not chunks:
+            # 工具调用：按原始耗时等待后一次性返回
+            await self.cassette._sleep(entry["duration"])
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False),
+                                   "id": call["id"], "index": index}
+                                  for index, call in enumerate(message.tool_calls)],
+                usage_metadata=message.usage_metadata,
+                response_metadata=message.response_metadata,
+            ))
+            return
+
+        for index, (delay, content) in enumerate(chunks):
+            await self.cassette._sleep(delay)
+            last = index == len(chunks) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=content,
+                usage_metadata=message.usage_metadata if last else None,
+            ))
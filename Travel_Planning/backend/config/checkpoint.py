@@ -0,0 +1,140 @@
+# checkpoint.py
+
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+
+class ThreadCheckpointer:
+    """
+    工作流检查点的本地 SQLite 存储
+
+    每个会话（thread_id）的工作流状态在每个节点完成后写入 SQLite：
+    运行中断（MCP 调用失败、进程重启、客户端断开）后用同一个 thread_id 重新提交，可从最后完成的节点继续；
+    追问时新的问题追加到同一会话的消息中，supervisor 可以直接复用之前完成的子任务结果。
+
+    数据库大小有上限：超过 max_age 秒没有更新的会话、以及超出最近 max_threads 个之外的会话定期删除。
+    """
+
+    def __init__(self, file_path: Optional[str] = None, max_threads: int = 1000, max_age: float = 7 * 86400,
+                 expire_interval: float = 600):
+        self.file_path = file_path
+        self.max_threads = max_threads
+        self.max_age = max_age
+        self.expire_interval = expire_interval
+        self.saver: Optional[AsyncSqliteSaver] = None
+        self._last_expire = 0.0
+        self.expired_threads = 0
+
+    @classmethod
+    def from_env(cls) -> "ThreadCheckpointer":
+        """
+        CHECKPOINT_DB 为 SQLite 文件路径（默认 checkpoints.sqlite），设为空则不保存检查点（每次请求都是单轮）；
+        CHECKPOINT_MAX_THREADS（默认 1000）与 CHECKPOINT_MAX_AGE_HOURS（默认 168）限制保留的会话，设为 0 不限制
+        """
+        return cls(os.environ.get("CHECKPOINT_DB", "checkpoints.sqlite") or None,
+                   int(os.environ.get("CHECKPOINT_MAX_THREADS", "1000") or 0),
+                   float(os.environ.get("CHECKPOINT_MAX_AGE_HOURS", "168") or 0) * 3600)
+
+    @property
+    def enabled(self) -> bool:
+        return self.file_path is not None
+
+    async def open(self) -> Optional[AsyncSqliteSaver]:
+        """打开数据库并建表（重复调用返回同一个 saver），未启用时返回 None"""
+        if not self.enabled:
+            return None
+        if self.saver is None:
+            # 连接的工作线程需要由 close 结束（ASGI 的 lifespan 关闭阶段与 BackgroundAgentRuntime.close 会调用）
+            conn = await aiosqlite.connect(self.file_path)
+            saver = AsyncSqliteSaver(conn)
+            try:
+                await saver.setup()
+            except BaseException:
+                await conn.close()
+                raise
+            self.saver = saver
+            await self.expire()
+        return self.saver
+
+    async def prune(self, thread_id: str) -> None:
+        """
+        只保留会话最新的检查点：多轮会话和中断后继续只需要最新的状态，
+        每个节点一份的历史检查点（各自包含完整的消息列表）不再保留
+        """
+        if self.saver is None:
+            return
+        async with self.saver.lock:
+            await self.saver.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id < "
+                "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?)", (thread_id, thread_id))
+            await self.saver.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id < "
+                "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?)", (thread_id, thread_id))
+            await self.saver.conn.commit()
+        if time.monotonic() - self._last_expire >= self.expire_interval:
+            await self.expire()
+
+    async def expire(self) -> int:
+        """
+        删除过期与超出数量上限的会话，返回删除的会话数
+
+        检查点 ID 是按时间递增的 UUIDv6，会话最新检查点的 ID 即最后更新时间，不需要额外记录。
+        """
+        self._last_expire = time.monotonic()
+        if self.saver is None or (self.max_age <= 0 and self.max_threads <= 0):
+            return 0
+        conditions, params = [], []
+        if self.max_age > 0:
+            conditions.append("last_id < ?")
+            params.append(_checkpoint_id_at(time.time() - self.max_age))
+        if self.max_threads > 0:
+            conditions.append("thread_id NOT IN (SELECT thread_id FROM latest ORDER BY last_id DESC LIMIT ?)")
+            params.append(self.max_threads)
+        async with self.saver.lock:
+            async with self.saver.conn.execute(
+                    "WITH latest AS (SELECT thread_id, MAX(checkpoint_id) AS last_id FROM checkpoints "
+                    f"GROUP BY thread_id) SELECT thread_id FROM latest WHERE {' OR '.join(conditions)}",
+                    params) as cursor:
+                thread_ids = [row[0] for row in await cursor.fetchall()]
+            for table in ("writes", "checkpoints"):
+                await self.saver.conn.executemany(
+                    f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+            await self.saver.conn.commit()
+        if thread_ids:
+            self.expired_threads += len(thread_ids)
+            print(f"已删除 {len(thread_ids)} 个过期的会话检查点")
+        return len(thread_ids)
+
+    async def delete(self, thread_id: str) -> None:
+        """删除会话的全部检查点（例如用户清空对话）"""
+        if self.saver is not None:
+            await self.saver.adelete_thread(thread_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        """检查点统计：数据库文件、会话数与检查点数"""
+        result = {"enabled": self.enabled, "file": self.file_path, "threads": 0, "checkpoints": 0,
+                  "max_threads": self.max_threads, "max_age_hours": self.max_age / 3600,
+                  "expired_threads": self.expired_threads}
+        if self.saver is None:
+            return result
+        async with self.saver.conn.execute(
+                "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints") as cursor:
+            result["threads"], result["checkpoints"] = await cursor.fetchone()
+        return result
+
+    async def close(self) -> None:
+        """关闭数据库连接并结束其工作线程"""
+        if self.saver is not None:
+            await self.saver.conn.close()
+            self.saver = None
+
+
+def _checkpoint_id_at(timestamp: float) -> str:
+    """给定时间对应的最小检查点 ID（UUIDv6 的时间字段在前，字符串顺序即时间顺序）"""
+    # UUID 时间戳：自 1582-10-15 起的 100 纳秒数
+    ticks = int(timestamp * 10_000_000) + 0x01B21DD213814000
+    return f"{ticks >> 28:08x}-{(ticks >> 12) & 0xFFFF:04x}-6{ticks & 0xFFF:03x}-0000-000000000000"
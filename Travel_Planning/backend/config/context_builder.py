@@ -0,0 +1,148 @@
+# context_builder.py
+
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from .agents_config import parse_messages
+
+# 专家代理名称及其在上下文中的标题
+EXPERT_LABELS = {
+    "navigation_expert": "导航结果",
+    "ticketing_expert": "票务结果",
+    "door_to_door": "门到门方案",
+}
+
+# supervisor 的路由指令行，对最终回答没有价值
+ROUTING_LINE_PATTERN = re.compile(
+    r'^\s*(final\s+answer|parallel|navigation_expert|ticketing_expert|naviqation expert)\s*$',
+    re.IGNORECASE
+)
+
+# 中日韩文字（大致按 1 个字 1 个 token 估算）
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数（中文约 1 字 1 token，其余约 4 个字符 1 token）
+
+    Args:
+        text: 待估算的文本
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """将文本截断到不超过 max_tokens 个 token（按估算值），截断处加上提示"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    marker = "\n……（内容过长，已截断）"
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle] + marker) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + marker
+
+
+def strip_routing_lines(content: str) -> str:
+    """去掉 supervisor 路由指令行和多余空行"""
+    lines = [line for line in content.splitlines() if not ROUTING_LINE_PATTERN.match(line)]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def collect_results(messages: List[Any]) -> List[Tuple[str, str]]:
+    """
+    从消息列表中提取与最终回答相关的专家结果（去重，丢弃元数据和路由信息）
+
+    没有任何专家结果时（例如 supervisor 直接结束），退回到 supervisor 的非路由内容。
+
+    Returns:
+        [(标题, 内容), ...]
+    """
+    results = []
+    seen = set()
+    for msg in messages:
+        name = getattr(msg, 'name', None)
+        if msg.__class__.__name__ != 'AIMessage' or name not in EXPERT_LABELS:
+            continue
+        content = strip_routing_lines(str(getattr(msg, 'content', '')))
+        if content and content not in seen:
+            seen.add(content)
+            results.append((EXPERT_LABELS[name], content))
+
+    if not results:
+        for msg in messages:
+            if msg.__class__.__name__ == 'AIMessage' and getattr(msg, 'name', None) == 'supervisor':
+                content = strip_routing_lines(str(getattr(msg, 'content', '')))
+                if content and content not in seen:
+                    seen.add(content)
+                    results.append(("规划说明", content))
+    return results
+
+
+def fit_sections_to_budget(sections: List[Tuple[str, str]], token_budget: int) -> List[Tuple[str, str]]:
+    """
+    按 token 预算裁剪各段内容：预算在各段之间平均分配，
+    用不完的预算分给更长的段落，只截断超出分配额的段落
+    """
+    sizes = [estimate_tokens(f"【{title}】\n{content}") for title, content in sections]
+    if sum(sizes) <= token_budget:
+        return sections
+
+    allotments = [0] * len(sections)
+    remaining_budget = token_budget
+    pending = sorted(range(len(sections)), key=lambda i: sizes[i])
+    while pending:
+        share = remaining_budget // len(pending)
+        index = pending.pop(0)
+        allotments[index] = min(sizes[index], share)
+        remaining_budget -= allotments[index]
+
+    fitted = []
+    for (title, content), size, allotment in zip(sections, sizes, allotments):
+        if size > allotment:
+            content = truncate_to_tokens(content, max(allotment - estimate_tokens(f"【{title}】\n"), 0))
+        fitted.append((title, content))
+    return fitted
+
+
+async def build_compact_context(messages: List[Any], token_budget: int = None,
+                                measure_savings: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """
+    构建最终回答所需的精简上下文，替代 parse_messages 的完整消息转储
+
+    Args:
+        messages: 工作流运行结束后的消息列表
+        token_budget: 上下文 token 预算，默认读取环境变量 FINAL_CONTEXT_TOKEN_BUDGET（6000）
+        measure_savings: 是否同时计算 parse_messages 的 token 数，用于统计节省量
+
+    Returns:
+        tuple: (上下文字符串, 统计信息)
+    """
+    if token_budget is None:
+        token_budget = int(os.environ.get("FINAL_CONTEXT_TOKEN_BUDGET", "6000"))
+
+    sections = fit_sections_to_budget(collect_results(messages), token_budget)
+    context = "\n\n".join(f"【{title}】\n{content}" for title, content in sections)
+
+    stats = {
+        "sections": len(sections),
+        "tokens": estimate_tokens(context),
+        "token_budget": token_budget,
+    }
+    if measure_savings:
+        baseline_tokens = estimate_tokens(await parse_messages(messages))
+        stats["baseline_tokens"] = baseline_tokens
+        stats["saved_tokens"] = baseline_tokens - stats["tokens"]
+        stats["saved_ratio"] = round(stats["saved_tokens"] / baseline_tokens, 4) if baseline_tokens else 0.0
+
+    return context, stats
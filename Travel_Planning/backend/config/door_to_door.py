@@ -0,0 +1,466 @@
+# door_to_door.py
+
+import asyncio
+import datetime
+import functools
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import AIMessage
+from langchain_core.tools import ToolException
+from mcp.shared.exceptions import McpError
+from prometheus_client import Counter
+
+from .agents_config import get_request_budget
+from .mcp_pool import SESSION_ERRORS
+from .place_index import normalize_city
+from .query_parser import ParsedQuery, parse_query
+from .station_catalog import StationCatalog, parse_location
+from .ticket_parser import TrainLeg, parse_tickets
+from .transfer_planner import HUB_CITIES, TransferPlanner, join_transfers
+
+PLANS = Counter("travel_door_to_door_plans_total", "门到门方案规划的次数", ["result"])
+
+# 接驳方式 -> maps_distance 的测量类型（1 驾车，3 步行）；公交逐站调用公交路径规划
+DISTANCE_TYPES = {"driving": "1", "walking": "3"}
+ACCESS_LABELS = {"driving": "驾车", "walking": "步行", "transit": "公交 / 地铁"}
+
+OBJECTIVE_LABELS = {"arrival": "最早到达", "transfers": "换乘最少", "price": "票价最低"}
+# 查询中的偏好关键词 -> 排序目标
+OBJECTIVE_KEYWORDS = [
+    ("price", ("便宜", "省钱", "票价最低", "最低价")),
+    ("transfers", ("少换乘", "不换乘", "换乘少", "直达")),
+]
+
+ToolCaller = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+class DoorToDoorError(Exception):
+    """缺少规划所需的数据（地点无法解析、没有可用车次等），交给 supervisor 按常规流程处理"""
+
+
+@dataclass
+class AccessLeg:
+    """车站与出发地 / 目的地之间的接驳：耗时（分钟）、距离（公里）与方式"""
+    minutes: float
+    distance_km: Optional[float]
+    mode: str  # driving / walking / transit / none（出发地或目的地就是城市，不计接驳）
+
+
+@dataclass
+class DoorToDoorPlan:
+    """一个门到门方案：时间为相对出行日期 0 点的分钟数"""
+    leave_at: float
+    arrive_at: float
+    legs: List[TrainLeg]
+    first_mile: AccessLeg
+    last_mile: AccessLeg
+    price: float
+
+    @property
+    def transfers(self) -> int:
+        return len(self.legs) - 1
+
+
+def _clock(minutes: float) -> str:
+    day, minute = divmod(int(round(minutes)), 1440)
+    return f"{minute // 60:02d}:{minute % 60:02d}" + (f"(+{day}天)" if day > 0 else "")
+
+
+def _duration(minutes: float) -> str:
+    hours, minute = divmod(int(round(minutes)), 60)
+    return f"{hours}小时{minute}分" if hours else f"{minute}分钟"
+
+
+class DoorToDoorOptimizer:
+    """
+    门到门方案的确定性求解
+
+    车次按出发时间构成时间展开的有向无环图：起点 -> 车次（接驳时间 + 进站预留时间内赶得上的车次）
+    -> 换乘 -> 车次 -> 终点（出站时间 + 接驳时间）。每个车次节点保留 k 个最优标签（换乘次数、票价、出发时间），
+    按出发时间顺序一次遍历即可得到前 k 个方案。
+    """
+
+    def __init__(self, entry_buffer: int = 30, exit_buffer: int = 10, min_same_station: int = 20,
+                 min_cross_station: int = 60, max_wait: int = 360):
+        self.entry_buffer = entry_buffer
+        self.exit_buffer = exit_buffer
+        self.min_same_station = min_same_station
+        self.min_cross_station = min_cross_station
+        self.max_wait = max_wait
+
+    def _label_key(self, objective: str, transfers: int, price: float, leave_at: float) -> Tuple:
+        """车次节点上标签的排序键（节点的时间固定，只比较可累加的代价）"""
+        if objective == "price":
+            return price, transfers, -leave_at
+        return transfers, price, -leave_at
+
+    def _plan_key(self, objective: str, plan: DoorToDoorPlan) -> Tuple:
+        if objective == "price":
+            return plan.price, plan.arrive_at, plan.transfers
+        if objective == "transfers":
+            return plan.transfers, plan.arrive_at, plan.price
+        return plan.arrive_at, plan.transfers, plan.price, -plan.leave_at
+
+    def optimize(self, legs: Sequence[TrainLeg], first_mile: Dict[str, AccessLeg], last_mile: Dict[str, AccessLeg],
+                 earliest: float = 0, objective: str = "arrival", k: int = 3,
+                 hubs: Optional[Sequence[int]] = None) -> List[DoorToDoorPlan]:
+        """
+        Args:
+            legs: 全部车次（直达车次，以及中转时的两段车次）
+            first_mile: 出发站编码 -> 从出发地到该站的接驳
+            last_mile: 到达站编码 -> 从该站到目的地的接驳
+            earliest: 最早出发时间（相对出行日期 0 点的分钟数）
+            objective: arrival（最早到达）/ transfers（换乘最少）/ price（票价最低）
+            k: 返回的方案数
+            hubs: 每个车次所属的中转城市编号（-1 表示不参与换乘），不传时不考虑换乘
+
+        Returns:
+            按 objective 排好序的前 k 个方案
+        """
+        # 没有余票（票价为 nan）的车次买不到，不进入图
+        usable = [index for index, leg in enumerate(legs) if not math.isnan(leg.price)]
+        legs = [legs[index] for index in usable]
+        if hubs is not None:
+            hubs = [hubs[index] for index in usable]
+        if not legs:
+            return []
+
+        # 起点 -> 车次：向量化计算每个车次最晚的出门时间
+        depart = np.fromiter((leg.depart for leg in legs), dtype=np.float64, count=len(legs))
+        arrive = np.fromiter((leg.arrive for leg in legs), dtype=np.float64, count=len(legs))
+        access = np.fromiter((first_mile[leg.from_code].minutes if leg.from_code in first_mile else np.nan
+                              for leg in legs), dtype=np.float64, count=len(legs))
+        leave_at = depart - self.entry_buffer - access
+        boardable = ~np.isnan(leave_at) & (leave_at >= earliest)
+        egress = np.fromiter((last_mile[leg.to_code].minutes if leg.to_code in last_mile else np.nan
+                              for leg in legs), dtype=np.float64, count=len(legs))
+        door_arrival = arrive + self.exit_buffer + egress
+
+        # 换乘边：到达某中转城市的车次 -> 从该城市出发的车次（同站 / 同城换站的最短换乘时间）
+        successors: Dict[int, List[int]] = {}
+        if hubs is not None:
+            transfer_from = [index for index, hub in enumerate(hubs) if hub >= 0 and legs[index].from_code in first_mile]
+            transfer_to = [index for index, hub in enumerate(hubs) if hub >= 0 and legs[index].to_code in last_mile]
+            pairs = join_transfers([legs[index] for index in transfer_from], [hubs[index] for index in transfer_from],
+                                   [legs[index] for index in transfer_to], [hubs[index] for index in transfer_to],
+                                   self.min_same_station, self.min_cross_station, self.max_wait)
+            for i, j in pairs:
+                successors.setdefault(transfer_from[i], []).append(transfer_to[j])
+
+        # 按出发时间顺序遍历（换乘只能接更晚出发的车次，图无环），每个节点保留 k 个最优标签
+        # 标签：(排序键, 出门时间, 换乘次数, 票价, 经过的车次)
+        labels: Dict[int, List[Tuple[Tuple, float, int, float, Tuple[int, ...]]]] = {}
+        for index in np.argsort(depart, kind="stable").tolist():
+            node_labels = labels.setdefault(index, [])
+            if boardable[index]:
+                key = self._label_key(objective, 0, legs[index].price, leave_at[index])
+                node_labels.append((key, float(leave_at[index]), 0, legs[index].price, (index,)))
+            node_labels.sort(key=lambda label: label[0])
+            del node_labels[k:]
+            for successor in successors.get(index, ()):
+                for _, leave, transfers, price, path in node_labels:
+                    total = price + legs[successor].price
+                    labels.setdefault(successor, []).append(
+                        (self._label_key(objective, transfers + 1, total, leave), leave, transfers + 1, total,
+                         path + (successor,)))
+
+        plans = []
+        for index, node_labels in labels.items():
+            if math.isnan(door_arrival[index]):
+                continue
+            for _, leave, _, price, path in node_labels[:k]:
+                plans.append(DoorToDoorPlan(leave, float(door_arrival[index]), [legs[i] for i in path],
+                                            first_mile[legs[path[0]].from_code], last_mile[legs[index].to_code],
+                                            price))
+        plans.sort(key=lambda plan: self._plan_key(objective, plan))
+        return plans[:k]
+
+
+def _route_minutes(content: Optional[str]) -> Optional[Tuple[float, Optional[float]]]:
+    """路径规划结果中第一个方案的 (耗时分钟, 距离公里)"""
+    try:
+        data = json.loads(content or "")
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    route = data.get("route") if isinstance(data.get("route"), dict) else data
+    options = route.get("transits") or route.get("paths") or []
+    if not options or not isinstance(options[0], dict):
+        return None
+    try:
+        minutes = float(options[0].get("duration")) / 60
+    except (TypeError, ValueError):
+        return None
+    try:
+        distance = float(options[0].get("distance")) / 1000
+    except (TypeError, ValueError):
+        distance = None
+    return minutes, distance
+
+
+class DoorToDoorPlanner:
+    """
+    门到门出行规划：出发地 -> 出发站 -> 车次（必要时中转）-> 到达站 -> 目的地
+
+    直接调用导航与票务工具取数（地理编码、批量距离测量、余票），由 DoorToDoorOptimizer 求出前 k 个方案，
+    不经过 supervisor 与专家的 LLM 推理。缺少数据时抛出 DoorToDoorError，工作流交回 supervisor。
+    """
+
+    def __init__(self, top_k: int = 3, optimizer: Optional[DoorToDoorOptimizer] = None,
+                 catalog: Optional[StationCatalog] = None, transfers: Optional[TransferPlanner] = None):
+        self.top_k = top_k
+        self.optimizer = optimizer or DoorToDoorOptimizer()
+        self.catalog = catalog
+        self.transfers = transfers or TransferPlanner(catalog=catalog)
+        self.stats_counts = {"plans": 0, "fallbacks": 0, "tool_calls": 0, "solve_ms": 0.0}
+
+    @classmethod
+    def from_env(cls, catalog: Optional[StationCatalog] = None,
+                 transfers: Optional[TransferPlanner] = None) -> "DoorToDoorPlanner":
+        """
+        DOOR_TO_DOOR_TOP_K 为返回的方案数（默认 3，设为 0 则不走门到门规划）；
+        DOOR_TO_DOOR_ENTRY_BUFFER / DOOR_TO_DOOR_EXIT_BUFFER 为进站预留 / 出站所需的分钟数（默认 30 / 10）；
+        换乘时间规则与中转规划相同
+        """
+        transfers = transfers or TransferPlanner.from_env(catalog)
+        optimizer = DoorToDoorOptimizer(int(os.environ.get("DOOR_TO_DOOR_ENTRY_BUFFER", "30")),
+                                        int(os.environ.get("DOOR_TO_DOOR_EXIT_BUFFER", "10")),
+                                        transfers.min_same_station, transfers.min_cross_station, transfers.max_wait)
+        return cls(int(os.environ.get("DOOR_TO_DOOR_TOP_K", "3") or 0), optimizer, catalog, transfers)
+
+    @property
+    def enabled(self) -> bool:
+        return self.top_k > 0
+
+    async def _call(self, call_tool: ToolCaller, name: str, arguments: Dict[str, Any]) -> Any:
+        """调用工具；工具返回错误（isError）或 MCP 会话断开时转为 DoorToDoorError，由节点交回 supervisor"""
+        self.stats_counts["tool_calls"] += 1
+        try:
+            return await call_tool(name, arguments)
+        except (ToolException, McpError, *SESSION_ERRORS) as e:
+            raise DoorToDoorError(f"工具 {name} 调用失败：{e}") from e
+
+    def _is_city(self, place: str) -> bool:
+        if any(place == city for city, _, _ in HUB_CITIES):
+            return True
+        return self.catalog is not None and self.catalog.city_station(place) is not None
+
+    async def _geocode(self, call_tool: ToolCaller, address: str,
+                       city: Optional[str] = None) -> Tuple[str, Tuple[float, float]]:
+        """地点 -> (所在城市, 坐标)"""
+        arguments = {"address": address}
+        if city:
+            arguments["city"] = city
+        try:
+            results = json.loads(await self._call(call_tool, "maps_geo", arguments) or "").get("results") or []
+        except (ValueError, AttributeError):
+            results = []
+        location = parse_location(results[0].get("location")) if results else None
+        if location is None:
+            raise DoorToDoorError(f"无法确定“{address}”的位置")
+        return normalize_city(results[0].get("city")) or normalize_city(city), location
+
+    async def _endpoint(self, call_tool: ToolCaller, place: str,
+                        city: Optional[str] = None) -> Tuple[str, Optional[Tuple[float, float]]]:
+        """出发地 / 目的地：城市本身不计接驳（坐标为 None），具体地点做地理编码"""
+        if city is None and self._is_city(place):
+            return normalize_city(place), None
+        found_city, location = await self._geocode(call_tool, place, city)
+        if not found_city:
+            raise DoorToDoorError(f"无法确定“{place}”所在的城市")
+        return found_city, location
+
+    async def _station_location(self, call_tool: ToolCaller, leg_name: str, code: str,
+                                city: str) -> Tuple[float, float]:
+        station = self.catalog.stations.get(code) if self.catalog is not None else None
+        if station is not None and station.location is not None:
+            return station.location
+        name = station.name if station is not None else leg_name
+        return (await self._geocode(call_tool, name if name.endswith("站") else f"{name}站", city))[1]
+
+    async def _access(self, call_tool: ToolCaller, point: Optional[Tuple[float, float]],
+                      stations: Dict[str, str], city: str, mode: str,
+                      to_station: bool) -> Dict[str, AccessLeg]:
+        """
+        车站与地点之间的接驳：驾车 / 步行用一次 maps_distance 批量测量所有车站，公交逐站规划路线
+        （并行）；地点就是城市时不计接驳
+        """
+        if point is None:
+            return {code: AccessLeg(0, None, "none") for code in stations}
+        codes = list(stations)
+        locations = await asyncio.gather(*(self._station_location(call_tool, stations[code], code, city)
+                                           for code in codes))
+        place = f"{point[0]:.6f},{point[1]:.6f}"
+        station_points = [f"{lng:.6f},{lat:.6f}" for lng, lat in locations]
+
+        result: Dict[str, AccessLeg] = {}
+        if mode in DISTANCE_TYPES:
+            # 接驳时间按车站到地点测量（两个方向的差别可以忽略）
+            content = await self._call(call_tool, "maps_distance", {
+                "origins": "|".join(station_points), "destination": place, "type": DISTANCE_TYPES[mode]})
+            try:
+                rows = json.loads(content or "").get("results") or []
+            except (ValueError, AttributeError):
+                rows = []
+            for row in rows:
+                try:
+                    index = int(row.get("origin_id")) - 1
+                    result[codes[index]] = AccessLeg(float(row["duration"]) / 60, float(row["distance"]) / 1000, mode)
+                except (TypeError, ValueError, KeyError, IndexError):
+                    continue
+        else:
+            async def transit(station_point: str) -> Optional[Tuple[float, Optional[float]]]:
+                origin, destination = (place, station_point) if to_station else (station_point, place)
+                return _route_minutes(await self._call(call_tool, "maps_direction_transit_integrated", {
+                    "origin": origin, "destination": destination, "city": city, "cityd": city}))
+
+            for code, route in zip(codes, await asyncio.gather(*(transit(point) for point in station_points))):
+                if route is not None:
+                    result[code] = AccessLeg(route[0], route[1], mode)
+        if not result:
+            raise DoorToDoorError("无法获取车站的接驳路线")
+        return result
+
+    async def plan(self, call_tool: ToolCaller, parsed: ParsedQuery,
+                   today: Optional[datetime.date] = None) -> Dict[str, Any]:
+        """
+        规划门到门方案
+
+        Args:
+            call_tool: call_tool(工具名, 参数) 返回工具结果文本（使用带缓存与预算的导航 / 票务工具）
+            parsed: 规则解析的查询（出发地、乘火车到达的城市、最终目的地、日期、出行方式）
+            today: 当前日期，默认取系统日期
+
+        Returns:
+            {"plans": [DoorToDoorPlan, ...], "objective": ..., "origin": ..., "destination": ..., ...}
+        """
+        if not parsed.origin or not parsed.destination:
+            raise DoorToDoorError("缺少出发地或目的地")
+        today = today or datetime.date.today()
+        date = parsed.date or today.isoformat()
+        destination = parsed.final_destination or parsed.destination
+        mode = parsed.transport_mode if parsed.transport_mode in ACCESS_LABELS else "driving"
+        objective = next((objective for objective, keywords in OBJECTIVE_KEYWORDS
+                          if any(keyword in parsed.raw for keyword in keywords)), "arrival")
+
+        # 1. 出发地与目的地所在的城市和坐标（最终目的地在乘火车到达的城市中查找）
+        origin_task = self._endpoint(call_tool, parsed.origin)
+        if parsed.final_destination:
+            destination_city = normalize_city(parsed.destination)
+            destination_task = self._endpoint(call_tool, parsed.final_destination, destination_city)
+        else:
+            destination_task = self._endpoint(call_tool, parsed.destination)
+        (origin_city, origin_point), (destination_city, destination_point) = await asyncio.gather(
+            origin_task, destination_task)
+        if origin_city == destination_city:
+            raise DoorToDoorError("出发地与目的地在同一城市，不需要乘火车")
+
+        # 2. 两城之间的车次（按城市编码查询包含城市内所有车站），没有直达时用中转规划的两段车次
+        # 中转规划中的工具调用同样经过 _call，错误统一转为 DoorToDoorError
+        guarded_call = functools.partial(self._call, call_tool)
+        codes = await self.transfers.resolve_codes(guarded_call, [origin_city, destination_city])
+        if origin_city not in codes or destination_city not in codes:
+            raise DoorToDoorError("无法确定出发或到达城市的车站编码")
+        train_filter = "".join(parsed.train_types)
+        arguments = {"date": date, "fromStation": codes[origin_city], "toStation": codes[destination_city]}
+        if train_filter:
+            arguments["trainFilterFlags"] = train_filter
+        # trainFilterFlags 只能指定要查的类型，用户排除的类型（“不要动车”）在结果中按车次字头去掉
+        excluded = tuple(parsed.excluded_train_types)
+        legs = [leg for leg in parse_tickets(await self._call(call_tool, "get-tickets", arguments))
+                if not leg.train_no.startswith(excluded)]
+        hubs = None
+        if not any(not math.isnan(leg.price) for leg in legs):
+            transfer_legs = await self.transfers.collect_legs(guarded_call, date, origin_city, destination_city,
+                                                              train_filter)
+            transfer_legs.exclude(excluded)
+            legs = transfer_legs.first + transfer_legs.second
+            hubs = transfer_legs.first_hubs + transfer_legs.second_hubs
+        if not legs:
+            raise DoorToDoorError(f"{date} {origin_city}到{destination_city}没有查到车次")
+
+        # 3. 出发站 / 到达站的接驳（只测量车次实际使用的车站）
+        if hubs is None:
+            departure_stations = {leg.from_code: leg.from_name for leg in legs}
+            arrival_stations = {leg.to_code: leg.to_name for leg in legs}
+        else:
+            departure_stations = {leg.from_code: leg.from_name for leg in transfer_legs.first}
+            arrival_stations = {leg.to_code: leg.to_name for leg in transfer_legs.second}
+        first_mile, last_mile = await asyncio.gather(
+            self._access(call_tool, origin_point, departure_stations, origin_city, mode, True),
+            self._access(call_tool, destination_point, arrival_stations, destination_city, mode, False))
+
+        # 4. 求解：出行日期是今天时只考虑现在之后出门的方案
+        earliest = 0.0
+        if date == today.isoformat():
+            now = datetime.datetime.now()
+            earliest = now.hour * 60 + now.minute
+        start = time.perf_counter()
+        plans = self.optimizer.optimize(legs, first_mile, last_mile, earliest, objective, self.top_k, hubs)
+        self.stats_counts["solve_ms"] += (time.perf_counter() - start) * 1000
+        if not plans:
+            raise DoorToDoorError("没有赶得上的车次或所有车次均无余票")
+        return {"plans": plans, "objective": objective, "mode": mode, "date": date,
+                "origin": parsed.origin, "destination": destination}
+
+    def format_plans(self, result: Dict[str, Any]) -> str:
+        """把方案整理为最终回答使用的文本"""
+        optimizer = self.optimizer
+        lines = [f"{result['date']} {result['origin']}到{result['destination']}的门到门方案"
+                 f"（按{OBJECTIVE_LABELS[result['objective']]}排序，进站预留 {optimizer.entry_buffer} 分钟，"
+                 f"出站 {optimizer.exit_buffer} 分钟）："]
+        for rank, plan in enumerate(result["plans"], 1):
+            first, last = plan.legs[0], plan.legs[-1]
+            parts = []
+            if plan.first_mile.mode == "none":
+                parts.append(f"{_clock(plan.leave_at)} 前到达{first.from_name}")
+            else:
+                distance = f"（{plan.first_mile.distance_km:.1f} 公里）" if plan.first_mile.distance_km else ""
+                parts.append(f"{_clock(plan.leave_at)} 出发，{ACCESS_LABELS[plan.first_mile.mode]}约 "
+                             f"{plan.first_mile.minutes:.0f} 分钟{distance}到{first.from_name}")
+            for index, leg in enumerate(plan.legs):
+                if index:
+                    parts.append(f"在{leg.from_name}换乘（等候 {leg.depart - plan.legs[index - 1].arrive} 分钟）")
+                parts.append(f"乘 {leg.train_no} {_clock(leg.depart)} {leg.from_name} → {_clock(leg.arrive)} "
+                             f"{leg.to_name}（{leg.seats}）")
+            if plan.last_mile.mode != "none":
+                parts.append(f"出站后{ACCESS_LABELS[plan.last_mile.mode]}约 {plan.last_mile.minutes:.0f} 分钟"
+                             f"到{result['destination']}")
+            lines.append(f"方案{rank}：" + "；".join(parts) +
+                         f"；预计 {_clock(plan.arrive_at)} 到达，全程 {_duration(plan.arrive_at - plan.leave_at)}，"
+                         f"换乘 {plan.transfers} 次，车票最低 {plan.price:g} 元。")
+        return "\n".join(lines)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self.stats_counts, "solve_ms": round(self.stats_counts["solve_ms"], 3)}
+
+
+async def door_to_door_node(state: Dict[str, Any], planner: DoorToDoorPlanner, call_tool: ToolCaller,
+                            config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    门到门规划节点：按规则解析的查询直接调用工具取数并求解，结果作为专家结果进入最终回答；
+    规划失败时返回错误信息，expert_router 交回 supervisor 按常规流程处理
+    """
+    query = next((msg.content for msg in reversed(state["messages"])
+                  if msg.__class__.__name__ == 'HumanMessage'), "")
+    budget = get_request_budget(config)
+    timeout = budget.node_timeout() if budget is not None else None
+    try:
+        result = await asyncio.wait_for(planner.plan(call_tool, parse_query(str(query))), timeout)
+        content = planner.format_plans(result)
+        planner.stats_counts["plans"] += 1
+        PLANS.labels("planned").inc()
+    except (DoorToDoorError, asyncio.TimeoutError) as e:
+        reason = str(e) if isinstance(e, DoorToDoorError) else "请求时间预算已用尽"
+        content = f"[错误] 门到门规划无法完成：{reason}"
+        planner.stats_counts["fallbacks"] += 1
+        PLANS.labels("fallback").inc()
+        print(f"门到门规划失败，交给 supervisor: {reason}")
+    return {"messages": [AIMessage(content=content, name="door_to_door")], "sender": ["door_to_door"]}
@@ -0,0 +1,553 @@
+# mcp_pool.py
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import anyio
+from mcp import ClientSession, types
+from mcp.shared.exceptions import McpError
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.sessions import create_session
+from langgraph.config import get_config
+from prometheus_client import Counter, Gauge, Histogram
+
+from .agents_config import load_single_mcp_config
+
+QUEUE_SECONDS = Histogram("travel_mcp_queue_seconds", "MCP 工具调用等待并发名额的时间（秒）", ["server"],
+                          buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+IN_FLIGHT = Gauge("travel_mcp_in_flight", "正在进行的 MCP 请求数", ["server"])
+QUEUED_CALLS = Counter("travel_mcp_queued_calls_total", "需要排队等待并发名额的 MCP 调用次数", ["server"])
+
+# servers_config.json 中需要常驻的 MCP 服务
+MCP_SERVER_NAMES = ("amap-maps", "12306-mcp")
+
+# 当前任务最近一次发出的 tools/call 请求的 JSON-RPC id，调用被取消时用于通知服务端放弃该请求
+_CALL_REQUEST_ID: ContextVar[Optional[int]] = ContextVar("mcp_call_request_id", default=None)
+
+
+def parse_server_limits(value: str) -> Dict[str, int]:
+    """解析每个服务的并发上限：amap-maps=16,12306-mcp=4"""
+    limits = {}
+    for item in (value or "").split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() and limit.strip().isdigit():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+def track_call_request_ids(session: ClientSession) -> None:
+    """
+    包装会话的 send_request，记录 tools/call 请求分配到的 JSON-RPC id（MCP SDK 没有公开这个 id）
+
+    依赖 mcp 1.10.1 的实现：send_request 在第一次挂起之前从 _request_id 分配本次请求的 id，
+    读取与分配之间不会有其他请求插入。升级 mcp 前需确认这一点（requirements 中固定了版本）。
+    """
+    send_request = session.send_request
+
+    async def tracked_send_request(request, *args, **kwargs):
+        if isinstance(request.root, types.CallToolRequest):
+            _CALL_REQUEST_ID.set(session._request_id)
+        return await send_request(request, *args, **kwargs)
+
+    session.send_request = tracked_send_request
+
+
+def convert_call_tool_result(result: types.CallToolResult) -> Tuple[Union[str, List[str]], Optional[List[Any]]]:
+    """
+    把 MCP 的 CallToolResult 转为 content_and_artifact 格式的工具返回值：
+    文本内容作为工具消息内容（单条时为字符串），其他内容（图片、资源等）作为 artifact；
+    服务端标记 isError 时抛出 ToolException（与 langchain-mcp-adapters 转换的工具行为一致）
+    """
+    texts = [content.text for content in result.content if isinstance(content, types.TextContent)]
+    non_text = [content for content in result.content if not isinstance(content, types.TextContent)]
+    content: Union[str, List[str]] = texts[0] if len(texts) == 1 else (texts or "")
+    if result.isError:
+        raise ToolException(content)
+    return content, non_text or None
+
+
+def current_request_key() -> Any:
+    """公平排队时区分请求：图运行中按会话 ID（thread_id），不在图的运行中时（例如后台刷新）按当前任务"""
+    try:
+        configurable = get_config().get("configurable") or {}
+    except RuntimeError:
+        configurable = {}
+    return configurable.get("thread_id") or id(asyncio.current_task())
+
+
+class FairLimiter:
+    """
+    按请求轮转放行的并发限制
+
+    同时进行的调用数不超过 limit；名额用完后，排队的调用按请求轮流放行，
+    一个请求的大量并行调用不会让其他请求一直等待。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._queues: "OrderedDict[Any, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, key: Any) -> bool:
+        """获取一个名额，返回是否经过了排队；排队中被取消时不占用名额"""
+        if self.active < self.limit and not self._queues:
+            self.active += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经放行但调用方随即被取消：把名额让给下一个
+                self.release()
+            else:
+                queue = self._queues.get(key)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._queues[key]
+            raise
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        while self.active < self.limit and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            # 放行后该请求排到队尾，下一个名额给其他请求
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+
+# 会话断开时可以安全重试的异常类型
+SESSION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    BrokenPipeError,
+    ConnectionError,
+)
+
+
+class PooledSession:
+    """
+    一个常驻的 MCP 会话
+
+    create_session 返回的上下文必须在同一个任务中进入和退出，
+    因此由一个后台任务持有会话，直到收到关闭信号。
+    同一会话上可以同时进行多个 JSON-RPC 请求（按请求 id 匹配响应），in_flight 记录进行中的请求数。
+    """
+
+    def __init__(self, server_name: str, connection: Dict[str, Any], index: int):
+        self.server_name = server_name
+        self.connection = connection
+        self.index = index
+        self.session = None
+        self.server_info: Optional[types.Implementation] = None  # initialize 返回的服务名称与版本
+        self.error: Optional[BaseException] = None
+        self.restarts = 0
+        self.generation = 0  # 每次启动加一，用于判断会话是否已被其他调用重启
+        self.in_flight = 0
+        self._restart_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float) -> None:
+        """启动会话（会拉起 MCP 服务子进程），直到 initialize 完成"""
+        self.error = None
+        self.generation += 1
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(),
+                                         name=f"mcp-session-{self.server_name}-{self.index}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise TimeoutError(f"MCP 服务 {self.server_name} 会话启动超时（{timeout}s）")
+        if self.error is not None:
+            raise RuntimeError(f"MCP 服务 {self.server_name} 会话启动失败: {self.error}") from self.error
+
+    async def _run(self) -> None:
+        try:
+            async with create_session(self.connection) as session:
+                track_call_request_ids(session)
+                result = await session.initialize()
+                self.server_info = result.serverInfo
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def ping(self, timeout: float) -> bool:
+        """健康检查：发送 MCP ping 请求"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self, timeout: float = 5) -> None:
+        """关闭会话并等待后台任务退出，超时则强制取消"""
+        self._closing.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+        self._task = None
+        self.session = None
+
+    async def restart(self, timeout: float) -> None:
+        await self.close()
+        self.restarts += 1
+        await self.start(timeout)
+
+    async def ensure_alive(self, timeout: float, generation: Optional[int] = None) -> None:
+        """
+        会话失效时重启。多个并发调用同时发现同一会话失效时只重启一次：
+        generation 为调用出错时的会话代数，会话已被其他调用重启过则不再重启
+        """
+        async with self._restart_lock:
+            if self.alive and (generation is None or generation != self.generation):
+                return
+            await self.restart(timeout)
+
+
+class PooledServer:
+    """
+    连接池中单个 MCP 服务的视图
+
+    提供与 MultiServerMCPClient 相同的 get_tools() 接口，可直接交给 list_and_return_tools。
+    """
+
+    def __init__(self, pool: "MCPSessionPool", server_name: str):
+        self.pool = pool
+        self.server_name = server_name
+
+    async def get_tools(self) -> List[BaseTool]:
+        return await self.pool.get_tools(self.server_name)
+
+
+class MCPSessionPool:
+    """
+    进程内共享的 MCP 会话池
+
+    - 启动时为每个 MCP 服务建立 size 个常驻 stdio 会话（只付一次 npx 冷启动开销）
+    - 定期 ping 空闲会话，失效的会话自动重启
+    - 每个会话上同时进行最多 max_in_flight 个请求（JSON-RPC 按 id 多路复用），工具调用分配到负载最低的会话；
+      专家一次发起的多个工具调用、不同用户的请求都可以并行执行
+    - 每个服务同时进行的调用数不超过 server_limits 中的上限，超出的调用按请求轮流排队
+    """
+
+    def __init__(self, connections: Dict[str, Dict[str, Any]], size: int = 2,
+                 health_check_interval: float = 30, start_timeout: float = 60,
+                 ping_timeout: float = 5, max_in_flight: int = 8,
+                 server_limits: Optional[Dict[str, int]] = None):
+        self.connections = connections
+        self.size = max(1, size)
+        self.max_in_flight = max(1, max_in_flight)
+        # 每个服务的并发上限，默认（也最多）为全部会话的容量
+        capacity = self.size * self.max_in_flight
+        self.server_limits = {name: min(max(1, (server_limits or {}).get(name, capacity)), capacity)
+                              for name in connections}
+        self.health_check_interval = health_check_interval
+        self.start_timeout = start_timeout
+        self.ping_timeout = ping_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sessions: Dict[str, List[PooledSession]] = {}
+        self._limiters: Dict[str, FairLimiter] = {}
+        self._tools: Dict[str, List[BaseTool]] = {}
+        self._start_lock = asyncio.Lock()
+        self._started = False
+        self._health_task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {"leases": 0, "queued": 0, "lease_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                   "peak_in_flight": 0, "retries": 0, "cancelled_calls": 0}
+            for name in connections
+        }
+
+    async def start(self) -> None:
+        """并行启动所有 MCP 服务的会话，重复调用只会启动一次"""
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            self.loop = asyncio.get_running_loop()
+            start_tasks = []
+            for server_name, connection in self.connections.items():
+                self._sessions[server_name] = [
+                    PooledSession(server_name, connection, i) for i in range(self.size)
+                ]
+                self._limiters[server_name] = FairLimiter(self.server_limits[server_name])
+                for pooled in self._sessions[server_name]:
+                    start_tasks.append(pooled.start(self.start_timeout))
+
+            results = await asyncio.gather(*start_tasks, return_exceptions=True)
+            for server_name, sessions in self._sessions.items():
+                # 启动失败的会话保留在池中，分配到该会话时会尝试重启
+                if not any(pooled.alive for pooled in sessions):
+                    errors = [r for r in results if isinstance(r, BaseException)]
+                    # 其他服务已启动的会话和子进程不再使用，关闭后清空，下次 start() 重新启动
+                    await self._close_sessions()
+                    raise RuntimeError(f"MCP 服务 {server_name} 没有可用会话: {errors[:1]}")
+
+            self._health_task = asyncio.create_task(self._health_check_loop(), name="mcp-pool-health")
+            self._started = True
+            print(f"MCP 会话池已启动：{', '.join(self.connections)}，每个服务 {self.size} 个会话，"
+                  f"每个会话最多同时 {self.max_in_flight} 个请求")
+
+    def _pick(self, server_name: str) -> PooledSession:
+        """负载最低的会话，优先选择存活的会话"""
+        return min(self._sessions[server_name],
+                   key=lambda pooled: (not pooled.alive, pooled.in_flight >= self.max_in_flight, pooled.in_flight))
+
+    @asynccontextmanager
+    async def lease(self, server_name: str):
+        """
+        在负载最低的会话上占用一个请求名额，使用完毕后自动归还；
+        服务的并发调用数达到上限时按请求轮流排队
+        """
+        if server_name not in self.connections:
+            raise ValueError(
+                f"Couldn't find a server with name '{server_name}', expected one of '{list(self.connections)}'"
+            )
+        await self.start()
+
+        limiter = self._limiters[server_name]
+        stats = self._stats[server_name]
+        wait_start = time.monotonic()
+        queued = await limiter.acquire(current_request_key())
+        waited = time.monotonic() - wait_start
+        QUEUE_SECONDS.labels(server_name).observe(waited)
+        stats["leases"] += 1
+        stats["lease_wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        if queued:
+            stats["queued"] += 1
+            QUEUED_CALLS.labels(server_name).inc()
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], limiter.active)
+        IN_FLIGHT.labels(server_name).inc()
+        pooled = self._pick(server_name)
+        pooled.in_flight += 1
+        try:
+            if not pooled.alive:
+                await pooled.ensure_alive(self.start_timeout)
+            yield pooled
+        finally:
+            pooled.in_flight -= 1
+            IN_FLIGHT.labels(server_name).dec()
+            limiter.release()
+
+    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any]):
+        """租用会话调用工具；会话断开时重启并重试一次"""
+        for attempt in range(2):
+            async with self.lease(server_name) as pooled:
+                generation = pooled.generation
+                _CALL_REQUEST_ID.set(None)
+                try:
+                    return await pooled.session.call_tool(tool_name, arguments)
+                except asyncio.CancelledError:
+                    self._stats[server_name]["cancelled_calls"] += 1
+                    request_id = _CALL_REQUEST_ID.get()
+                    if request_id is not None:
+                        await self._notify_cancelled(pooled, request_id)
+                    raise
+                except (*SESSION_ERRORS, McpError) as e:
+                    # 服务进程退出时，会话上所有进行中的请求都以 CONNECTION_CLOSED 结束，同样重启并重试
+                    if attempt or (isinstance(e, McpError) and e.error.code != types.CONNECTION_CLOSED):
+                        raise
+                    self._stats[server_name]["retries"] += 1
+                    await pooled.ensure_alive(self.start_timeout, generation)
+
+    async def _notify_cancelled(self, pooled: PooledSession, request_id: int) -> None:
+        """
+        通知 MCP 服务端放弃已取消的请求（notifications/cancelled），避免继续占用上游配额；
+        服务端稍后返回的响应会被会话当作未知请求丢弃，会话仍可复用
+        """
+        notification = types.ClientNotification(types.CancelledNotification(
+            method="notifications/cancelled",
+            params=types.CancelledNotificationParams(requestId=request_id, reason="client disconnected"),
+        ))
+        try:
+            await asyncio.wait_for(asyncio.shield(pooled.session.send_notification(notification)), 1)
+        except BaseException:
+            pass
+
+    async def get_tools(self, server_name: str) -> List[BaseTool]:
+        """获取指定服务的工具列表，工具调用会通过会话池执行（结果按服务缓存）"""
+        if server_name in self._tools:
+            return self._tools[server_name]
+        return self.load_tools(server_name, await self.list_mcp_tools(server_name))
+
+    async def list_mcp_tools(self, server_name: str) -> List[types.Tool]:
+        """向 MCP 服务查询当前的工具定义（不使用缓存，会话池未启动时先启动）"""
+        async with self.lease(server_name) as pooled:
+            mcp_tools = []
+            cursor = None
+            while True:
+                page = await pooled.session.list_tools(cursor=cursor)
+                mcp_tools.extend(page.tools or [])
+                cursor = page.nextCursor
+                if cursor is None:
+                    break
+        return mcp_tools
+
+    def load_tools(self, server_name: str, mcp_tools: List[types.Tool]) -> List[BaseTool]:
+        """
+        用给定的工具定义（例如磁盘上的工具目录快照）生成工具，替换该服务缓存的工具列表；
+        不需要会话池已启动，首次调用工具时才启动
+        """
+        self._tools[server_name] = [self._convert_tool(server_name, tool) for tool in mcp_tools]
+        return self._tools[server_name]
+
+    def server_info(self, server_name: str) -> Optional[types.Implementation]:
+        """已建立的会话在 initialize 时报告的服务名称与版本"""
+        for pooled in self._sessions.get(server_name, []):
+            if pooled.server_info is not None:
+                return pooled.server_info
+        return None
+
+    def _convert_tool(self, server_name: str, tool) -> BaseTool:
+        async def call_tool(**arguments):
+            result = await self.call_tool(server_name, tool.name, arguments)
+            return convert_call_tool_result(result)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description or "",
+            args_schema=tool.inputSchema,
+            coroutine=call_tool,
+            response_format="content_and_artifact",
+            metadata=tool.annotations.model_dump() if tool.annotations else None,
+        )
+
+    def server(self, server_name: str) -> PooledServer:
+        return PooledServer(self, server_name)
+
+    async def _health_check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for server_name, sessions in self._sessions.items():
+                # 只检查当前没有请求的会话，正在使用的会话不受影响（出错时由调用方重启）
+                for pooled in sessions:
+                    if pooled.in_flight:
+                        continue
+                    generation = pooled.generation
+                    try:
+                        if not await pooled.ping(self.ping_timeout) and not pooled.in_flight:
+                            print(f"MCP 会话 {server_name}#{pooled.index} 无响应，正在重启...")
+                            await pooled.ensure_alive(self.start_timeout, generation)
+                    except Exception as e:
+                        print(f"MCP 会话 {server_name}#{pooled.index} 重启失败: {e}")
+
+    async def close(self) -> None:
+        """关闭所有会话（进程退出时调用）"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self._close_sessions()
+        self._started = False
+
+    async def _close_sessions(self) -> None:
+        """关闭已创建的所有会话并清空会话与限流器"""
+        for sessions in self._sessions.values():
+            await asyncio.gather(*(pooled.close() for pooled in sessions), return_exceptions=True)
+        self._sessions.clear()
+        self._limiters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回每个服务的会话数量、存活数量、进行中 / 排队的请求数、重启次数与租用统计"""
+        result = {}
+        for server_name in self.connections:
+            sessions = self._sessions.get(server_name, [])
+            limiter = self._limiters.get(server_name)
+            result[server_name] = {
+                "size": len(sessions),
+                "alive": sum(1 for pooled in sessions if pooled.alive),
+                "limit": self.server_limits[server_name],
+                "in_flight": sum(pooled.in_flight for pooled in sessions),
+                "waiting": limiter.waiting if limiter is not None else 0,
+                "restarts": sum(pooled.restarts for pooled in sessions),
+                **self._stats[server_name],
+            }
+        return result
+
+
+_pool: Optional[MCPSessionPool] = None
+_pool_config: Optional[str] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_pool_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def get_mcp_pool(file_path: str = "servers_config.json", start: bool = True) -> MCPSessionPool:
+    """
+    获取进程内共享的 MCP 会话池，首次调用时启动
+
+    会话绑定在创建它的事件循环上，事件循环变化时（例如每次 asyncio.run）会重新建池；
+    配置文件变化时（例如基准测试使用本地替身服务）关闭旧池并重新建池。
+
+    Args:
+        file_path: MCP 服务配置文件路径
+        start: 为 False 时只创建会话池，不等待 MCP 服务启动（首次租用会话时启动）
+    """
+    global _pool, _pool_config, _pool_lock, _pool_lock_loop
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool.loop is loop and _pool_config == file_path:
+        return _pool
+
+    if _pool_lock is None or _pool_lock_loop is not loop:
+        _pool_lock = asyncio.Lock()
+        _pool_lock_loop = loop
+    async with _pool_lock:
+        if _pool is not None and _pool.loop is loop and _pool_config != file_path:
+            await close_mcp_pool()
+        if _pool is None or _pool.loop is not loop:
+            connections = {}
+            for server_name in MCP_SERVER_NAMES:
+                connections.update(await load_single_mcp_config(server_name, file_path))
+            pool = MCPSessionPool(connections, size=int(os.environ.get("MCP_POOL_SIZE", "2")),
+                                  max_in_flight=int(os.environ.get("MCP_SESSION_MAX_IN_FLIGHT", "8")),
+                                  server_limits=parse_server_limits(os.environ.get("MCP_SERVER_CONCURRENCY", "")))
+            pool.loop = loop
+            _pool, _pool_config = pool, file_path
+    if start:
+        await _pool.start()
+    return _pool
+
+
+async def close_mcp_pool() -> None:
+    """关闭进程内共享的 MCP 会话池（进程退出时调用）"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
@@ -0,0 +1,348 @@
+# place_index.py
+
+import asyncio
+import csv
+import datetime
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+from prometheus_client import Counter
+
+from .agents_config import wrap_tool_coroutine
+
+LOOKUPS = Counter("travel_place_index_lookups_total", "本地地点索引的查询次数", ["result"])
+
+# 火车站的常见叫法统一为“站”：信阳东高铁站 / 信阳东火车站 -> 信阳东站
+STATION_SUFFIX_PATTERN = re.compile(r'(高铁|火车|动车)站$')
+# 景区名称的通用后缀：岳麓山风景名胜区 -> 岳麓山
+SCENIC_SUFFIXES = ("风景名胜区", "风景区", "旅游区", "景区")
+# 名称中不影响匹配的字符：空白、标点、括号
+IGNORED_CHARS_PATTERN = re.compile(r'[\s\W_]+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    name_key TEXT NOT NULL,
+    city_key TEXT NOT NULL DEFAULT '',
+    city_name_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    result TEXT NOT NULL,
+    source TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (name_key, city_key)
+);
+CREATE INDEX IF NOT EXISTS places_city_name ON places (city_name_key);
+"""
+
+
+def normalize_place_name(name: str) -> str:
+    """规范化地点名称：全角转半角、去掉空白和标点、统一火车站叫法、去掉景区通用后缀"""
+    key = IGNORED_CHARS_PATTERN.sub("", unicodedata.normalize("NFKC", str(name))).lower()
+    key = STATION_SUFFIX_PATTERN.sub("站", key)
+    for suffix in SCENIC_SUFFIXES:
+        if key.endswith(suffix) and len(key) - len(suffix) >= 2:
+            key = key[:-len(suffix)]
+            break
+    return key
+
+
+def normalize_city(city: Any) -> str:
+    """规范化城市名称（高德对空字段返回 []）：长沙市 -> 长沙"""
+    if not isinstance(city, str):
+        return ""
+    key = normalize_place_name(city)
+    return key[:-1] if key.endswith("市") and len(key) > 2 else key
+
+
+def _tool_text(value: Any) -> Optional[str]:
+    """取出 MCP 工具返回值中的文本（content_and_artifact 格式返回 (content, artifact)）"""
+    content = value[0] if isinstance(value, tuple) else value
+    return content if isinstance(content, str) else None
+
+
+class PlaceIndex:
+    """
+    本地地点索引（SQLite）
+
+    按规范化的名称和城市记录高德地理编码与 POI 详情的结果，导航专家调用 maps_geo 前先查本地索引，
+    命中时直接返回与高德格式相同的结果，不再请求高德。查询依次尝试：
+    规范化名称精确匹配 -> 前缀匹配（只差 1~2 个字）-> 相似度匹配；匹配到多个不同坐标时视为不确定，交给高德。
+    """
+
+    def __init__(self, file_path: Optional[str] = None, min_similarity: float = 0.85):
+        self.file_path = file_path
+        self.min_similarity = min_similarity
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats_counts = {"hits": 0, "fuzzy_hits": 0, "misses": 0, "ambiguous": 0, "recorded": 0, "imported": 0}
+
+    @classmethod
+    def from_env(cls) -> "PlaceIndex":
+        """
+        PLACE_INDEX_DB 为索引文件路径（默认 place_index.sqlite），设为空则不使用本地索引；
+        PLACE_INDEX_MIN_SIMILARITY 为模糊匹配的最低相似度（默认 0.85）
+        """
+        return cls(os.environ.get("PLACE_INDEX_DB", "place_index.sqlite") or None,
+                   float(os.environ.get("PLACE_INDEX_MIN_SIMILARITY", "0.85")))
+
+    @property
+    def enabled(self) -> bool:
+        return self.file_path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # 多个事件循环线程（例如 Streamlit 的后台循环与 CLI）共用一个连接，写入由锁保护
+            self._conn = sqlite3.connect(self.file_path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _query_keys(name: str, city: Optional[str]) -> Tuple[List[str], str]:
+        """查询用的名称键：规范化名称，以及去掉城市前缀后的名称（长沙市岳麓山 -> 岳麓山）"""
+        name_key, city_key = normalize_place_name(name), normalize_city(city)
+        keys = [name_key] if name_key else []
+        for prefix in (city_key + "市", city_key) if city_key else ():
+            if name_key.startswith(prefix) and len(name_key) - len(prefix) >= 2:
+                keys.append(name_key[len(prefix):])
+                break
+        return keys, city_key
+
+    @staticmethod
+    def _city_name_keys(name_key: str) -> List[str]:
+        """未指定城市时，名称可能以城市开头（长沙岳麓山、信阳市信阳东站），与 城市 + 名称 比较"""
+        position = name_key.find("市")
+        if 2 <= position <= 4:
+            return [name_key, name_key[:position] + name_key[position + 1:]]
+        return [name_key]
+
+    @staticmethod
+    def _unique(rows: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        """候选结果只有一个坐标时返回该结果，否则（不同地点同名）返回 None"""
+        results = [json.loads(result) for _, result in rows]
+        if len({result.get("location") for result in results}) != 1:
+            return None
+        return results[0]
+
+    def lookup(self, name: str, city: Optional[str] = None, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        查询地点
+
+        Args:
+            name: 地点名称或地址
+            city: 城市（可选），指定时只匹配该城市（或未记录城市）的地点
+            count: 是否计入命中统计（其他模块批量查询时为 False）
+
+        Returns:
+            与高德 maps_geo 结果中单个条目格式相同的字典；未命中或不确定时返回 None
+        """
+        if not self.enabled or not name:
+            return None
+        keys, city_key = self._query_keys(name, city)
+        # 不指定城市的过短名称（南站、东站）在各城市都有，交给高德
+        if not keys or (not city_key and len(keys[0]) < 3):
+            return None
+
+        with self._lock:
+            conn = self._connection()
+            city_name_keys = self._city_name_keys(keys[0])
+            rows = conn.execute(
+                f"SELECT city_key, result FROM places WHERE name_key IN ({','.join('?' * len(keys))}) "
+                f"OR city_name_key IN ({','.join('?' * len(city_name_keys))})",
+                (*keys, *city_name_keys)).fetchall()
+            rows = [row for row in rows if not city_key or row[0] in (city_key, "")]
+            fuzzy = False
+            if not rows:
+                rows = self._fuzzy_candidates(conn, keys[-1], city_key)
+                fuzzy = True
+
+        result = self._unique(rows) if rows else None
+        if result is None:
+            outcome = "ambiguous" if rows else "misses"
+        else:
+            outcome = "fuzzy_hits" if fuzzy else "hits"
+        if count:
+            self.stats_counts[outcome] += 1
+            LOOKUPS.labels(outcome).inc()
+        return result
+
+    def lookup_many(self, queries: Iterable[Tuple[str, Optional[str]]]) -> List[Optional[Dict[str, Any]]]:
+        """批量查询 (名称, 城市)，不计入命中统计（供其他模块在线程中一次性查询，例如补全车站坐标）"""
+        return [self.lookup(name, city, count=False) for name, city in queries]
+
+    def _fuzzy_candidates(self, conn: sqlite3.Connection, name_key: str,
+                          city_key: str) -> List[Tuple[str, str]]:
+        """前缀与相似度匹配：候选限定为名称开头两三个字相同的地点（走主键索引的范围查询），返回得分最高的一组"""
+        if len(name_key) < 3:
+            return []
+        prefix = name_key[:min(3, len(name_key) - 1)]
+        sql = "SELECT name_key, city_key, result FROM places WHERE name_key >= ? AND name_key < ?"
+        params: List[Any] = [prefix, prefix + "\U0010ffff"]
+        if city_key:
+            sql += " AND city_key IN (?, '')"
+            params.append(city_key)
+        best, matches = 0.0, []
+        for candidate, row_city, result in conn.execute(sql + " LIMIT 500", params):
+            shorter, longer = sorted((candidate, name_key), key=len)
+            if longer.startswith(shorter) and len(longer) - len(shorter) <= 2:
+                score = 1.0 - (len(longer) - len(shorter)) / 100
+            else:
+                score = difflib.SequenceMatcher(None, candidate, name_key).ratio()
+            if score < self.min_similarity or score < best:
+                continue
+            if score > best:
+                best, matches = score, []
+            matches.append((row_city, result))
+        return matches
+
+    def add(self, name: str, result: Dict[str, Any], source: str, city: Optional[str] = None,
+            aliases: Iterable[str] = ()) -> None:
+        """记录一个地点及其别名（同名同城的旧记录被覆盖）"""
+        self.add_many([(name, result, source, city, aliases)])
+        self.stats_counts["recorded"] += 1
+
+    def add_many(self, places: Iterable[Tuple[str, Dict[str, Any], str, Optional[str], Iterable[str]]]) -> int:
+        """在一个事务中批量写入 (名称, 结果, 来源, 城市, 别名)，返回写入的名称数（含别名）"""
+        if not self.enabled:
+            return 0
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for name, result, source, city, aliases in places:
+            payload = json.dumps(result, ensure_ascii=False)
+            city_key = normalize_city(city or result.get("city"))
+            for alias in (name, *aliases):
+                name_key = normalize_place_name(alias)
+                if name_key:
+                    rows.append((name_key, city_key, city_key + name_key, name, payload, source, now))
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        return len(rows)
+
+    def record_geo(self, address: str, city: Optional[str], content: Optional[str]) -> None:
+        """记录 maps_geo 的结果：只有唯一结果时记录，多个结果说明地址有歧义"""
+        try:
+            results = json.loads(content or "").get("results") or []
+        except (ValueError, AttributeError):
+            return
+        if len(results) == 1 and results[0].get("location"):
+            self.add(address, results[0], "maps_geo", city=city)
+
+    def record_detail(self, content: Optional[str]) -> None:
+        """记录 maps_search_detail 的结果：POI 名称与别名都指向该地点"""
+        try:
+            detail = json.loads(content or "")
+        except ValueError:
+            return
+        if not isinstance(detail, dict) or not detail.get("name") or not detail.get("location"):
+            return
+        city = detail.get("city") or detail.get("cityname")
+        result = {
+            "country": "中国",
+            "city": city if isinstance(city, str) else "",
+            "formatted_address": detail.get("address") if isinstance(detail.get("address"), str) else detail["name"],
+            "adcode": detail.get("adcode") or "",
+            "location": detail["location"],
+            "level": "兴趣点",
+            "name": detail["name"],
+        }
+        aliases = re.split(r'[|;；]', detail["alias"]) if isinstance(detail.get("alias"), str) else []
+        self.add(detail["name"], result, "maps_search_detail", city=result["city"],
+                 aliases=[alias for alias in aliases if alias.strip()])
+
+    def import_file(self, path: str) -> int:
+        """
+        批量导入 CSV（带表头）或 JSONL 文件
+
+        每行的字段：name、location（"经度,纬度"）必填，city、adcode、address、aliases（以 | 或 ; 分隔）可选
+        """
+        with open(path, encoding="utf-8-sig") as f:
+            if path.endswith((".jsonl", ".json")):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = list(csv.DictReader(f))
+
+        places = []
+        for record in records:
+            if not record.get("name") or not record.get("location"):
+                continue
+            result = {
+                "country": "中国",
+                "city": record.get("city") or "",
+                "formatted_address": record.get("address") or record["name"],
+                "adcode": record.get("adcode") or "",
+                "location": record["location"],
+                "level": "兴趣点",
+                "name": record["name"],
+            }
+            aliases = record.get("aliases") or []
+            if isinstance(aliases, str):
+                aliases = [alias for alias in re.split(r'[|;；]', aliases) if alias.strip()]
+            places.append((record["name"], result, "import", result["city"], aliases))
+        count = self.add_many(places)
+        self.stats_counts["imported"] += count
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """索引统计：记录数（含别名）与查询命中情况"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._connection().execute("SELECT COUNT(*) FROM places").fetchone()[0]
+        lookups = self.stats_counts["hits"] + self.stats_counts["fuzzy_hits"] + \
+            self.stats_counts["misses"] + self.stats_counts["ambiguous"]
+        hits = self.stats_counts["hits"] + self.stats_counts["fuzzy_hits"]
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            **self.stats_counts,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def wrap_tools_with_place_index(tools: List[BaseTool], index: PlaceIndex) -> List[BaseTool]:
+    """
+    maps_geo 先查本地地点索引，命中时返回与高德相同格式的结果；
+    maps_geo 与 maps_search_detail 的实时结果写入索引。其他工具保持原样
+
+    索引的 SQLite 读写是同步调用，放到线程池中执行，不阻塞事件循环上的其他请求
+    """
+    if not index.enabled:
+        return tools
+
+    def make_geo_coroutine(tool, call_next):
+        async def geo_call(**arguments):
+            address, city = arguments.get("address", ""), arguments.get("city")
+            result = await asyncio.to_thread(index.lookup, address, city)
+            if result is not None:
+                content = json.dumps({"results": [result]}, ensure_ascii=False)
+                return (content, None) if tool.response_format == "content_and_artifact" else content
+            value = await call_next(**arguments)
+            await asyncio.to_thread(index.record_geo, address, city, _tool_text(value))
+            return value
+
+        return geo_call
+
+    def make_detail_coroutine(tool, call_next):
+        async def detail_call(**arguments):
+            value = await call_next(**arguments)
+            await asyncio.to_thread(index.record_detail, _tool_text(value))
+            return value
+
+        return detail_call
+
+    factories = {"maps_geo": make_geo_coroutine, "maps_search_detail": make_detail_coroutine}
+    return [wrap_tool_coroutine(tool, factories[tool.name]) if tool.name in factories else tool
+            for tool in tools]
+
+
+# 进程内共享的本地地点索引
+place_index = PlaceIndex.from_env()
+
@@ -0,0 +1,49 @@
+# place_index_cli.py
+"""
+本地地点索引的命令行工具：批量导入、查询与统计
+
+用法（在 backend 目录下）：
+    # 批量导入（CSV 或 JSONL，字段：name, city, location, adcode, address, aliases，别名以 | 或 ; 分隔）
+    python -m config.place_index_cli import stations.csv
+    python -m config.place_index_cli lookup 信阳东高铁站 --city 信阳
+    python -m config.place_index_cli stats
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import List, Optional
+
+from .place_index import PlaceIndex
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地地点索引：批量导入、查询与统计")
+    parser.add_argument("--db", default=os.environ.get("PLACE_INDEX_DB", "place_index.sqlite"), help="索引文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="从 CSV / JSONL 文件批量导入地点")
+    import_parser.add_argument("files", nargs="+", help="CSV（带表头）或 JSONL 文件")
+    lookup_parser = subparsers.add_parser("lookup", help="查询地点")
+    lookup_parser.add_argument("name", help="地点名称")
+    lookup_parser.add_argument("--city", help="城市")
+    subparsers.add_parser("stats", help="索引统计")
+    args = parser.parse_args(argv)
+
+    index = PlaceIndex(args.db)
+    if args.command == "import":
+        for path in args.files:
+            start = time.perf_counter()
+            count = index.import_file(path)
+            print(f"{path}: 导入 {count} 个名称（含别名），耗时 {time.perf_counter() - start:.2f}s")
+    elif args.command == "lookup":
+        start = time.perf_counter()
+        result = index.lookup(args.name, args.city)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(json.dumps(result, ensure_ascii=False, indent=2) if result else "未命中")
+        print(f"耗时 {elapsed:.0f}µs")
+    print(json.dumps(index.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,7 @@ def navigation_prompt(tools_info: str) -> str:
                 2.  **拆解子任务**：将 `current_task` 分解为一个符合逻辑的工具调用序列。
                 3.  **执行与迭代**:
                     -   按顺序执行子任务。步骤之间无需请求确认。
+                    -   互不依赖的工具调用（例如分别对起点和终点做地理编码）在同一轮中一起发起，它们会并行执行。
                     -   每次工具调用后，分析其结果以判断 `current_task` 是否已完成。
                     -   若未完成，则制定下一个子任务并继续执行工具调用。
                 4.  **处理异常**：如果任何工具返回错误、空结果，或者所需参数缺失，立即停止执行并向 supervisor 报告异常。
@@ -122,6 +123,7 @@ def ticketing_prompt(tools_info: str) -> str:
             - 你只需要完成supervisor交给你的当前任务，严禁返回不属于你工作范围内的结果给supervisor
             - 对于supervisor交给你的当前任务必须按照要求分解为子任务并逐步执行  
                 - 一旦子任务分解完成，即可立即执行，不用再返回给supervisor确认（这样会浪费时间）
+                - 互不依赖的工具调用（例如查询多个日期或多个车站的余票）在同一轮中一起发起，它们会并行执行
             - 对于直达车次查询任务，必须先完成完整直达流程，若存在直达车次，一定要返回直达车次信息，不要中转
             - 如不存在直达车次信息，则一定进入中转查询流程  
             - 每次查询返回后需判断supervisor要求的当前任务是否已完成，如果完成，则返回给supervisor
@@ -137,6 +139,10 @@ def ticketing_prompt(tools_info: str) -> str:
                         - 如supervisor明确要求进行中转查询 
                         - 以及其他不符合supervisor要求的情况
 
+            ▷ 中转查询方法：
+                - 工具列表中有 `plan-transfer-tickets` 时，直接调用它一次即可得到排好序的中转方案（自动挑选中转城市、
+                  并行查询两段余票并按换乘时间拼接），不要自己逐个猜测中转站、逐段查询
+
             ▷ 禁止触发中转查询的情形：  
                 - 尚未完成直达车完整查询流程 
                 - 若存在直达车次且不违背supervisor要求
@@ -205,6 +211,14 @@ def supervisor_prompt() -> str:
                  或
                  ticketing_expert
 
+               - 若存在多个相互独立、互不依赖对方结果的子任务（例如起点到车站的路线、车票查询、到达站到景点的路线），
+                 应一次性并行分发：每个子任务单独一行，格式为“代理名称: 当前任务是……”，末行输出 PARALLEL，例如：
+                 navigation_expert: 当前任务是信阳市人民医院到信阳东站的公交和地铁路线规划。
+                 ticketing_expert: 当前任务是查询2025年7月7号信阳东站到上海的高铁车票信息及车次。
+                 navigation_expert: 当前任务是从上海虹桥高铁站到上海迪士尼景点的公交地铁路线规划。
+                 PARALLEL
+               - 依赖前一个子任务结果的子任务（例如需要根据车票的到达站规划路线），必须等前一个子任务完成后再分发
+
             三、输出控制要求
             1.  严禁任何形式的数据伪造、推测或虚构结果，所有输出必须基于真实数据和工具调用结果。
             2. 最终输出必须满足：
@@ -213,10 +227,11 @@ def supervisor_prompt() -> str:
 
                - 最终决策指令必须独占末行（关系到最终停止条件）
                - 并且最终决策指令在每次的输出信息中只能出现一次就是在末行（非常重要，关系到调用次数累计）
-               - 最后一行有且仅有以下三种选项之一：
+               - 最后一行有且仅有以下四种选项之一：
                  FINAL ANSWER
                  navigation_expert
-                 ticketing_expert             
+                 ticketing_expert
+                 PARALLEL
                - 一旦最终决策指令输出按照上述格式输出完毕，则supervisor必须立即停止生成，进入下一步。
 
             3. 示例模板
@@ -232,6 +247,13 @@ def supervisor_prompt() -> str:
 
                     首先进行导航路线规划
                     naviqation expert
+            - 接到用户输入信息时的并行规划案例：
+
+                根据用户的查询可将任务分解为3个相互独立的子任务，并行执行：
+                navigation_expert: 当前任务是信阳市人民医院到信阳东站的公交和地铁路线规划。
+                ticketing_expert: 当前任务是查询2025年7月7号信阳东站到上海的高铁车票信息及车次（只乘坐高铁）。
+                navigation_expert: 当前任务是从上海虹桥高铁站到上海迪士尼景点的公交地铁路线规划。
+                PARALLEL
             - 继续规划案例2：
 
                 当前子任务已完成，接着进行下一步：
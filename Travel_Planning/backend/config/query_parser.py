@@ -0,0 +1,362 @@
+# query_parser.py
+
+import datetime
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import AIMessage
+
+from .agents_config import get_request_budget
+
+# 出行方式关键词（按优先级排列）
+TRANSPORT_MODE_KEYWORDS = [
+    ("driving", ("驾车", "自驾", "开车", "打车")),
+    ("transit", ("公交", "地铁", "公共交通")),
+    ("walking", ("步行", "走路", "走过去")),
+    ("bicycling", ("骑行", "骑车", "自行车")),
+    ("train", ("高铁", "动车", "火车", "列车", "车票", "车次", "余票", "票务", "12306")),
+]
+
+TRANSPORT_MODE_LABELS = {
+    "driving": "驾车",
+    "transit": "公共交通及步行",
+    "walking": "步行",
+    "bicycling": "骑行",
+}
+
+# 车次类型约束：关键词 -> 车次首字母
+TRAIN_TYPE_KEYWORDS = [
+    ("高铁", ["G"]),
+    ("城际", ["C"]),
+    ("动车", ["D"]),
+    ("普快", ["K", "T", "Z"]),
+    ("特快", ["T", "Z"]),
+]
+# 席位约束（“要二等座”“不要无座”），与 get-tickets 结果中的席位名称一致
+SEAT_KEYWORDS = ("商务座", "特等座", "一等座", "二等座", "动卧", "软卧", "硬卧", "硬座", "无座")
+# 否定车次类型或席位的说法（“不要动车”“除了高铁”），否定词之后同一分句内出现“只/要/坐/乘”时重新变为肯定（“不要动车只要高铁”）
+TRAIN_TYPE_NEGATION_PATTERN = re.compile(r'不要|不坐|不乘|不想坐|别坐|除了')
+TRAIN_TYPE_AFFIRMATION_PATTERN = re.compile(r'只|要|坐|乘')
+CLAUSE_SEPARATOR_PATTERN = re.compile(r'[，,。；;！!？?\s]')
+
+# 需要 supervisor 综合规划的请求（推荐、攻略等），不走快速通道
+OPEN_ENDED_KEYWORDS = ("推荐", "方案", "攻略", "行程", "游玩", "旅游")
+
+NAVIGATION_KEYWORDS = ("路线", "导航", "怎么走", "驾车", "自驾", "开车", "打车", "公交", "地铁", "步行", "骑行")
+TICKET_KEYWORDS = ("车票", "车次", "余票", "票务", "购票", "买票", "高铁票", "动车票", "火车票", "12306")
+
+# 乘火车到达后继续前往的目的地：明天从长沙坐高铁去武汉，到站后怎么去黄鹤楼
+FINAL_DESTINATION_PATTERN = re.compile(
+    r'(?:到站后|下车后|出站后|到了以后|到了之后|到达后|然后)(?:再)?(?:怎么|如何)?(?:打车|开车|坐地铁|乘地铁|坐公交|乘公交|步行)?(?:去|到|前往)(?P<d>[^，,。；;？?！!\s的]+)')
+# 明确要求门到门规划的关键词
+DOOR_TO_DOOR_KEYWORDS = ("门到门", "最快到达", "最早到达")
+# 包含多个独立子任务的查询交给 supervisor 拆分
+MULTI_TASK_KEYWORDS = ("以及", "另外", "还有", "同时")
+# 多段行程的连接词：坐公交到信阳东站，再坐高铁去上海虹桥，最后坐地铁到迪士尼
+MULTI_LEG_KEYWORDS = ("再", "然后", "最后", "顺便", "接着")
+# 表示乘火车的词（即使同时出现驾车、公交等出行方式，也说明查询包含车票需求）
+TRAIN_KEYWORDS = ("高铁", "动车", "火车", "列车", "城际", "普快", "特快")
+
+RELATIVE_DAYS = {"今天": 0, "今日": 0, "明天": 1, "明日": 1, "后天": 2, "大后天": 3}
+WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+
+# 地点前后需要去掉的修饰词
+PLACE_PREFIX_PATTERN = re.compile(
+    r'^(请|麻烦|帮我|给我|我想|我要|我需要|需要|我计划|计划|想|要|查询一下|查询|查一下|查|规划一下|规划|看看|一下|现在|我现在|我|在)+'
+)
+PLACE_SUFFIX_PATTERN = re.compile(
+    r'(出发|的|怎么|如何|乘坐|坐|乘|走|去|路线|导航|规划|驾车|自驾|开车|公交|地铁|步行|骑行|游玩|'
+    r'高铁|动车|火车|车票|车次|余票|票|门到门|最快|最早|还有吗|有没有|吧|呢|啊|吗)+$'
+)
+
+
+@dataclass
+class ParsedQuery:
+    """规则解析出的查询要素"""
+    raw: str
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    date: Optional[str] = None  # YYYY-MM-DD
+    transport_mode: Optional[str] = None
+    train_types: List[str] = field(default_factory=list)
+    excluded_train_types: List[str] = field(default_factory=list)  # 用户排除的车次类型（“不要动车”）
+    seat_types: List[str] = field(default_factory=list)
+    excluded_seat_types: List[str] = field(default_factory=list)
+    # 包含规则无法表达的否定约束（例如“不要晚上的车”），快速通道与门到门规划都不能保证满足
+    unsupported_constraint: bool = False
+    category: str = "unknown"  # navigation / ticket / mixed / unknown
+    open_ended: bool = False
+    final_destination: Optional[str] = None  # 乘火车到达 destination 后继续前往的地点
+    multi_leg: bool = False  # 包含多段行程或多个子任务，单个专家无法完成
+
+
+def parse_date(text: str, today: datetime.date) -> Optional[datetime.date]:
+    """从文本中解析出行日期，支持 2025年7月7号、2025-07-07、7月7日、明天、下周三等写法"""
+    match = re.search(r'(\d{4})\s*[年\-/.]\s*(\d{1,2})\s*[月\-/.]\s*(\d{1,2})\s*[日号]?', text)
+    if match:
+        try:
+            return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        except ValueError:
+            return None
+
+    match = re.search(r'(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]', text)
+    if match:
+        try:
+            date = datetime.date(today.year, int(match.group(1)), int(match.group(2)))
+        except ValueError:
+            return None
+        # 没写年份且日期已过，认为是明年
+        return date if date >= today else date.replace(year=today.year + 1)
+
+    for word in sorted(RELATIVE_DAYS, key=len, reverse=True):
+        if word in text:
+            return today + datetime.timedelta(days=RELATIVE_DAYS[word])
+
+    match = re.search(r'(下|这|本)?(?:周|星期|礼拜)([一二三四五六日天])', text)
+    if match:
+        weekday = WEEKDAYS[match.group(2)]
+        days = weekday - today.weekday()
+        if match.group(1) == "下":
+            days += 7
+        elif days < 0:
+            days += 7
+        return today + datetime.timedelta(days=days)
+
+    return None
+
+
+def strip_dates(text: str) -> str:
+    """去掉文本中的日期表达，避免干扰地点提取"""
+    text = re.sub(r'\d{4}\s*[年\-/.]\s*\d{1,2}\s*[月\-/.]\s*\d{1,2}\s*[日号]?', ' ', text)
+    text = re.sub(r'\d{1,2}\s*月\s*\d{1,2}\s*[日号]', ' ', text)
+    text = re.sub(r'(大后天|后天|明天|明日|今天|今日)', ' ', text)
+    text = re.sub(r'(下|这|本)?(周|星期|礼拜)[一二三四五六日天]', ' ', text)
+    return text
+
+
+def clean_place(place: str) -> Optional[str]:
+    """去掉地点两端的修饰词和标点"""
+    place = re.sub(r'[\s"“”\'‘’（）()【】]+', '', place or '')
+    for _ in range(3):
+        place = PLACE_PREFIX_PATTERN.sub('', place)
+        place = PLACE_SUFFIX_PATTERN.sub('', place)
+    return place or None
+
+
+def extract_places(text: str) -> tuple:
+    """提取出发地与目的地"""
+    text = strip_dates(text)
+    patterns = [
+        # 我现在在湖南长沙，需要去黄山
+        r'在(?P<o>[^，,。；;\s]+)[，,；;\s]+.*?(?:去|到|前往)(?P<d>[^，,。；;？?！!\s的]+)',
+        # 从信阳东站到上海虹桥的高铁票
+        r'从(?P<o>[^，,。；;]+?)(?:出发)?(?:到|去|至|前往)(?P<d>[^，,。；;？?！!\s的]+)',
+        # 上海东方明珠到上海迪士尼乐园的驾车路线
+        r'(?P<o>[^，,。；;？?！!\s]+?)(?:到|至|去|前往)(?P<d>[^，,。；;？?！!\s的]+)',
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, text)
+        if match:
+            origin, destination = clean_place(match.group('o')), clean_place(match.group('d'))
+            if origin and destination and origin != destination:
+                return origin, destination
+    return None, None
+
+
+def is_negated(text: str, index: int) -> bool:
+    """text[index:] 开头的关键词是否被同一分句中前面的否定词否定"""
+    clause = CLAUSE_SEPARATOR_PATTERN.split(text[:index])[-1]
+    negations = list(TRAIN_TYPE_NEGATION_PATTERN.finditer(clause))
+    if not negations:
+        return False
+    return not TRAIN_TYPE_AFFIRMATION_PATTERN.search(clause[negations[-1].end():])
+
+
+def parse_constraints(text: str, keywords: List[Tuple[str, List[str]]]) -> Tuple[List[str], List[str]]:
+    """
+    解析车次类型或席位约束，返回 (要求的, 排除的)：否定的类型记入排除列表并从要求中去掉，
+    “不要动车”是排除 D 字头，而不是只查动车
+    """
+    wanted, excluded = [], []
+    for keyword, values in keywords:
+        for match in re.finditer(keyword, text):
+            target = excluded if is_negated(text, match.start()) else wanted
+            target.extend(value for value in values if value not in target)
+    return [value for value in wanted if value not in excluded], excluded
+
+
+def has_unsupported_negation(text: str) -> bool:
+    """是否有否定词后面（同一分句内）没有车次类型或席位关键词，即规则无法表达的否定约束"""
+    keywords = [keyword for keyword, _ in TRAIN_TYPE_KEYWORDS] + list(SEAT_KEYWORDS)
+    for clause in CLAUSE_SEPARATOR_PATTERN.split(text):
+        for match in TRAIN_TYPE_NEGATION_PATTERN.finditer(clause):
+            if not any(keyword in clause[match.end():] for keyword in keywords):
+                return True
+    return False
+
+
+def describe_constraints(parsed: ParsedQuery) -> str:
+    """把车次类型与席位约束写成任务中的说明，例如“（只查询 G 字头的车次；不查询 D 字头的车次）”"""
+    parts = []
+    if parsed.train_types:
+        parts.append(f"只查询 {'/'.join(parsed.train_types)} 字头的车次")
+    if parsed.excluded_train_types:
+        parts.append(f"不查询 {'/'.join(parsed.excluded_train_types)} 字头的车次")
+    if parsed.seat_types:
+        parts.append(f"只看{'/'.join(parsed.seat_types)}")
+    if parsed.excluded_seat_types:
+        parts.append(f"不要{'/'.join(parsed.excluded_seat_types)}")
+    return f"（{'；'.join(parts)}）" if parts else ""
+
+
+def parse_query(query: str, today: Optional[datetime.date] = None) -> ParsedQuery:
+    """
+    用规则从原始查询中提取出发地、目的地、日期、出行方式与车次类型，并对查询分类
+
+    Args:
+        query: 用户原始查询
+        today: 当前日期（用于解析“明天”等相对日期），默认取系统日期
+
+    Returns:
+        ParsedQuery
+    """
+    today = today or datetime.date.today()
+    text = query.strip()
+    parsed = ParsedQuery(raw=query)
+
+    date = parse_date(text, today)
+    parsed.date = date.isoformat() if date else None
+    parsed.origin, parsed.destination = extract_places(text)
+    match = FINAL_DESTINATION_PATTERN.search(strip_dates(text))
+    if match:
+        parsed.final_destination = clean_place(match.group('d'))
+
+    for mode, keywords in TRANSPORT_MODE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            parsed.transport_mode = mode
+            break
+
+    parsed.train_types, parsed.excluded_train_types = parse_constraints(text, TRAIN_TYPE_KEYWORDS)
+    parsed.seat_types, parsed.excluded_seat_types = parse_constraints(
+        text, [(seat, [seat]) for seat in SEAT_KEYWORDS])
+    parsed.unsupported_constraint = has_unsupported_negation(text)
+
+    wants_navigation = any(keyword in text for keyword in NAVIGATION_KEYWORDS)
+    wants_ticket = (any(keyword in text for keyword in TICKET_KEYWORDS + TRAIN_KEYWORDS + SEAT_KEYWORDS)
+                    or parsed.transport_mode == "train" or bool(parsed.train_types))
+    if wants_navigation and wants_ticket:
+        parsed.category = "mixed"
+    elif wants_navigation:
+        parsed.category = "navigation"
+    elif wants_ticket:
+        parsed.category = "ticket"
+
+    parsed.open_ended = any(keyword in text for keyword in OPEN_ENDED_KEYWORDS)
+    parsed.multi_leg = any(keyword in text for keyword in MULTI_LEG_KEYWORDS + MULTI_TASK_KEYWORDS)
+    return parsed
+
+
+def build_fast_path_task(parsed: ParsedQuery) -> Optional[tuple]:
+    """
+    单一子任务的查询直接生成结构化任务，返回 (代理名称, 任务描述)；
+    信息不完整、需要综合规划或包含多个子任务时返回 None，交给 supervisor 处理
+    """
+    if (parsed.open_ended or parsed.multi_leg or parsed.final_destination or parsed.unsupported_constraint
+            or not (parsed.origin and parsed.destination)):
+        return None
+
+    if parsed.category == "navigation" and parsed.transport_mode in TRANSPORT_MODE_LABELS:
+        mode_label = TRANSPORT_MODE_LABELS[parsed.transport_mode]
+        return ("navigation_expert",
+                f"当前任务是{parsed.origin}到{parsed.destination}的{mode_label}路线规划。")
+
+    if parsed.category == "ticket" and parsed.date:
+        return ("ticketing_expert",
+                f"当前任务是查询{parsed.date}从{parsed.origin}到{parsed.destination}的车票信息及车次"
+                f"{describe_constraints(parsed)}。")
+
+    return None
+
+
+def wants_door_to_door(parsed: ParsedQuery) -> bool:
+    """
+    乘火车往返两个城市、并关心从出发地到最终目的地全程的查询（到站后怎么去某地、门到门、最快到达），
+    交给确定性的门到门规划节点
+    """
+    # 门到门规划按最低票价比较方案，不能满足席位约束和规则无法表达的约束
+    if (parsed.open_ended or parsed.seat_types or parsed.excluded_seat_types or parsed.unsupported_constraint
+            or not (parsed.origin and parsed.destination)):
+        return False
+    # 除“到站后怎么去某地”这一段接驳外还有其他行程或子任务时，交给 supervisor 拆分
+    remainder = FINAL_DESTINATION_PATTERN.sub('', strip_dates(parsed.raw))
+    if any(keyword in remainder for keyword in MULTI_LEG_KEYWORDS + MULTI_TASK_KEYWORDS):
+        return False
+    if parsed.final_destination:
+        return parsed.category in ("ticket", "mixed") or parsed.transport_mode == "train" or bool(parsed.train_types)
+    return any(keyword in parsed.raw for keyword in DOOR_TO_DOOR_KEYWORDS)
+
+
+async def preparse_node(state: Dict[str, Any], stations: Optional[Any] = None,
+                        door_to_door: bool = False) -> Dict[str, Any]:
+    """
+    supervisor 之前的规则预处理节点：简单查询直接生成结构化任务交给对应专家，省去 supervisor 的 LLM 调用
+
+    Args:
+        state: 工作流状态
+        stations: 本地车站目录（StationCatalog），车票任务的出发地和目的地都能在目录中解析时，
+            任务中附带车站编码，票务专家不需要再查询编码
+        door_to_door: 是否启用门到门规划节点
+    """
+    query = next((msg.content for msg in reversed(state["messages"])
+                  if msg.__class__.__name__ == 'HumanMessage'), "")
+    parsed = parse_query(str(query))
+    if door_to_door and wants_door_to_door(parsed):
+        return {"sender": ["preparser"], "fast_path": "door_to_door"}
+    fast_path = build_fast_path_task(parsed)
+    # sender 在多轮会话中持续累加，"preparser" 标记每一轮的开始
+    if fast_path is None:
+        return {"sender": ["preparser"], "fast_path": None}
+
+    expert, task = fast_path
+    if expert == "ticketing_expert" and stations is not None and stations.enabled:
+        hint = stations.code_hint(parsed.origin, parsed.destination)
+        if hint:
+            task += f"车站编码（本地车站目录）：{hint}，可直接用于 get-tickets。"
+    return {
+        "messages": [AIMessage(content=task, name="supervisor")],
+        "sender": ["preparser"],
+        "fast_path": expert,
+    }
+
+
+def current_senders(senders: List[str]) -> List[str]:
+    """当前轮次的发送者：最后一个 "preparser" 标记之后的部分"""
+    if "preparser" not in senders:
+        return senders
+    return senders[len(senders) - 1 - senders[::-1].index("preparser"):]
+
+
+async def preparse_router(state: Dict[str, Any]) -> str:
+    """预处理节点之后的路由：命中快速通道直达专家，否则进入 supervisor"""
+    return state.get("fast_path") or "supervisor"
+
+
+# 专家结果中表示任务未完成的标记
+EXPERT_FAILURE_PATTERN = re.compile(r'\[错误\]|异常|失败|未找到|无法')
+
+
+async def expert_router(state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    专家节点之后的路由：快速通道的任务成功完成则直接结束，
+    否则（常规流程或快速通道失败）回到 supervisor；请求预算所剩无几时也直接结束
+    """
+    budget = get_request_budget(config)
+    if budget is not None and budget.is_low():
+        budget.stopped_early = True
+        return "__end__"
+    if state.get("fast_path") and "supervisor" not in current_senders(state.get("sender", [])):
+        content = str(getattr(state["messages"][-1], 'content', ''))
+        if not EXPERT_FAILURE_PATTERN.search(content):
+            return "__end__"
+    return "supervisor"
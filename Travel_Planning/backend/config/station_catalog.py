@@ -0,0 +1,666 @@
+# station_catalog.py
+
+import asyncio
+import csv
+import datetime
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool, StructuredTool
+from prometheus_client import Counter
+from pydantic import BaseModel, Field
+
+from .agents_config import wrap_tool_coroutine
+from .place_index import PlaceIndex, _tool_text, normalize_city
+from .ticket_parser import parse_tickets
+
+try:
+    # 可选依赖：12306 返回的车站带拼音，导入的车站没有拼音时用 pypinyin 补全
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+LOOKUPS = Counter("travel_station_catalog_lookups_total", "本地车站目录代替 12306 查询的次数",
+                  ["tool", "result"])
+
+# 定期刷新时查询的城市（另外加上目录中已有的城市）
+SEED_CITIES = (
+    "北京", "上海", "天津", "重庆", "广州", "深圳", "杭州", "南京", "苏州", "武汉", "长沙", "成都",
+    "西安", "郑州", "济南", "青岛", "合肥", "南昌", "福州", "厦门", "昆明", "贵阳", "南宁", "海口",
+    "石家庄", "太原", "呼和浩特", "沈阳", "长春", "哈尔滨", "兰州", "西宁", "银川", "乌鲁木齐", "拉萨",
+    "大连", "宁波", "无锡", "黄山", "桂林", "信阳",
+)
+
+# 车站名称中可以省略的后缀：北京南站 / 北京南火车站 -> 北京南
+STATION_NAME_SUFFIX_PATTERN = re.compile(r'(高铁|火车|动车)?站$')
+IGNORED_CHARS_PATTERN = re.compile(r'[\s\W_]+')
+# 12306 电报码：三个大写字母
+TELECODE_PATTERN = re.compile(r'^[A-Z]{3}$')
+# 高铁、动车、城际车次的首字母
+HIGH_SPEED_PREFIXES = ("G", "D", "C")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def normalize_station_name(name: Any) -> str:
+    """规范化车站名称：全角转半角、去掉空白和标点、去掉“站 / 火车站 / 高铁站”后缀"""
+    if not isinstance(name, str):
+        return ""
+    key = IGNORED_CHARS_PATTERN.sub("", unicodedata.normalize("NFKC", name)).lower()
+    stripped = STATION_NAME_SUFFIX_PATTERN.sub("", key)
+    return stripped or key
+
+
+def parse_location(location: Any) -> Optional[Tuple[float, float]]:
+    """解析高德格式的坐标 "经度,纬度"，无效时返回 None"""
+    if isinstance(location, (list, tuple)) and len(location) == 2:
+        parts = location
+    elif isinstance(location, str) and "," in location:
+        parts = location.split(",", 1)
+    else:
+        return None
+    try:
+        lng, lat = float(parts[0]), float(parts[1])
+    except (TypeError, ValueError):
+        return None
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        return None
+    return lng, lat
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """两个 (经度, 纬度) 之间的球面距离（公里）"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+@dataclass
+class Station:
+    """12306 车站"""
+    code: str  # 电报码
+    name: str
+    city: str = ""
+    pinyin: str = ""
+    short: str = ""  # 拼音首字母
+    location: Optional[Tuple[float, float]] = None  # (经度, 纬度)
+    high_speed: bool = False  # 是否有高铁 / 动车 / 城际车次停靠
+
+    def to_result(self) -> Dict[str, Any]:
+        """与 12306-mcp 返回格式相同的车站信息"""
+        result = {"station_code": self.code, "station_name": self.name, "city": self.city}
+        if self.pinyin:
+            result["station_pinyin"] = self.pinyin
+        if self.short:
+            result["station_short"] = self.short
+        return result
+
+
+class _TrieNode:
+    __slots__ = ("children", "codes")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.codes: List[str] = []
+
+
+class StationTrie:
+    """按名称、拼音、拼音首字母的前缀查找车站编码"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, key: str, code: str) -> None:
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        if code not in node.codes:
+            node.codes.append(code)
+
+    def search(self, prefix: str, limit: int) -> List[str]:
+        """前缀匹配的车站编码，按匹配的键由短到长（完全匹配在前）排列"""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        codes: List[str] = []
+        level = [node]
+        while level and len(codes) < limit:
+            for current in level:
+                codes.extend(code for code in current.codes if code not in codes)
+            level = [child for current in level for _, child in sorted(current.children.items())]
+        return codes[:limit]
+
+
+class StationGrid:
+    """车站坐标的网格索引：按经纬度划分格子，从查询点所在格子向外逐圈查找"""
+
+    def __init__(self, cell_degrees: float = 0.2):
+        self.cell = cell_degrees
+        self.cells: Dict[Tuple[int, int], List[Tuple[str, Tuple[float, float]]]] = {}
+        self.locations: Dict[str, Tuple[float, float]] = {}  # 编码 -> 当前坐标
+
+    def _cell(self, location: Tuple[float, float]) -> Tuple[int, int]:
+        return int(math.floor(location[0] / self.cell)), int(math.floor(location[1] / self.cell))
+
+    def insert(self, code: str, location: Tuple[float, float]) -> None:
+        """加入车站坐标，车站已有坐标时移到新的位置"""
+        previous = self.locations.get(code)
+        if previous == location:
+            return
+        if previous is not None:
+            cell = self.cells[self._cell(previous)]
+            cell.remove((code, previous))
+        self.locations[code] = location
+        self.cells.setdefault(self._cell(location), []).append((code, location))
+
+    def nearest(self, location: Tuple[float, float], limit: int, radius_km: float,
+                accept: Callable[[str], bool] = lambda code: True) -> List[Tuple[str, float]]:
+        """半径 radius_km 内最近的 limit 个车站，返回 [(编码, 距离公里)]"""
+        center_x, center_y = self._cell(location)
+        # 经度方向一格的最短距离（取查询半径内纬度最高处）
+        max_lat = min(abs(location[1]) + radius_km / KM_PER_DEGREE, 89.0)
+        cell_km = self.cell * KM_PER_DEGREE * math.cos(math.radians(max_lat))
+        max_ring = int(math.ceil(radius_km / cell_km)) + 1
+        found: List[Tuple[str, float]] = []
+        for ring in range(max_ring + 1):
+            for x in range(center_x - ring, center_x + ring + 1):
+                for y in range(center_y - ring, center_y + ring + 1):
+                    if max(abs(x - center_x), abs(y - center_y)) != ring:
+                        continue
+                    for code, point in self.cells.get((x, y), ()):
+                        distance = haversine_km(location, point)
+                        if distance <= radius_km and accept(code):
+                            found.append((code, distance))
+            found.sort(key=lambda item: item[1])
+            # 下一圈的格子离查询点至少 ring 个格子宽，已找到的足够近时不再向外查找
+            if len(found) >= limit and found[limit - 1][1] <= ring * cell_km:
+                break
+        return found[:limit]
+
+
+class StationCatalog:
+    """
+    内存中的 12306 车站目录
+
+    启动时从 JSON 快照加载，后台按城市定期向 12306-mcp 刷新；票务专家查询车站编码的工具先查目录，
+    命中时直接返回与 12306-mcp 格式相同的结果。目录提供名称 / 拼音 / 首字母的前缀查找，
+    以及按坐标查找最近车站的网格索引（坐标来自导入文件和本地地点索引）。
+    """
+
+    def __init__(self, file_path: Optional[str] = None, refresh_interval: float = 86400):
+        self.file_path = file_path
+        self.refresh_interval = refresh_interval
+        self.stations: Dict[str, Station] = {}
+        self.by_name: Dict[str, str] = {}  # 规范化名称 -> 编码
+        self.by_city: Dict[str, List[str]] = {}  # 规范化城市 -> 编码
+        self.city_codes: Dict[str, str] = {}  # 规范化城市 -> 代表该城市的车站编码
+        self.complete_cities: set = set()  # 已从 get-stations-code-in-city 取得完整车站列表的城市
+        self.trie = StationTrie()
+        self.grid = StationGrid()
+        self.refreshed_at: Optional[float] = None  # 上次刷新的时间（time.time()）
+        self.dirty = False  # 有未写入快照的变化
+        self.stats_counts = {"hits": 0, "misses": 0, "learned": 0, "refreshes": 0, "refresh_errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "StationCatalog":
+        """
+        STATION_CATALOG_FILE 为车站目录快照路径（默认 station_catalog.json），设为空则不使用车站目录；
+        STATION_CATALOG_REFRESH_INTERVAL 为从 12306 刷新的间隔秒数（默认 86400）
+        """
+        return cls(os.environ.get("STATION_CATALOG_FILE", "station_catalog.json") or None,
+                   float(os.environ.get("STATION_CATALOG_REFRESH_INTERVAL", "86400")))
+
+    @property
+    def enabled(self) -> bool:
+        return self.file_path is not None
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def add(self, station: Station) -> None:
+        """加入或更新车站（已有的拼音、坐标、高铁标记保留）"""
+        existing = self.stations.get(station.code)
+        if existing is not None:
+            station.city = station.city or existing.city
+            station.pinyin = station.pinyin or existing.pinyin
+            station.short = station.short or existing.short
+            station.location = station.location or existing.location
+            station.high_speed = station.high_speed or existing.high_speed
+            if existing == station:
+                return
+        if not station.pinyin and lazy_pinyin is not None:
+            syllables = lazy_pinyin(station.name)
+            station.pinyin = "".join(syllables)
+            station.short = station.short or "".join(syllable[:1] for syllable in syllables)
+
+        self.stations[station.code] = station
+        self.dirty = True
+        name_key = normalize_station_name(station.name)
+        self.by_name[name_key] = station.code
+        for key in (name_key, station.pinyin.lower(), station.short.lower()):
+            if key:
+                self.trie.insert(key, station.code)
+        city_key = normalize_city(station.city)
+        if city_key:
+            codes = self.by_city.setdefault(city_key, [])
+            if station.code not in codes:
+                codes.append(station.code)
+            # 与城市同名的车站代表该城市（与 12306-mcp 的 get-station-code-of-citys 一致）
+            if name_key == city_key:
+                self.city_codes[city_key] = station.code
+        if station.location is not None:
+            self.grid.insert(station.code, station.location)
+
+    def _station_from_result(self, result: Any, city: Optional[str] = None) -> Optional[Station]:
+        if not isinstance(result, dict):
+            return None
+        code, name = result.get("station_code"), result.get("station_name")
+        if not isinstance(code, str) or not TELECODE_PATTERN.match(code) or not isinstance(name, str):
+            return None
+        return Station(code=code, name=name, city=result.get("city") or city or "",
+                       pinyin=result.get("station_pinyin") or "", short=result.get("station_short") or "")
+
+    def record_city_stations(self, city: str, content: Optional[str]) -> int:
+        """记录 get-stations-code-in-city 的结果（该城市的全部车站），返回记录的车站数"""
+        try:
+            data = json.loads(content or "")
+        except ValueError:
+            return 0
+        if isinstance(data, dict):
+            data = data.get("stations")
+        stations = [station for station in (self._station_from_result(item, city) for item in data or [])
+                    if station is not None] if isinstance(data, list) else []
+        for station in stations:
+            self.add(station)
+        if stations:
+            self.complete_cities.add(normalize_city(city))
+            self.stats_counts["learned"] += len(stations)
+        return len(stations)
+
+    def record_codes(self, content: Optional[str], city_keys: bool = False) -> None:
+        """
+        记录 get-station-code-of-citys（city_keys=True，键为城市）或 get-station-code-by-names 的结果：
+        {"名称": {"station_code": ..., "station_name": ...}}
+        """
+        try:
+            data = json.loads(content or "")
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        for key, result in data.items():
+            station = self._station_from_result(result, key if city_keys else None)
+            if station is None:
+                continue
+            self.add(station)
+            self.stats_counts["learned"] += 1
+            if city_keys:
+                self.city_codes[normalize_city(key)] = station.code
+
+    def record_station(self, content: Optional[str]) -> None:
+        """记录 get-station-by-telecode 的结果"""
+        try:
+            station = self._station_from_result(json.loads(content or ""))
+        except ValueError:
+            return
+        if station is not None:
+            self.add(station)
+            self.stats_counts["learned"] += 1
+
+    def record_tickets(self, content: Optional[str]) -> None:
+        """
+        从 get-tickets 的结果中标记有高铁 / 动车 / 城际车次停靠的车站
+        （与中转规划共用 parse_tickets：车次号取 start_train_code，车站取电报码）
+        """
+        for leg in parse_tickets(content):
+            if not leg.train_no.startswith(HIGH_SPEED_PREFIXES):
+                continue
+            for code in (leg.from_code, leg.to_code):
+                station = self.stations.get(code)
+                if station is not None and not station.high_speed:
+                    station.high_speed = True
+                    self.dirty = True
+
+    async def fill_locations(self, places: PlaceIndex) -> int:
+        """
+        用本地地点索引补全车站坐标（只查本地索引，不请求高德），返回补全的车站数
+
+        缺少坐标的车站在线程池中一次性批量查询索引，不阻塞事件循环；目录在事件循环上更新
+        """
+        if not places.enabled:
+            return 0
+        pending = [station for station in self.stations.values() if station.location is None]
+        results = await asyncio.to_thread(places.lookup_many, [
+            (normalize_station_name(station.name) + "站", station.city or None) for station in pending
+        ])
+        filled = 0
+        for station, result in zip(pending, results):
+            location = parse_location((result or {}).get("location"))
+            if location is not None:
+                station.location = location
+                self.grid.insert(station.code, location)
+                self.dirty = True
+                filled += 1
+        return filled
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def station(self, name: str) -> Optional[Station]:
+        """按车站名称精确查找（北京南 / 北京南站 均可）"""
+        code = self.by_name.get(normalize_station_name(name))
+        return self.stations.get(code) if code else None
+
+    def city_station(self, city: str) -> Optional[Station]:
+        """代表城市的车站（用于按城市查询余票）"""
+        code = self.city_codes.get(normalize_city(city))
+        return self.stations.get(code) if code else None
+
+    def city_stations(self, city: str) -> Optional[List[Station]]:
+        """城市的全部车站；没有取得该城市的完整列表时返回 None"""
+        city_key = normalize_city(city)
+        if city_key not in self.complete_cities:
+            return None
+        return [self.stations[code] for code in self.by_city.get(city_key, [])]
+
+    def resolve(self, place: str) -> Optional[Station]:
+        """把车站名或城市名解析为车站（先按车站名，再按城市）"""
+        return self.station(place) or self.city_station(place)
+
+    def search(self, query: str, city: Optional[str] = None, limit: int = 10) -> List[Station]:
+        """按名称、全拼或拼音首字母的前缀查找车站（可限定城市）"""
+        key = normalize_station_name(query)
+        if not key:
+            return []
+        city_key = normalize_city(city)
+        # 限定城市时多取一些候选再过滤
+        codes = self.trie.search(key, limit * 10 if city_key else limit)
+        stations = [self.stations[code] for code in codes]
+        if city_key:
+            stations = [station for station in stations if normalize_city(station.city) == city_key]
+        return stations[:limit]
+
+    def nearest(self, location: Tuple[float, float], limit: int = 5, radius_km: float = 50,
+                high_speed_only: bool = False) -> List[Tuple[Station, float]]:
+        """坐标附近最近的车站，返回 [(车站, 距离公里)]"""
+        accept = (lambda code: self.stations[code].high_speed) if high_speed_only else (lambda code: True)
+        return [(self.stations[code], distance)
+                for code, distance in self.grid.nearest(location, limit, radius_km, accept)]
+
+    def code_hint(self, *places: str) -> Optional[str]:
+        """为车票任务生成车站编码提示，地点都能在目录中解析时返回“长沙=CSQ，黄山=HKH”，否则返回 None"""
+        stations = [self.resolve(place) for place in places]
+        if not places or any(station is None for station in stations):
+            return None
+        return "，".join(f"{place}={station.code}" for place, station in zip(places, stations))
+
+    # ------------------------------------------------------------------
+    # 持久化与刷新
+    # ------------------------------------------------------------------
+    def load(self) -> int:
+        """从 JSON 快照加载目录，返回车站数；文件不存在或损坏时返回 0"""
+        if not self.enabled or not os.path.exists(self.file_path):
+            return 0
+        try:
+            with open(self.file_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"车站目录快照读取失败，忽略: {e}")
+            return 0
+        for record in data.get("stations", []):
+            location = parse_location(record.get("location"))
+            self.add(Station(**{**record, "location": location}))
+        self.city_codes.update(data.get("city_codes", {}))
+        self.complete_cities.update(data.get("complete_cities", []))
+        self.refreshed_at = data.get("refreshed_at")
+        self.dirty = False
+        return len(self.stations)
+
+    def save(self) -> None:
+        """写入 JSON 快照（先写临时文件再替换）"""
+        if not self.enabled:
+            return
+        data = {
+            "saved_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "refreshed_at": self.refreshed_at,
+            "stations": [asdict(station) for station in self.stations.values()],
+            "city_codes": self.city_codes,
+            "complete_cities": sorted(self.complete_cities),
+        }
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.file_path)
+        self.dirty = False
+
+    def next_refresh_delay(self) -> float:
+        """距下次刷新的秒数（从未刷新或已过期时为 0）"""
+        if self.refreshed_at is None:
+            return 0.0
+        return max(self.refreshed_at + self.refresh_interval - time.time(), 0.0)
+
+    async def refresh(self, call_tool: Callable[[str, Dict[str, Any]], Awaitable[Optional[str]]],
+                      cities: Optional[Iterable[str]] = None, concurrency: int = 1) -> int:
+        """
+        按城市从 12306-mcp 刷新车站列表
+
+        Args:
+            call_tool: call_tool(工具名, 参数) 返回工具结果文本
+            cities: 要刷新的城市，默认为 SEED_CITIES 加上目录中已有的城市
+            concurrency: 同时进行的查询数（默认 1：后台刷新最多占用一个 MCP 会话，不影响用户请求）
+
+        Returns:
+            刷新得到的车站数
+        """
+        if cities is None:
+            known = {station.city for station in self.stations.values() if station.city}
+            cities = list(dict.fromkeys((*SEED_CITIES, *sorted(known))))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(city: str) -> int:
+            async with semaphore:
+                return self.record_city_stations(city, await call_tool("get-stations-code-in-city", {"city": city}))
+
+        results = await asyncio.gather(*(fetch(city) for city in cities), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.stats_counts["refreshes"] += 1
+        self.stats_counts["refresh_errors"] += len(errors)
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        self.refreshed_at = time.time()
+        return sum(result for result in results if isinstance(result, int))
+
+    def import_file(self, path: str) -> int:
+        """
+        批量导入 CSV（带表头）或 JSONL 文件
+
+        每行的字段：code、name 必填，city、pinyin、short、location（"经度,纬度"）、high_speed 可选
+        """
+        with open(path, encoding="utf-8-sig") as f:
+            if path.endswith((".jsonl", ".json")):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                records = list(csv.DictReader(f))
+
+        count = 0
+        for record in records:
+            code, name = record.get("code"), record.get("name")
+            if not code or not name:
+                continue
+            high_speed = str(record.get("high_speed") or "").lower() in ("1", "true", "yes", "是")
+            self.add(Station(code=code, name=name, city=record.get("city") or "",
+                             pinyin=record.get("pinyin") or "", short=record.get("short") or "",
+                             location=parse_location(record.get("location")), high_speed=high_speed))
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """目录统计：车站数、有坐标的车站数、城市数与查询命中情况"""
+        lookups = self.stats_counts["hits"] + self.stats_counts["misses"]
+        return {
+            "enabled": self.enabled,
+            "stations": len(self.stations),
+            "located": sum(1 for station in self.stations.values() if station.location is not None),
+            "high_speed": sum(1 for station in self.stations.values() if station.high_speed),
+            "cities": len(self.by_city),
+            "refreshed_at": datetime.datetime.fromtimestamp(self.refreshed_at).isoformat(timespec="seconds")
+            if self.refreshed_at else None,
+            **self.stats_counts,
+            "hit_rate": round(self.stats_counts["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _local_result(tool: BaseTool, data: Any) -> Any:
+    content = json.dumps(data, ensure_ascii=False)
+    return (content, None) if tool.response_format == "content_and_artifact" else content
+
+
+def wrap_tools_with_station_catalog(tools: List[BaseTool], catalog: StationCatalog) -> List[BaseTool]:
+    """
+    12306 的车站编码工具先查本地车站目录，全部命中时返回与 12306-mcp 相同格式的结果；
+    未命中时请求 12306-mcp 并把结果写入目录。get-tickets 的结果用于标记高铁车站。其他工具保持原样
+    """
+    if not catalog.enabled:
+        return tools
+
+    def count(tool_name: str, hit: bool) -> None:
+        catalog.stats_counts["hits" if hit else "misses"] += 1
+        LOOKUPS.labels(tool_name, "hit" if hit else "miss").inc()
+
+    def make_citys_coroutine(tool, call_next):
+        async def citys_call(**arguments):
+            citys = [city for city in str(arguments.get("citys", "")).split("|") if city]
+            stations = [catalog.city_station(city) for city in citys]
+            hit = bool(citys) and all(station is not None for station in stations)
+            count(tool.name, hit)
+            if hit:
+                return _local_result(tool, {city: {"station_code": station.code, "station_name": station.name}
+                                            for city, station in zip(citys, stations)})
+            value = await call_next(**arguments)
+            catalog.record_codes(_tool_text(value), city_keys=True)
+            return value
+
+        return citys_call
+
+    def make_city_stations_coroutine(tool, call_next):
+        async def city_stations_call(**arguments):
+            city = str(arguments.get("city", ""))
+            stations = catalog.city_stations(city)
+            count(tool.name, bool(stations))
+            if stations:
+                return _local_result(tool, [station.to_result() for station in stations])
+            value = await call_next(**arguments)
+            catalog.record_city_stations(city, _tool_text(value))
+            return value
+
+        return city_stations_call
+
+    def make_names_coroutine(tool, call_next):
+        async def names_call(**arguments):
+            names = [name for name in str(arguments.get("stationNames", "")).split("|") if name]
+            stations = [catalog.station(name) for name in names]
+            hit = bool(names) and all(station is not None for station in stations)
+            count(tool.name, hit)
+            if hit:
+                return _local_result(tool, {name: {"station_code": station.code, "station_name": station.name}
+                                            for name, station in zip(names, stations)})
+            value = await call_next(**arguments)
+            catalog.record_codes(_tool_text(value))
+            return value
+
+        return names_call
+
+    def make_telecode_coroutine(tool, call_next):
+        async def telecode_call(**arguments):
+            station = catalog.stations.get(str(arguments.get("stationTelecode", "")))
+            count(tool.name, station is not None)
+            if station is not None:
+                return _local_result(tool, station.to_result())
+            value = await call_next(**arguments)
+            catalog.record_station(_tool_text(value))
+            return value
+
+        return telecode_call
+
+    def make_tickets_coroutine(tool, call_next):
+        async def tickets_call(**arguments):
+            value = await call_next(**arguments)
+            catalog.record_tickets(_tool_text(value))
+            return value
+
+        return tickets_call
+
+    factories = {
+        "get-station-code-of-citys": make_citys_coroutine,
+        "get-stations-code-in-city": make_city_stations_coroutine,
+        "get-station-code-by-names": make_names_coroutine,
+        "get-station-by-telecode": make_telecode_coroutine,
+        "get-tickets": make_tickets_coroutine,
+    }
+    return [wrap_tool_coroutine(tool, factories[tool.name]) if tool.name in factories else tool
+            for tool in tools]
+
+
+# 本地工具的名称：票务专家的车站查找、导航专家的最近车站查找
+SEARCH_STATIONS_TOOL = "search-stations-local"
+NEAREST_STATIONS_TOOL = "nearest_train_stations"
+
+
+class SearchStationsInput(BaseModel):
+    keyword: str = Field(description="车站名称、全拼或拼音首字母的开头部分，例如 北京南、beijingnan、bjn")
+    city: Optional[str] = Field(default=None, description="限定城市（可选），例如 北京")
+    limit: int = Field(default=10, description="最多返回的车站数")
+
+
+class NearestStationsInput(BaseModel):
+    location: str = Field(description="坐标，经度在前纬度在后，例如 116.397428,39.90923")
+    limit: int = Field(default=5, description="最多返回的车站数")
+    radius_km: float = Field(default=50, description="查找半径（公里）")
+    high_speed_only: bool = Field(default=False, description="只返回有高铁 / 动车停靠的车站")
+
+
+def build_station_tools(catalog: StationCatalog) -> Dict[str, BaseTool]:
+    """本地车站目录提供给专家的工具（不经过 12306 / 高德），目录未启用时返回空字典"""
+    if not catalog.enabled:
+        return {}
+
+    async def search_stations(keyword: str, city: Optional[str] = None, limit: int = 10) -> str:
+        stations = catalog.search(keyword, city, max(1, min(limit, 50)))
+        return json.dumps([station.to_result() for station in stations], ensure_ascii=False)
+
+    async def nearest_stations(location: str, limit: int = 5, radius_km: float = 50,
+                               high_speed_only: bool = False) -> str:
+        point = parse_location(location)
+        if point is None:
+            return json.dumps({"error": "坐标格式应为 经度,纬度"}, ensure_ascii=False)
+        results = catalog.nearest(point, max(1, min(limit, 20)), max(1.0, min(radius_km, 300.0)), high_speed_only)
+        return json.dumps([{**station.to_result(), "location": f"{station.location[0]:.6f},{station.location[1]:.6f}",
+                            "distance_km": round(distance, 2), "high_speed": station.high_speed}
+                           for station, distance in results], ensure_ascii=False)
+
+    # 与 MCP 工具一样使用 JSON schema，format_tools_info 可以列出参数
+    return {
+        SEARCH_STATIONS_TOOL: StructuredTool.from_function(
+            coroutine=search_stations, name=SEARCH_STATIONS_TOOL,
+            args_schema=SearchStationsInput.model_json_schema(),
+            description="在本地车站目录中按名称、全拼或拼音首字母的前缀查找 12306 车站及其 `station_code`，"
+                        "不请求 12306，适合车站名不完整或只知道拼音时使用。"),
+        NEAREST_STATIONS_TOOL: StructuredTool.from_function(
+            coroutine=nearest_stations, name=NEAREST_STATIONS_TOOL,
+            args_schema=NearestStationsInput.model_json_schema(),
+            description="根据坐标查找附近最近的火车站（可只查高铁站），返回车站名称、`station_code`、坐标和直线距离，"
+                        "用于确定离出发地 / 目的地最近的车站。"),
+    }
+
+
+# 进程内共享的车站目录
+station_catalog = StationCatalog.from_env()
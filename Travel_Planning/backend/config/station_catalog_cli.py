@@ -0,0 +1,68 @@
+# station_catalog_cli.py
+"""
+本地车站目录的命令行工具：批量导入、查找与统计
+
+用法（在 backend 目录下）：
+    # 批量导入（CSV 或 JSONL，字段：code, name, city, pinyin, short, location, high_speed）
+    python -m config.station_catalog_cli import stations.csv
+    python -m config.station_catalog_cli search bjn --city 北京
+    python -m config.station_catalog_cli nearest 116.397428,39.90923 --high-speed
+    python -m config.station_catalog_cli stats
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import List, Optional
+
+from .station_catalog import StationCatalog, parse_location
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="本地车站目录：批量导入、查找与统计")
+    parser.add_argument("--file", default=os.environ.get("STATION_CATALOG_FILE", "station_catalog.json"),
+                        help="车站目录快照")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="从 CSV / JSONL 文件批量导入车站（可带坐标）")
+    import_parser.add_argument("files", nargs="+", help="CSV（带表头）或 JSONL 文件")
+    search_parser = subparsers.add_parser("search", help="按名称 / 拼音 / 首字母前缀查找车站")
+    search_parser.add_argument("keyword", help="名称、全拼或拼音首字母的开头部分")
+    search_parser.add_argument("--city", help="城市")
+    nearest_parser = subparsers.add_parser("nearest", help="查找坐标附近最近的车站")
+    nearest_parser.add_argument("location", help="经度,纬度")
+    nearest_parser.add_argument("--radius", type=float, default=50, help="查找半径（公里）")
+    nearest_parser.add_argument("--high-speed", action="store_true", help="只查有高铁 / 动车停靠的车站")
+    subparsers.add_parser("stats", help="目录统计")
+    args = parser.parse_args(argv)
+
+    catalog = StationCatalog(args.file)
+    catalog.load()
+    if args.command == "import":
+        for path in args.files:
+            start = time.perf_counter()
+            count = catalog.import_file(path)
+            print(f"{path}: 导入 {count} 个车站，耗时 {time.perf_counter() - start:.2f}s")
+        catalog.save()
+    elif args.command == "search":
+        start = time.perf_counter()
+        stations = catalog.search(args.keyword, args.city)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(json.dumps([station.to_result() for station in stations], ensure_ascii=False, indent=2)
+              if stations else "未找到")
+        print(f"耗时 {elapsed:.0f}µs")
+    elif args.command == "nearest":
+        location = parse_location(args.location)
+        if location is None:
+            parser.error("坐标格式应为 经度,纬度")
+        start = time.perf_counter()
+        results = catalog.nearest(location, radius_km=args.radius, high_speed_only=args.high_speed)
+        elapsed = (time.perf_counter() - start) * 1e6
+        for station, distance in results:
+            print(f"{station.name}（{station.code}）{distance:.2f} 公里")
+        print(f"{'未找到' if not results else ''}耗时 {elapsed:.0f}µs")
+    print(json.dumps(catalog.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# ticket_parser.py
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+TIME_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})$')
+# 12306-mcp 文本格式的车次行：G1(实际车次train_no: 24000000G10I) 北京南(telecode: VNP) -> 上海虹桥(telecode: AOH) 07:00 -> 11:29 历时：04:29
+TICKET_TEXT_PATTERN = re.compile(
+    r'^(?P<train>[A-Z]?\d+)(?:[(（][^)）]*[)）])?\s+(?P<from_name>[^\s(（]+)\s*[(（]telecode:\s*(?P<from_code>[A-Z]{3})[)）]\s*->\s*'
+    r'(?P<to_name>[^\s(（]+)\s*[(（]telecode:\s*(?P<to_code>[A-Z]{3})[)）]\s*'
+    r'(?P<depart>\d{1,2}:\d{2})\s*->\s*(?P<arrive>\d{1,2}:\d{2})(?:\s*历时[：:]\s*(?P<duration>\d{1,2}:\d{2}))?')
+# 文本格式的席位行：- 二等座: 有票 553元 / - 一等座: 剩余3张票 1060元 / - 无座: 无票 553元
+SEAT_TEXT_PATTERN = re.compile(r'^\s*-\s*(?P<seat>[^:：]+)[:：]\s*(?P<num>\S+)\s+(?P<price>\d+(?:\.\d+)?)元')
+
+
+def _minutes(value: Any) -> Optional[int]:
+    """HH:MM -> 分钟数"""
+    match = TIME_PATTERN.match(str(value or "").strip())
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else None
+
+
+def _available(num: Any) -> bool:
+    """席位是否有票：无 / 无票 / 0 / -- 视为无票"""
+    return str(num).strip() not in ("", "无", "无票", "0", "--", "候补")
+
+
+@dataclass
+class TrainLeg:
+    """一段车次：时间为相对查询日期 0 点的分钟数（次日到达时 arrive 超过 1440）"""
+    train_no: str
+    from_code: str
+    from_name: str
+    to_code: str
+    to_name: str
+    depart: int
+    arrive: int
+    price: float  # 有票席位的最低票价，没有余票时为 nan
+    seats: str  # 席位与票价摘要
+
+    def to_result(self) -> Dict[str, Any]:
+        day, minute = divmod(self.arrive, 1440)
+        return {
+            "train_no": self.train_no,
+            "from_station": f"{self.from_name}({self.from_code})",
+            "to_station": f"{self.to_name}({self.to_code})",
+            "start_time": f"{self.depart // 60:02d}:{self.depart % 60:02d}",
+            "arrive_time": f"{minute // 60:02d}:{minute % 60:02d}" + (f"(+{day}天)" if day else ""),
+            "seats": self.seats,
+        }
+
+
+def _leg(train_no: str, from_code: str, from_name: str, to_code: str, to_name: str, depart: Optional[int],
+         arrive: Optional[int], duration: Optional[int], seats: List[Tuple[str, str, float]]) -> Optional[TrainLeg]:
+    if not train_no or depart is None or (arrive is None and duration is None):
+        return None
+    if duration is not None:
+        arrive = depart + duration
+    elif arrive < depart:
+        arrive += 1440
+    prices = [price for _, num, price in seats if _available(num)]
+    summary = "，".join(f"{seat} {num} {price:g}元" for seat, num, price in seats)
+    return TrainLeg(train_no, from_code, from_name or from_code, to_code, to_name or to_code, depart, arrive,
+                    min(prices) if prices else float("nan"), summary)
+
+
+def parse_tickets(content: Optional[str]) -> List[TrainLeg]:
+    """解析 get-tickets 的结果（JSON 或 12306-mcp 的文本格式），错误信息或无法识别的内容返回空列表"""
+    try:
+        data = json.loads(content or "")
+    except ValueError:
+        data = None
+
+    legs: List[Optional[TrainLeg]] = []
+    if data is not None:
+        tickets = data.get("tickets") if isinstance(data, dict) else data
+        for ticket in tickets if isinstance(tickets, list) else []:
+            if not isinstance(ticket, dict):
+                continue
+            seats = []
+            for seat in ticket.get("prices") or []:
+                try:
+                    seats.append((str(seat.get("seat_name")), str(seat.get("num")), float(seat.get("price"))))
+                except (TypeError, ValueError, AttributeError):
+                    continue
+            from_code = str(ticket.get("from_station_telecode") or ticket.get("from_station") or "")
+            to_code = str(ticket.get("to_station_telecode") or ticket.get("to_station") or "")
+            legs.append(_leg(str(ticket.get("start_train_code") or ticket.get("train_no") or ""),
+                             from_code, str(ticket.get("from_station_name") or from_code),
+                             to_code, str(ticket.get("to_station_name") or to_code),
+                             _minutes(ticket.get("start_time")), _minutes(ticket.get("arrive_time")),
+                             _minutes(ticket.get("lishi")), seats))
+        return [leg for leg in legs if leg is not None]
+
+    current: Optional[Dict[str, Any]] = None
+    for line in (content or "").splitlines():
+        match = TICKET_TEXT_PATTERN.match(line.strip())
+        if match:
+            if current is not None:
+                legs.append(_leg(**current))
+            current = {
+                "train_no": match.group("train"), "from_code": match.group("from_code"),
+                "from_name": match.group("from_name"), "to_code": match.group("to_code"),
+                "to_name": match.group("to_name"), "depart": _minutes(match.group("depart")),
+                "arrive": _minutes(match.group("arrive")), "duration": _minutes(match.group("duration")),
+                "seats": [],
+            }
+            continue
+        seat = SEAT_TEXT_PATTERN.match(line)
+        if seat and current is not None:
+            current["seats"].append((seat.group("seat").strip(), seat.group("num"), float(seat.group("price"))))
+    if current is not None:
+        legs.append(_leg(**current))
+    return [leg for leg in legs if leg is not None]
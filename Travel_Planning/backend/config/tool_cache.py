@@ -0,0 +1,179 @@
+# tool_cache.py
+
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from .agents_config import wrap_tool_coroutine
+
+# 按工具名匹配的缓存时长（秒），自上而下取第一条命中的规则；0 表示不缓存
+DEFAULT_TTL_POLICIES: List[Tuple[str, float]] = [
+    # 不缓存：当前日期、IP 定位
+    (r"^get-current-date$", 0),
+    (r"^maps_ip_location$", 0),
+    # 地理编码 / 逆地理编码：地点坐标基本不变
+    (r"^maps_(geo|regeocode)$", 7 * 24 * 3600),
+    # 12306 车站电报码、城市车站列表
+    (r"^get-station", 24 * 3600),
+    (r"^get-stations-code-in-city$", 24 * 3600),
+    # POI 搜索与详情
+    (r"^maps_(text_search|around_search|search_detail)$", 6 * 3600),
+    # 列车经停站
+    (r"^get-train-route-stations$", 3600),
+    # 天气
+    (r"^maps_weather$", 30 * 60),
+    # 路径规划、距离测量（受实时路况影响）
+    (r"^maps_(direction_\w+|distance)$", 15 * 60),
+    # 余票信息变化很快，只做秒级缓存
+    (r"^get-(interline-)?tickets$", 30),
+]
+
+
+def canonicalize_arguments(arguments: Any) -> Any:
+    """
+    规范化工具参数：字典按键排序、去掉值为 None 的参数、字符串做全角转半角并去除多余空白
+
+    Args:
+        arguments: 工具调用参数
+
+    Returns:
+        规范化后的参数
+    """
+    if isinstance(arguments, dict):
+        return {
+            str(k): canonicalize_arguments(v)
+            for k, v in sorted(arguments.items(), key=lambda item: str(item[0]))
+            if v is not None
+        }
+    elif isinstance(arguments, (list, tuple)):
+        return [canonicalize_arguments(i) for i in arguments]
+    elif isinstance(arguments, str):
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", arguments)).strip()
+    else:
+        return arguments
+
+
+def make_tool_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """由工具名和规范化后的参数生成缓存键"""
+    canonical = json.dumps(canonicalize_arguments(arguments), ensure_ascii=False,
+                           sort_keys=True, separators=(",", ":"))
+    return f"{tool_name}:{canonical}"
+
+
+class ToolResultCache:
+    """
+    MCP 工具调用结果缓存（TTL + LRU）
+
+    - 按工具名 + 规范化参数作为缓存键
+    - 每个工具按 TTL 规则确定缓存时长
+    - 超出容量时淘汰最久未使用的条目
+    - 统计命中、未命中、淘汰、过期次数
+    """
+
+    def __init__(self, max_entries: int = 2048,
+                 ttl_policies: Optional[List[Tuple[str, float]]] = None,
+                 default_ttl: float = 60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttl_policies = [(re.compile(pattern), ttl)
+                             for pattern, ttl in (ttl_policies or DEFAULT_TTL_POLICIES)]
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, tool_name: str) -> float:
+        """返回指定工具的缓存时长（秒）"""
+        for pattern, ttl in self.ttl_policies:
+            if pattern.search(tool_name):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 缓存值)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """写入缓存，超出容量时按 LRU 淘汰"""
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """清空缓存（统计计数保留）"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def wrap_tools_with_cache(tools: List[BaseTool], cache: ToolResultCache) -> List[BaseTool]:
+    """
+    为工具列表加上结果缓存，TTL 为 0 的工具保持原样
+
+    Args:
+        tools: list_and_return_tools 返回的工具列表
+        cache: 结果缓存实例
+
+    Returns:
+        包装后的工具列表
+    """
+
+    def make_coroutine(tool, call_next):
+        ttl = cache.ttl_for(tool.name)
+
+        async def cached_call(**arguments):
+            key = make_tool_key(tool.name, arguments)
+            found, value = cache.get(key)
+            if found:
+                return value
+            # 调用失败会直接抛出异常，不会写入缓存
+            value = await call_next(**arguments)
+            cache.set(key, value, ttl)
+            return value
+
+        return cached_call
+
+    return [
+        wrap_tool_coroutine(tool, make_coroutine) if cache.ttl_for(tool.name) > 0 else tool
+        for tool in tools
+    ]
+
+
+# 进程内共享的工具结果缓存，不同用户的请求共用
+tool_result_cache = ToolResultCache(max_entries=int(os.environ.get("TOOL_CACHE_MAX_ENTRIES", "2048")))
@@ -0,0 +1,139 @@
+# tool_catalog.py
+
+import datetime
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from mcp import types
+
+CATALOG_VERSION = 1
+# 每个服务最多保留的快照数（不同配置各一份），超出时删除最久未更新的
+MAX_ENTRIES_PER_SERVER = 2
+
+
+def connection_fingerprint(connection: Dict[str, Any]) -> str:
+    """
+    MCP 服务配置的指纹：启动命令与参数（包含 npx 包名及其版本号）、URL 和传输方式，
+    不包含 env（API Key 变化不影响工具定义），URL 不包含端口（本地服务每次启动的端口可能不同）
+    """
+    relevant = {key: connection.get(key) for key in ("command", "args", "url", "transport")}
+    if relevant["url"]:
+        url = urlsplit(relevant["url"])
+        relevant["url"] = url._replace(netloc=url.hostname or "").geturl()
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_key(server_name: str, connection: Dict[str, Any]) -> str:
+    # 同一个服务的不同配置（例如基准测试的替身服务）各自保留快照
+    return f"{server_name}@{connection_fingerprint(connection)[:16]}"
+
+
+def tool_specs(mcp_tools: List[types.Tool]) -> List[Dict[str, Any]]:
+    return [tool.model_dump(mode="json", exclude_none=True) for tool in mcp_tools]
+
+
+class ToolCatalog:
+    """
+    MCP 工具目录的磁盘快照
+
+    按服务名和配置指纹记录服务端在 initialize 中报告的名称与版本，以及 list_tools 返回的工具定义。
+    启动时配置指纹一致即可直接用快照构建工作流，不必等待 MCP 服务（npx）启动；
+    服务连上后再用实时的工具定义和服务版本校验快照，不一致时更新快照。
+    """
+
+    def __init__(self, file_path: Optional[str] = None):
+        self.file_path = file_path
+
+    @classmethod
+    def from_env(cls) -> "ToolCatalog":
+        """TOOL_CATALOG_FILE 为快照路径（默认 tool_catalog.json），设为空则不使用快照"""
+        return cls(os.environ.get("TOOL_CATALOG_FILE", "tool_catalog.json") or None)
+
+    def _read(self) -> Dict[str, Any]:
+        if not self.file_path or not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"工具目录快照读取失败，忽略快照: {e}")
+            return {}
+        return data if data.get("version") == CATALOG_VERSION else {}
+
+    def load(self, connections: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, List[types.Tool]]]:
+        """
+        读取与当前配置匹配的快照
+
+        Returns:
+            {服务名: 工具定义列表}；任一服务没有快照或配置指纹不一致时返回 None
+        """
+        servers = self._read().get("servers", {})
+        result = {}
+        for server_name, connection in connections.items():
+            entry = servers.get(_entry_key(server_name, connection))
+            if not entry:
+                return None
+            try:
+                result[server_name] = [types.Tool.model_validate(spec) for spec in entry["tools"]]
+            except Exception as e:
+                print(f"工具目录快照中 {server_name} 的工具定义无效，忽略快照: {e}")
+                return None
+        return result
+
+    def diff(self, server_name: str, connection: Dict[str, Any], mcp_tools: List[types.Tool],
+             server_info: Optional[types.Implementation]) -> List[str]:
+        """比较快照与实时的工具定义和服务版本，返回差异说明（一致时为空列表）"""
+        entry = self._read().get("servers", {}).get(_entry_key(server_name, connection)) or {}
+        changes = []
+        live_version = server_info.version if server_info else None
+        snapshot_version = (entry.get("server_info") or {}).get("version")
+        if live_version and live_version != snapshot_version:
+            changes.append(f"服务版本 {snapshot_version} -> {live_version}")
+
+        snapshot = {spec["name"]: spec for spec in entry.get("tools", [])}
+        live = {spec["name"]: spec for spec in tool_specs(mcp_tools)}
+        for name in sorted(live.keys() - snapshot.keys()):
+            changes.append(f"新增工具 {name}")
+        for name in sorted(snapshot.keys() - live.keys()):
+            changes.append(f"移除工具 {name}")
+        for name in sorted(live.keys() & snapshot.keys()):
+            if live[name] != snapshot[name]:
+                changes.append(f"工具 {name} 的定义已变化")
+        return changes
+
+    def save(self, connections: Dict[str, Dict[str, Any]], tools: Dict[str, List[types.Tool]],
+             server_infos: Dict[str, Optional[types.Implementation]]) -> None:
+        """写入快照（先写临时文件再替换）；只更新给定的服务，其余服务的快照保留"""
+        if not self.file_path:
+            return
+        data = self._read() or {"version": CATALOG_VERSION, "servers": {}}
+        for server_name, mcp_tools in tools.items():
+            info = server_infos.get(server_name)
+            data["servers"][_entry_key(server_name, connections[server_name])] = {
+                "server_info": info.model_dump(mode="json", exclude_none=True) if info else None,
+                "updated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "tools": tool_specs(mcp_tools),
+            }
+            self._evict(data["servers"], server_name)
+        tmp_path = f"{self.file_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            print(f"工具目录快照写入失败: {e}")
+
+    @staticmethod
+    def _evict(servers: Dict[str, Any], server_name: str) -> None:
+        """同一服务只保留最近更新的 MAX_ENTRIES_PER_SERVER 份快照，已不再使用的配置不会一直留在文件中"""
+        keys = sorted((key for key in servers if key.rsplit("@", 1)[0] == server_name),
+                      key=lambda key: servers[key].get("updated_at") or "", reverse=True)
+        for key in keys[MAX_ENTRIES_PER_SERVER:]:
+            del servers[key]
+
+
+# 进程内共享的工具目录快照
+tool_catalog = ToolCatalog.from_env()
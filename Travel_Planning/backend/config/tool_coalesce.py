@@ -0,0 +1,118 @@
+# tool_coalesce.py
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List
+
+from langchain_core.tools import BaseTool
+from prometheus_client import Counter
+
+from .agents_config import wrap_tool_coroutine
+from .tool_cache import make_tool_key
+
+COALESCED_CALLS = Counter("travel_tool_coalesced_calls_total", "合并到进行中的相同工具调用的次数", ["tool"])
+UPSTREAM_CALLS = Counter("travel_tool_upstream_calls_total", "经过合并层实际发往 MCP 服务的工具调用次数", ["tool"])
+
+
+class ToolCallCoalescer:
+    """
+    相同工具调用的单飞合并（single-flight）
+
+    - 按工具名 + 规范化参数（与结果缓存相同的键）识别相同的调用
+    - 同一时刻只向 MCP 服务发出一次调用，之后到达的相同调用等待这次调用的结果
+    - 调用失败时所有等待方收到同一个异常，结果不会保留（下一次调用重新请求）
+    - 某个等待方被取消（例如客户端断开）不影响其他等待方；所有等待方都取消时才取消上游调用
+
+    与 TTL 缓存互补：缓存只在调用完成后生效，合并覆盖高峰期同一秒内的大量相同请求（例如相同线路和日期的余票查询）。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.stats_counts = {"upstream_calls": 0, "coalesced": 0, "shared_errors": 0, "cancelled_upstream": 0}
+
+    @classmethod
+    def from_env(cls) -> "ToolCallCoalescer":
+        """TOOL_COALESCE 为 0 时不合并（默认开启）"""
+        return cls(os.environ.get("TOOL_COALESCE", "1") not in ("", "0"))
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        """上游调用结束：失败时记录有多个等待方共享的错误，并移出进行中的调用"""
+        if not task.cancelled() and task.exception() is not None and self._waiters.get(key, 0) > 1:
+            self.stats_counts["shared_errors"] += 1
+        self._forget(key, task)
+
+    async def call(self, tool_name: str, arguments: Dict[str, Any],
+                   call_next: Callable[..., Awaitable[Any]]) -> Any:
+        """调用工具：有相同的调用正在进行时等待它的结果，否则发起调用"""
+        key = make_tool_key(tool_name, arguments)
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is not asyncio.get_running_loop():
+            # 其他事件循环中遗留的调用（例如事件循环已关闭）不能等待
+            task = None
+        if task is None:
+            # 上游调用放在独立的任务中，发起方被取消时不会连带取消其他等待方
+            task = asyncio.ensure_future(call_next(**arguments))
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+            self.stats_counts["upstream_calls"] += 1
+            UPSTREAM_CALLS.labels(tool_name).inc()
+        else:
+            self.stats_counts["coalesced"] += 1
+            COALESCED_CALLS.labels(tool_name).inc()
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] <= 0:
+                    # 所有等待方都已取消：取消上游调用（会话池会通知 MCP 服务放弃该请求）
+                    self.stats_counts["cancelled_upstream"] += 1
+                    self._forget(key, task)
+                    task.cancel()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.stats_counts["upstream_calls"] + self.stats_counts["coalesced"]
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            **self.stats_counts,
+            "coalesce_rate": round(self.stats_counts["coalesced"] / calls, 4) if calls else 0.0,
+        }
+
+
+def wrap_tools_with_coalescing(tools: List[BaseTool], coalescer: ToolCallCoalescer) -> List[BaseTool]:
+    """
+    为 list_and_return_tools 返回的工具加上单飞合并，合并未启用时原样返回
+
+    Args:
+        tools: MCP 工具列表
+        coalescer: 进程内共享的合并器
+
+    Returns:
+        包装后的工具列表
+    """
+    if not coalescer.enabled:
+        return tools
+
+    def make_coroutine(tool, call_next):
+        async def coalesced_call(**arguments):
+            return await coalescer.call(tool.name, arguments, call_next)
+
+        return coalesced_call
+
+    return [wrap_tool_coroutine(tool, make_coroutine) for tool in tools]
+
+
+# 进程内共享的合并器，不同用户的请求共用
+tool_coalescer = ToolCallCoalescer.from_env()
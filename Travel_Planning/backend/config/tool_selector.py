@@ -0,0 +1,203 @@
+# tool_selector.py
+
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from prometheus_client import Counter
+
+from .agents_config import format_tools_info
+from .context_builder import estimate_tokens
+from .query_parser import parse_query
+from .station_catalog import NEAREST_STATIONS_TOOL, SEARCH_STATIONS_TOOL
+from .transfer_planner import TRANSFER_TOOL
+
+# 路径规划：出行方式 -> 工具
+ROUTE_TOOLS = {
+    "driving": ("maps_direction_driving",),
+    "transit": ("maps_direction_transit_integrated", "maps_direction_walking"),
+    "walking": ("maps_direction_walking",),
+    "bicycling": ("maps_direction_bicycling",),
+}
+
+# 导航专家：总是需要地理编码（地址 -> 坐标）
+NAVIGATION_BASE_TOOLS = ("maps_geo",)
+
+# 导航专家：(关键词, 需要的工具)
+NAVIGATION_TOOL_RULES: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = [
+    (("天气", "气温", "下雨", "下雪"), ("maps_weather",)),
+    (("附近", "周边", "周围"), ("maps_around_search", "maps_search_detail")),
+    (("景点", "酒店", "住宿", "餐厅", "美食", "搜索", "推荐", "门票", "开放时间", "地址"),
+     ("maps_text_search", "maps_search_detail")),
+    (("距离", "多远", "公里"), ("maps_distance",)),
+    (("我在哪", "当前位置", "所在城市", "定位", "坐标"), ("maps_ip_location", "maps_regeocode")),
+    (("火车站", "高铁站", "车站", "最近的站"), (NEAREST_STATIONS_TOOL,)),
+]
+
+# 未指定出行方式的路线请求
+ROUTE_KEYWORDS = ("路线", "导航", "怎么走", "怎么去", "如何去", "如何到达", "交通")
+
+# 票务专家：查询余票的基本流程（当前日期 -> 车站编码 -> 余票），没有直达车次时用中转规划
+TICKETING_BASE_TOOLS = ("get-current-date", "get-station-code-of-citys", "get-stations-code-in-city",
+                        "get-station-code-by-names", "get-tickets", TRANSFER_TOOL)
+
+TICKETING_TOOL_RULES: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = [
+    (("中转", "换乘", "转车", "联程"), ("get-interline-tickets",)),
+    (("经停", "途经", "停靠", "停站", "时刻表"), ("get-train-route-stations",)),
+    (("电报码",), ("get-station-by-telecode",)),
+    (("拼音", "哪个站", "哪些站", "车站"), (SEARCH_STATIONS_TOOL,)),
+]
+
+# 本地车站目录与中转规划提供的工具：未启用时不存在，选择时直接略过（不因此放弃裁剪）
+OPTIONAL_TOOLS = (NEAREST_STATIONS_TOOL, SEARCH_STATIONS_TOOL, TRANSFER_TOOL)
+
+TICKET_KEYWORDS = ("车票", "车次", "余票", "票务", "高铁", "动车", "火车", "列车", "12306")
+
+SELECTIONS = Counter("travel_expert_tool_selection_total", "专家代理按任务选择工具子集的次数",
+                     ["expert", "mode"])
+TOKENS_SAVED = Counter("travel_expert_prompt_tokens_saved_total",
+                       "工具裁剪节省的专家提示词 token（按模型调用次数累计）", ["expert"])
+
+
+def select_navigation_tools(task: str) -> Optional[List[str]]:
+    """按任务选择导航专家需要的工具，无法判断时返回 None（使用全部工具）"""
+    selected = list(NAVIGATION_BASE_TOOLS)
+    parsed = parse_query(task)
+    if parsed.transport_mode in ROUTE_TOOLS:
+        selected.extend(ROUTE_TOOLS[parsed.transport_mode])
+    elif any(keyword in task for keyword in ROUTE_KEYWORDS):
+        selected.extend(name for names in ROUTE_TOOLS.values() for name in names)
+
+    for keywords, names in NAVIGATION_TOOL_RULES:
+        if any(keyword in task for keyword in keywords):
+            selected.extend(names)
+    return selected if len(selected) > len(NAVIGATION_BASE_TOOLS) else None
+
+
+def select_ticketing_tools(task: str) -> Optional[List[str]]:
+    """按任务选择票务专家需要的工具，不像车票查询的任务返回 None（使用全部工具）"""
+    if not any(keyword in task for keyword in TICKET_KEYWORDS):
+        return None
+    selected = list(TICKETING_BASE_TOOLS)
+    for keywords, names in TICKETING_TOOL_RULES:
+        if any(keyword in task for keyword in keywords):
+            selected.extend(names)
+    return selected
+
+
+TOOL_SELECTORS: Dict[str, Callable[[str], Optional[List[str]]]] = {
+    "navigation_expert": select_navigation_tools,
+    "ticketing_expert": select_ticketing_tools,
+}
+
+
+def prompt_tokens(prompt: str, tools: Sequence[BaseTool]) -> int:
+    """估算每次模型调用中系统提示词与绑定的工具 schema 占用的 token"""
+    schemas = [convert_to_openai_tool(tool) for tool in tools]
+    return estimate_tokens(prompt) + estimate_tokens(json.dumps(schemas, ensure_ascii=False))
+
+
+class PrunedExpert:
+    """
+    按任务裁剪工具的专家代理
+
+    每次调用根据任务（最后一条消息）选出需要的工具子集，只把这些工具的说明放进系统提示词、
+    只绑定这些工具的 schema；选不出子集或子集缺少工具时使用全部工具。
+    每个工具子集对应的 ReAct 代理编译一次后缓存。
+
+    接口与 create_react_agent 返回的代理相同（ainvoke），可以直接交给 agent_node。
+    """
+
+    def __init__(self, name: str, tools: List[BaseTool],
+                 build_agent: Callable[[List[BaseTool], str], Any],
+                 render_prompt: Callable[[str], str],
+                 selector: Optional[Callable[[str], Optional[List[str]]]] = None,
+                 enabled: Optional[bool] = None, max_variants: int = 32):
+        """
+        Args:
+            name: 专家名称
+            tools: 全部工具
+            build_agent: build_agent(工具子集, 工具说明) 返回编译好的 ReAct 代理
+            render_prompt: render_prompt(工具说明) 返回系统提示词，用于估算节省的 token
+            selector: 任务 -> 工具名称列表（None 表示全部工具），默认按专家名称选择
+            enabled: 是否裁剪，默认按 TOOL_PRUNING 环境变量（默认开启）
+            max_variants: 缓存的代理数量上限
+        """
+        self.name = name
+        self.tools = tools
+        self.build_agent = build_agent
+        self.render_prompt = render_prompt
+        self.selector = selector or TOOL_SELECTORS.get(name)
+        if enabled is None:
+            enabled = os.environ.get("TOOL_PRUNING", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled and self.selector is not None
+        self.max_variants = max_variants
+        self._variants: "OrderedDict[Tuple[str, ...], Tuple[Any, int]]" = OrderedDict()
+        self._full_key = tuple(tool.name for tool in tools)
+        # 全部工具的代理在启动时编译，首个请求不需要等待
+        self._full = self._compile(self._full_key)
+        self.stats = {"calls": 0, "pruned": 0, "full": 0, "llm_calls": 0, "tokens_saved": 0}
+
+    def _compile(self, key: Tuple[str, ...]) -> Tuple[Any, int]:
+        """编译工具子集对应的代理，返回 (代理, 每次模型调用的提示词 token)"""
+        tools = [tool for tool in self.tools if tool.name in key]
+        tools_info = format_tools_info(tools)
+        return self.build_agent(tools, tools_info), prompt_tokens(self.render_prompt(tools_info), tools)
+
+    def _variant(self, key: Tuple[str, ...]) -> Tuple[Any, int]:
+        if key == self._full_key:
+            return self._full
+        if key not in self._variants:
+            self._variants[key] = self._compile(key)
+            if len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        self._variants.move_to_end(key)
+        return self._variants[key]
+
+    def select(self, task: str) -> Tuple[str, ...]:
+        """返回本次任务使用的工具名称（按原始顺序）"""
+        if not self.enabled:
+            return self._full_key
+        names = self.selector(task)
+        if not names:
+            return self._full_key
+        available = {tool.name for tool in self.tools}
+        names = [name for name in names if name in available or name not in OPTIONAL_TOOLS]
+        # 规则中的工具在当前 MCP 服务中不存在（例如服务升级改名）时，不冒险裁剪
+        if not set(names) <= available:
+            return self._full_key
+        return tuple(name for name in self._full_key if name in names)
+
+    async def ainvoke(self, state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        messages = state.get("messages") or []
+        task = str(getattr(messages[-1], 'content', '')) if messages else ""
+        key = self.select(task)
+        agent, tokens = self._variant(key)
+
+        response = await agent.ainvoke(state, config)
+
+        # 每轮 ReAct 循环调用一次模型，每次都携带系统提示词与工具 schema
+        llm_calls = sum(1 for msg in response["messages"][len(messages):] if msg.type == "ai")
+        saved = max(self._full[1] - tokens, 0) * llm_calls
+        pruned = key != self._full_key
+        self.stats["calls"] += 1
+        self.stats["pruned" if pruned else "full"] += 1
+        self.stats["llm_calls"] += llm_calls
+        self.stats["tokens_saved"] += saved
+        SELECTIONS.labels(self.name, "pruned" if pruned else "full").inc()
+        if saved:
+            TOKENS_SAVED.labels(self.name).inc(saved)
+        return response
+
+    def summary(self) -> Dict[str, Any]:
+        """裁剪统计：调用次数、裁剪次数、节省的 token 以及平均每次模型调用节省的 token"""
+        return {
+            **self.stats,
+            "full_prompt_tokens": self._full[1],
+            "saved_per_llm_call": round(self.stats["tokens_saved"] / self.stats["llm_calls"], 1)
+            if self.stats["llm_calls"] else 0.0,
+            "variants": len(self._variants),
+        }
@@ -0,0 +1,305 @@
+# tracing.py
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import aiofiles
+import aiofiles.os
+import httpx
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .accounting import estimate_prompt_tokens, llm_result_usage
+
+# 记录为节点 span 的图节点
+TRACED_NODES = ("preparser", "supervisor", "navigation_expert", "ticketing_expert", "door_to_door")
+
+# 属性值的最大长度，避免把完整的工具结果写进追踪数据
+MAX_ATTRIBUTE_CHARS = 500
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _truncate(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= MAX_ATTRIBUTE_CHARS else text[:MAX_ATTRIBUTE_CHARS] + "…"
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """转换为 OTLP JSON 的 AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": _truncate(value)}
+
+
+class Span:
+    """一个追踪区间（OTLP 的 Span 的子集）"""
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status_code = 0
+        self.status_message = ""
+
+    def end(self, attributes: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.attributes.update(attributes or {})
+        self.status_code = STATUS_ERROR if error else STATUS_OK
+        self.status_message = error or ""
+        self.end_ns = time.time_ns()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)}
+                           for key, value in self.attributes.items() if value is not None],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class RequestTrace:
+    """
+    一次请求的追踪：根 span 对应整个请求，图节点、模型调用和工具调用的 span 挂在其下
+
+    请求 ID 即 OTLP 的 traceId（32 位十六进制）
+    """
+
+    def __init__(self, request_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.root = self.start_span("travel.request", kind=SPAN_KIND_SERVER,
+                                    attributes={"request.id": self.request_id, **(attributes or {})})
+
+    def start_span(self, name: str, parent_id: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL,
+                   attributes: Optional[Dict[str, Any]] = None) -> Span:
+        span = Span(self.request_id, name, parent_id, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    def finish(self, outcome: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        """结束请求；被取消时仍未结束的 span 一并标记为错误"""
+        for span in self.spans:
+            if span is not self.root and span.end_ns is None:
+                span.end(error=outcome)
+        self.root.end({"request.outcome": outcome, **(attributes or {})},
+                      error=None if outcome == "completed" else outcome)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """生成 OTLP/HTTP JSON 格式的 ExportTraceServiceRequest"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name",
+                     "value": {"stringValue": os.environ.get("OTEL_SERVICE_NAME", "travel-planning-agent")}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "config.tracing"},
+                    "spans": [span.to_otlp() for span in self.spans],
+                }],
+            }],
+        }
+
+
+class TraceCallbackHandler(AsyncCallbackHandler):
+    """
+    通过 LangChain 回调生成 span：
+
+    - 图节点：每次 agent_node / preparse_node 运行一个 span
+    - 模型调用：每次 ChatTongyi 调用一个 span（模型名、消息数、token 数、输出长度）
+    - 工具调用：每次 MCP 工具调用一个 span（工具名、参数、结果长度、是否失败）
+
+    其余的中间运行（路由、ReAct 子图内部的链等）不单独记录，其子运行挂到最近的已记录祖先下。
+    """
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._parents: Dict[UUID, str] = {}  # run_id -> 最近的已记录 span 的 id
+        self._spans: Dict[UUID, Span] = {}
+        self._node_runs: Dict[str, UUID] = {}  # checkpoint_ns -> 节点 span 对应的 run_id
+        self._prompt_tokens: Dict[UUID, int] = {}
+
+    def _parent_of(self, parent_run_id: Optional[UUID]) -> str:
+        return self._parents.get(parent_run_id, self.trace.root.span_id)
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: int,
+               attributes: Dict[str, Any]) -> None:
+        span = self.trace.start_span(name, self._parent_of(parent_run_id), kind, attributes)
+        self._spans[run_id] = span
+        self._parents[run_id] = span.span_id
+
+    def _end(self, run_id: UUID, attributes: Optional[Dict[str, Any]] = None,
+             error: Optional[str] = None) -> None:
+        self._parents.pop(run_id, None)
+        for checkpoint_ns in [ns for ns, node_run in self._node_runs.items() if node_run == run_id]:
+            del self._node_runs[checkpoint_ns]
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.end(attributes, error)
+
+    async def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *,
+                             run_id: UUID, parent_run_id: Optional[UUID] = None,
+                             metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        name = kwargs.get("name")
+        checkpoint_ns = metadata.get("langgraph_checkpoint_ns", "")
+        # 专家的 ReAct 子图与节点共用同一个 checkpoint_ns，只为外层的节点运行记录 span
+        if (name in TRACED_NODES and metadata.get("langgraph_node") == name
+                and "|" not in checkpoint_ns and checkpoint_ns not in self._node_runs):
+            self._node_runs[checkpoint_ns] = run_id
+            inputs = inputs if isinstance(inputs, dict) else {}
+            messages = inputs.get("messages") or []
+            self._start(run_id, parent_run_id, f"node {name}", SPAN_KIND_INTERNAL, {
+                "graph.node": name,
+                "graph.step": metadata.get("langgraph_step"),
+                "node.subtask": inputs.get("subtask"),
+                "node.input_messages": len(messages),
+                "node.task": str(getattr(messages[-1], 'content', ''))[:200] if messages else None,
+            })
+        else:
+            self._parents[run_id] = self._parent_of(parent_run_id)
+
+    async def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._spans:
+            self._parents.pop(run_id, None)
+            return
+        messages = (outputs.get("messages") or []) if isinstance(outputs, dict) else []
+        content = str(getattr(messages[-1], 'content', '')) if messages else ""
+        self._end(run_id, {"node.output_chars": len(content),
+                           "node.failed": content.startswith("[错误]") or "\n[错误]" in content[:200]})
+
+    async def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=f"{error.__class__.__name__}: {error}")
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                                  run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = (params.get("model_name") or params.get("model")
+                 or (serialized or {}).get("name") or kwargs.get("name") or "llm")
+        self._prompt_tokens[run_id] = estimate_prompt_tokens(messages)
+        self._start(run_id, parent_run_id, f"llm {model}", SPAN_KIND_CLIENT, {
+            "llm.model": model,
+            "llm.prompt_messages": sum(len(batch) for batch in messages),
+        })
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        prompt_tokens, completion_tokens = llm_result_usage(response, self._prompt_tokens.pop(run_id, 0))
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, 'message', None)
+        self._end(run_id, {
+            "llm.prompt_tokens": prompt_tokens,
+            "llm.completion_tokens": completion_tokens,
+            "llm.output_chars": len(generation.text or "") if generation else 0,
+            "llm.tool_calls": len(getattr(message, 'tool_calls', None) or []),
+        })
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._prompt_tokens.pop(run_id, None)
+        self._end(run_id, error=f"{error.__class__.__name__}: {error}")
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *,
+                            run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            inputs: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, f"tool {name}", SPAN_KIND_CLIENT, {
+            "tool.name": name,
+            "tool.arguments": inputs if inputs is not None else input_str,
+        })
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        content = str(getattr(output, 'content', output))
+        failed = getattr(output, 'status', None) == "error"
+        self._end(run_id, {"tool.output_chars": len(content)}, error=content[:200] if failed else None)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=f"{error.__class__.__name__}: {error}")
+
+
+class TraceExporter:
+    """
+    导出请求追踪：默认以 OTLP JSON 逐行追加到本地文件（TRACE_FILE），
+    配置了 OTEL_EXPORTER_OTLP_TRACES_ENDPOINT / OTEL_EXPORTER_OTLP_ENDPOINT 时同时发送到采集器
+
+    文件超过 max_bytes 时轮转：当前文件改名为 <TRACE_FILE>.1（覆盖上一份备份）后重新开始写，
+    磁盘占用不超过 max_bytes 的两倍左右
+    """
+
+    def __init__(self, file_path: Optional[str] = None, endpoint: Optional[str] = None,
+                 enabled: bool = True, timeout: float = 5, max_bytes: int = 50 * 1024 * 1024):
+        self.file_path = file_path
+        self.endpoint = endpoint
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._pending = set()
+
+    @classmethod
+    def from_env(cls) -> "TraceExporter":
+        endpoint = os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+        if not endpoint and os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            endpoint = os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"].rstrip("/") + "/v1/traces"
+        return cls(
+            file_path=os.environ.get("TRACE_FILE", "traces.jsonl") or None,
+            endpoint=endpoint,
+            enabled=os.environ.get("TRACING_ENABLED", "true").lower() not in ("0", "false", "no"),
+            max_bytes=int(os.environ.get("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)) or 0),
+        )
+
+    def submit(self, trace: RequestTrace) -> None:
+        """在后台导出（不阻塞请求的结束，也不受请求取消的影响）"""
+        if not self.enabled:
+            return
+        task = asyncio.ensure_future(self.export(trace))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def export(self, trace: RequestTrace) -> None:
+        payload = trace.to_otlp()
+        try:
+            if self.file_path:
+                line = json.dumps(payload, ensure_ascii=False) + "\n"
+                async with self._lock:
+                    async with aiofiles.open(self.file_path, mode='a', encoding='utf-8') as f:
+                        await f.write(line)
+                        size = await f.tell()
+                    if 0 < self.max_bytes <= size:
+                        await aiofiles.os.replace(self.file_path, f"{self.file_path}.1")
+            if self.endpoint:
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.post(self.endpoint, json=payload)
+                    response.raise_for_status()
+        except Exception as e:
+            print(f"导出请求 {trace.request_id} 的追踪数据失败: {e}")
+
+
+# 进程内共享的导出器
+trace_exporter = TraceExporter.from_env()
@@ -0,0 +1,367 @@
+# transfer_planner.py
+
+import asyncio
+import json
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.tools import BaseTool, StructuredTool
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel, Field
+
+from .station_catalog import TELECODE_PATTERN, StationCatalog, haversine_km
+from .ticket_parser import TrainLeg, parse_tickets
+
+PLANS = Counter("travel_transfer_plans_total", "中转方案规划的次数", ["result"])
+JOIN_SECONDS = Histogram("travel_transfer_join_seconds", "两段车次拼接（向量化计算）的耗时",
+                         buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1))
+
+TRANSFER_TOOL = "plan-transfer-tickets"
+
+# 全国主要铁路枢纽城市（按枢纽等级排列）及城市中心坐标，用于挑选中转站
+HUB_CITIES: Tuple[Tuple[str, float, float], ...] = (
+    ("郑州", 113.625, 34.747), ("武汉", 114.305, 30.593), ("北京", 116.407, 39.904), ("上海", 121.473, 31.230),
+    ("广州", 113.264, 23.129), ("南京", 118.797, 32.060), ("长沙", 112.939, 28.228), ("西安", 108.940, 34.342),
+    ("成都", 104.066, 30.573), ("重庆", 106.551, 29.563), ("杭州", 120.155, 30.274), ("合肥", 117.227, 31.821),
+    ("济南", 117.121, 36.651), ("徐州", 117.284, 34.206), ("石家庄", 114.515, 38.043), ("天津", 117.200, 39.084),
+    ("沈阳", 123.431, 41.806), ("南昌", 115.858, 28.683), ("贵阳", 106.631, 26.647), ("昆明", 102.833, 24.880),
+    ("南宁", 108.367, 22.817), ("福州", 119.296, 26.074), ("深圳", 114.058, 22.543), ("太原", 112.549, 37.871),
+    ("兰州", 103.834, 36.061), ("哈尔滨", 126.535, 45.803), ("长春", 125.324, 43.817), ("青岛", 120.383, 36.067),
+)
+
+# 超过该绕行系数（经中转站的距离 / 直线距离）的中转站不考虑
+MAX_DETOUR = 1.6
+
+
+def join_transfers(first: Sequence[TrainLeg], first_hubs: Sequence[int],
+                   second: Sequence[TrainLeg], second_hubs: Sequence[int],
+                   min_same_station: int, min_cross_station: int, max_wait: int,
+                   sort_by: str = "arrival") -> List[Tuple[int, int]]:
+    """
+    向量化拼接两段车次：所有 (第一段, 第二段) 组合一次性按同一中转城市、换乘时间规则过滤并排序
+
+    Args:
+        first / second: 第一段（出发地 -> 中转站）与第二段（中转站 -> 目的地）车次
+        first_hubs / second_hubs: 每段车次对应的中转城市编号
+        min_same_station: 同站换乘的最短换乘时间（分钟）
+        min_cross_station: 同城不同站换乘的最短换乘时间（分钟）
+        max_wait: 最长换乘等待时间（分钟）
+        sort_by: arrival（最早到达）/ duration（总历时最短）/ price（总票价最低）
+
+    Returns:
+        按 sort_by 排好序的 [(第一段下标, 第二段下标)]
+    """
+    if not first or not second:
+        return []
+    station_ids: Dict[str, int] = {}
+    f_hub, s_hub = np.asarray(first_hubs), np.asarray(second_hubs)
+    f_dep = np.fromiter((leg.depart for leg in first), dtype=np.int32, count=len(first))
+    f_arr = np.fromiter((leg.arrive for leg in first), dtype=np.int32, count=len(first))
+    f_price = np.fromiter((leg.price for leg in first), dtype=np.float64, count=len(first))
+    f_station = np.fromiter((station_ids.setdefault(leg.to_code, len(station_ids)) for leg in first),
+                            dtype=np.int32, count=len(first))
+    s_dep = np.fromiter((leg.depart for leg in second), dtype=np.int32, count=len(second))
+    s_arr = np.fromiter((leg.arrive for leg in second), dtype=np.int32, count=len(second))
+    s_price = np.fromiter((leg.price for leg in second), dtype=np.float64, count=len(second))
+    s_station = np.fromiter((station_ids.setdefault(leg.from_code, len(station_ids)) for leg in second),
+                            dtype=np.int32, count=len(second))
+
+    # 第二段按查询日期查询：第一段次日到达的组合等待时间为负，自然被排除
+    wait = s_dep[None, :] - f_arr[:, None]
+    required = np.where(f_station[:, None] == s_station[None, :], min_same_station, min_cross_station)
+    valid = (f_hub[:, None] == s_hub[None, :]) & (wait >= required) & (wait <= max_wait)
+    i, j = np.nonzero(valid)
+    if not len(i):
+        return []
+
+    arrival = s_arr[j]
+    duration = arrival - f_dep[i]
+    price = f_price[i] + s_price[j]
+    price = np.where(np.isnan(price), np.inf, price)
+    if sort_by == "price":
+        order = np.lexsort((arrival, price))
+    elif sort_by == "duration":
+        order = np.lexsort((arrival, duration))
+    else:
+        order = np.lexsort((duration, arrival))
+    return list(zip(i[order].tolist(), j[order].tolist()))
+
+
+@dataclass
+class TransferLegs:
+    """中转规划查询到的两段车次：first_hubs / second_hubs 为每段车次对应的中转城市（hubs 中的下标）"""
+    first: List[TrainLeg]
+    first_hubs: List[int]
+    second: List[TrainLeg]
+    second_hubs: List[int]
+    hubs: List[str]
+    failed: int = 0  # 查询失败的余票数
+    unresolved: Optional[List[str]] = None  # 无法确定车站编码的出发地 / 目的地
+
+    def exclude(self, prefixes: Tuple[str, ...]) -> None:
+        """去掉车次字头在 prefixes 中的车次（用户排除的车次类型），中转城市编号随之对齐"""
+        if not prefixes:
+            return
+        self.first, self.first_hubs = _without_prefixes(self.first, self.first_hubs, prefixes)
+        self.second, self.second_hubs = _without_prefixes(self.second, self.second_hubs, prefixes)
+
+
+def _without_prefixes(legs: List[TrainLeg], hubs: List[int],
+                      prefixes: Tuple[str, ...]) -> Tuple[List[TrainLeg], List[int]]:
+    kept = [(leg, hub) for leg, hub in zip(legs, hubs) if not leg.train_no.startswith(prefixes)]
+    return [leg for leg, _ in kept], [hub for _, hub in kept]
+
+
+class TransferPlanner:
+    """
+    确定性的中转方案规划
+
+    按出发地、目的地的位置挑选绕行最少的枢纽城市作为中转站，有限并发地同时查询
+    “出发地 -> 中转站”和“中转站 -> 目的地”两段余票，再按同站 / 同城换站的最短换乘时间向量化拼接，
+    一次返回排好序的中转方案，代替票务专家逐个猜测中转站、多轮调用工具。
+    """
+
+    def __init__(self, max_hubs: int = 6, concurrency: int = 6, min_same_station: int = 20,
+                 min_cross_station: int = 60, max_wait: int = 360, catalog: Optional[StationCatalog] = None):
+        self.max_hubs = max_hubs
+        self.concurrency = concurrency
+        self.min_same_station = min_same_station
+        self.min_cross_station = min_cross_station
+        self.max_wait = max_wait
+        self.catalog = catalog
+        self.stats_counts = {"plans": 0, "itineraries": 0, "leg_queries": 0, "combinations": 0, "join_ms": 0.0}
+
+    @classmethod
+    def from_env(cls, catalog: Optional[StationCatalog] = None) -> "TransferPlanner":
+        """
+        TRANSFER_MAX_HUBS 为每次规划查询的中转城市数（默认 6，设为 0 则不提供中转规划工具）；
+        TRANSFER_CONCURRENCY 为同时查询的余票数（默认 6）；
+        TRANSFER_MIN_SAME_STATION / TRANSFER_MIN_CROSS_STATION 为同站 / 同城换站的最短换乘分钟数（默认 20 / 60）；
+        TRANSFER_MAX_WAIT 为最长换乘等待分钟数（默认 360）
+        """
+        return cls(int(os.environ.get("TRANSFER_MAX_HUBS", "6") or 0),
+                   int(os.environ.get("TRANSFER_CONCURRENCY", "6")),
+                   int(os.environ.get("TRANSFER_MIN_SAME_STATION", "20")),
+                   int(os.environ.get("TRANSFER_MIN_CROSS_STATION", "60")),
+                   int(os.environ.get("TRANSFER_MAX_WAIT", "360")),
+                   catalog)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_hubs > 0
+
+    def _location(self, place: str) -> Optional[Tuple[float, float]]:
+        """地点坐标：枢纽城市表，其次是车站目录中的车站坐标"""
+        for city, lng, lat in HUB_CITIES:
+            if place.startswith(city):
+                return lng, lat
+        if self.catalog is not None:
+            station = self.catalog.resolve(place) or (self.catalog.stations.get(place)
+                                                      if TELECODE_PATTERN.match(place) else None)
+            if station is not None:
+                if station.location is not None:
+                    return station.location
+                return self._location(station.city) if station.city and station.city != place else None
+        return None
+
+    def _city(self, place: str) -> str:
+        """地点所在城市（用于排除与出发地 / 目的地同城的中转站）"""
+        if self.catalog is not None:
+            station = self.catalog.resolve(place) or (self.catalog.stations.get(place)
+                                                      if TELECODE_PATTERN.match(place) else None)
+            if station is not None and station.city:
+                return station.city
+        return place
+
+    def select_hubs(self, origin: str, destination: str, hubs: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        挑选中转城市：指定了 hubs 时直接使用；知道两端坐标时按绕行系数从小到大选择，
+        否则按枢纽等级选择。与出发地、目的地同城的枢纽不作为中转站
+        """
+        if hubs:
+            return list(dict.fromkeys(hubs))[:self.max_hubs]
+        excluded = (self._city(origin), self._city(destination))
+        candidates = [(city, (lng, lat)) for city, lng, lat in HUB_CITIES
+                      if not any(place.startswith(city) or city.startswith(place) for place in excluded if place)]
+        start, end = self._location(origin), self._location(destination)
+        if start is None or end is None:
+            return [city for city, _ in candidates[:self.max_hubs]]
+        direct = max(haversine_km(start, end), 1.0)
+        scored = sorted(((haversine_km(start, point) + haversine_km(point, end)) / direct, index, city)
+                        for index, (city, point) in enumerate(candidates))
+        return [city for detour, _, city in scored if detour <= MAX_DETOUR][:self.max_hubs]
+
+    async def resolve_codes(self, call_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                             places: Sequence[str]) -> Dict[str, str]:
+        """地点 -> 车站编码：电报码直接使用，其次查车站目录，剩下的一次调用 get-station-code-of-citys"""
+        codes: Dict[str, str] = {}
+        missing = []
+        for place in places:
+            if TELECODE_PATTERN.match(place):
+                codes[place] = place
+                continue
+            station = self.catalog.resolve(place) if self.catalog is not None else None
+            if station is not None:
+                codes[place] = station.code
+            else:
+                missing.append(place)
+        if missing:
+            try:
+                data = json.loads(await call_tool("get-station-code-of-citys", {"citys": "|".join(missing)}) or "")
+            except ValueError:
+                data = {}
+            for place in missing:
+                result = data.get(place) if isinstance(data, dict) else None
+                if isinstance(result, dict) and TELECODE_PATTERN.match(str(result.get("station_code", ""))):
+                    codes[place] = result["station_code"]
+        return codes
+
+    async def collect_legs(self, call_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]], date: str, origin: str,
+                           destination: str, train_filter: str = "",
+                           hubs: Optional[Sequence[str]] = None) -> TransferLegs:
+        """挑选中转城市，并同时查询所有中转城市的两段余票（并发数受 concurrency 限制）"""
+        hub_cities = self.select_hubs(origin, destination, hubs)
+        codes = await self.resolve_codes(call_tool, [origin, destination, *hub_cities])
+        unresolved = [place for place in (origin, destination) if place not in codes]
+        if unresolved:
+            return TransferLegs([], [], [], [], [], unresolved=unresolved)
+        hub_cities = [city for city in hub_cities if city in codes]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def query(from_code: str, to_code: str) -> List[TrainLeg]:
+            arguments = {"date": date, "fromStation": from_code, "toStation": to_code}
+            if train_filter:
+                arguments["trainFilterFlags"] = train_filter
+            async with semaphore:
+                self.stats_counts["leg_queries"] += 1
+                return parse_tickets(await call_tool("get-tickets", arguments))
+
+        results = await asyncio.gather(
+            *(query(codes[origin], codes[city]) for city in hub_cities),
+            *(query(codes[city], codes[destination]) for city in hub_cities),
+            return_exceptions=True)
+        legs = TransferLegs([], [], [], [], hub_cities)
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                if isinstance(result, asyncio.CancelledError):
+                    raise result
+                legs.failed += 1
+                continue
+            hub = index % len(hub_cities)
+            leg_list, hub_ids = (legs.first, legs.first_hubs) if index < len(hub_cities) else (legs.second,
+                                                                                              legs.second_hubs)
+            leg_list.extend(result)
+            hub_ids.extend([hub] * len(result))
+        return legs
+
+    async def plan(self, call_tool: Callable[[str, Dict[str, Any]], Awaitable[Any]], date: str, origin: str,
+                   destination: str, train_filter: str = "", sort_by: str = "arrival", limit: int = 10,
+                   hubs: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        规划中转方案
+
+        Args:
+            call_tool: call_tool(工具名, 参数) 返回工具结果文本（使用带缓存与预算的 12306 工具）
+            date: 出发日期 YYYY-MM-DD
+            origin / destination: 出发地 / 目的地（城市名、车站名或电报码）
+            train_filter: 车次类型筛选，与 get-tickets 的 trainFilterFlags 相同（例如 "GD"）
+            sort_by: arrival（最早到达）/ duration（总历时最短）/ price（总票价最低）
+            limit: 返回的方案数
+            hubs: 指定的中转城市（可选）
+
+        Returns:
+            {"itineraries": [...], "hubs": [...], "combinations": 评估的组合数, ...}
+        """
+        legs = await self.collect_legs(call_tool, date, origin, destination, train_filter, hubs)
+        if legs.unresolved:
+            PLANS.labels("unresolved").inc()
+            return {"error": f"无法确定车站编码：{'、'.join(legs.unresolved)}", "itineraries": []}
+        first, first_hubs, second, second_hubs = legs.first, legs.first_hubs, legs.second, legs.second_hubs
+        hub_cities = legs.hubs
+
+        start = time.perf_counter()
+        pairs = join_transfers(first, first_hubs, second, second_hubs, self.min_same_station,
+                               self.min_cross_station, self.max_wait, sort_by)
+        join_seconds = time.perf_counter() - start
+        JOIN_SECONDS.observe(join_seconds)
+
+        # 每个第一段车次只保留最优的一种接续，方案之间更有区分度
+        itineraries = []
+        used = set()
+        for i, j in pairs:
+            if i in used:
+                continue
+            used.add(i)
+            leg1, leg2 = first[i], second[j]
+            total_price = leg1.price + leg2.price
+            itineraries.append({
+                "rank": len(itineraries) + 1,
+                "transfer_city": hub_cities[first_hubs[i]],
+                "same_station": leg1.to_code == leg2.from_code,
+                "transfer_minutes": leg2.depart - leg1.arrive,
+                "total_minutes": leg2.arrive - leg1.depart,
+                "lowest_price": None if math.isnan(total_price) else round(total_price, 1),
+                "first": leg1.to_result(),
+                "second": leg2.to_result(),
+            })
+            if len(itineraries) >= limit:
+                break
+
+        combinations = len(first) * len(second)
+        self.stats_counts["plans"] += 1
+        self.stats_counts["itineraries"] += len(itineraries)
+        self.stats_counts["combinations"] += combinations
+        self.stats_counts["join_ms"] += join_seconds * 1000
+        PLANS.labels("found" if itineraries else "empty").inc()
+        return {
+            "itineraries": itineraries,
+            "hubs": hub_cities,
+            "combinations": combinations,
+            "failed_queries": legs.failed,
+            "rules": f"同站换乘至少 {self.min_same_station} 分钟，同城换站至少 {self.min_cross_station} 分钟，"
+                     f"等待不超过 {self.max_wait} 分钟",
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self.stats_counts, "join_ms": round(self.stats_counts["join_ms"], 3)}
+
+
+class TransferPlanInput(BaseModel):
+    date: str = Field(description="出发日期，格式为 yyyy-MM-dd")
+    fromStation: str = Field(description="出发地：城市名、车站名或 station_code")
+    toStation: str = Field(description="目的地：城市名、车站名或 station_code")
+    trainFilterFlags: str = Field(default="", description="车次类型筛选，与 get-tickets 相同，例如 G、GD")
+    sortBy: str = Field(default="arrival", description="排序方式：arrival 最早到达 / duration 总历时最短 / price 票价最低")
+    limit: int = Field(default=10, description="返回的中转方案数")
+    transferCities: str = Field(default="", description="指定的中转城市（可选），以 | 分隔，例如 武汉|郑州")
+
+
+def build_transfer_tool(planner: TransferPlanner, tools: List[BaseTool]) -> Optional[BaseTool]:
+    """用（带缓存与预算的）12306 工具构建中转规划工具，规划未启用或缺少 get-tickets 时返回 None"""
+    tools_by_name = {tool.name: tool for tool in tools}
+    if not planner.enabled or "get-tickets" not in tools_by_name:
+        return None
+
+    async def call_tool(name: str, arguments: Dict[str, Any]) -> Any:
+        if name not in tools_by_name:
+            return None
+        return await tools_by_name[name].ainvoke(arguments)
+
+    async def plan_transfer(date: str, fromStation: str, toStation: str, trainFilterFlags: str = "",
+                            sortBy: str = "arrival", limit: int = 10, transferCities: str = "") -> str:
+        hubs = [city for city in transferCities.split("|") if city] if transferCities else None
+        result = await planner.plan(call_tool, date, fromStation, toStation, trainFilterFlags,
+                                    sortBy, max(1, min(limit, 30)), hubs)
+        return json.dumps(result, ensure_ascii=False)
+
+    return StructuredTool.from_function(
+        coroutine=plan_transfer, name=TRANSFER_TOOL,
+        args_schema=TransferPlanInput.model_json_schema(),
+        description="查询中转（换乘）车票：自动挑选中转城市，并行查询两段余票并按换乘时间拼接，"
+                    "一次返回排好序的中转方案（含中转城市、换乘时间、两段车次与票价）。没有直达车次时使用，"
+                    "不需要自己逐个尝试中转站。")
@@ -0,0 +1,103 @@
+# waterfall.py
+"""
+打印指定请求的追踪瀑布图
+
+用法（在 backend 目录下）：
+    python -m config.waterfall <请求 ID> [--file traces.jsonl]
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from .tracing import STATUS_ERROR
+
+
+def _plain_value(value: Dict[str, Any]) -> Any:
+    """OTLP JSON 的 AnyValue 转回普通值"""
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("stringValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def load_spans(file_path: str, request_id: str) -> List[Dict[str, Any]]:
+    """从 OTLP JSON 文件中读取指定请求（traceId）的全部 span"""
+    spans = []
+    with open(file_path, encoding='utf-8') as f:
+        for line in f:
+            if request_id not in line:
+                continue
+            for resource_spans in json.loads(line).get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for span in scope_spans.get("spans", []):
+                        if span.get("traceId") == request_id:
+                            span["attributes"] = {item["key"]: _plain_value(item["value"])
+                                                  for item in span.get("attributes", [])}
+                            spans.append(span)
+    return spans
+
+
+def render_waterfall(spans: List[Dict[str, Any]], width: int = 40) -> str:
+    """按父子关系和开始时间输出瀑布图：每行是一个 span 的相对开始时间、耗时、时间条和关键属性"""
+    if not spans:
+        return "没有找到该请求的追踪数据"
+    start = min(int(span["startTimeUnixNano"]) for span in spans)
+    end = max(int(span["endTimeUnixNano"]) for span in spans)
+    total = max(end - start, 1)
+    ids = {span["spanId"] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for span in spans:
+        parent = span.get("parentSpanId") if span.get("parentSpanId") in ids else None
+        children.setdefault(parent, []).append(span)
+
+    name_width = 44
+    lines = [f"{'span':<{name_width}} {'开始':>9} {'耗时':>9}  时间线"]
+
+    def walk(parent: Optional[str], depth: int) -> None:
+        for span in sorted(children.get(parent, []), key=lambda s: int(s["startTimeUnixNano"])):
+            span_start = int(span["startTimeUnixNano"]) - start
+            duration = int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])
+            offset = int(span_start / total * width)
+            length = max(int(duration / total * width), 1)
+            bar = " " * offset + "█" * min(length, width - offset)
+            status = span.get("status", {})
+            label = ("  " * depth + span["name"])[:name_width]
+            details = _span_details(span["attributes"])
+            if status.get("code") == STATUS_ERROR:
+                details = f"✗ {status.get('message', '')[:60]} {details}"
+            lines.append(f"{label:<{name_width}} {span_start / 1e6:>7.0f}ms {duration / 1e6:>7.0f}ms  "
+                         f"|{bar:<{width}}| {details}".rstrip())
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def _span_details(attributes: Dict[str, Any]) -> str:
+    keys = ("request.outcome", "node.subtask", "llm.prompt_tokens", "llm.completion_tokens",
+            "tool.arguments", "tool.output_chars")
+    return " ".join(f"{key.split('.')[-1]}={str(attributes[key])[:60]}" for key in keys if key in attributes)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="打印指定请求的追踪瀑布图")
+    parser.add_argument("request_id", help="请求 ID（响应头 X-Request-ID / done 事件中的 request_id）")
+    parser.add_argument("--file", default=os.environ.get("TRACE_FILE", "traces.jsonl"), help="OTLP JSON 追踪文件")
+    parser.add_argument("--width", type=int, default=40, help="时间线宽度")
+    args = parser.parse_args(argv)
+
+    # 轮转后较早的请求在 .1 备份中
+    files = [path for path in (args.file, f"{args.file}.1") if os.path.exists(path)]
+    if not files:
+        sys.exit(f"追踪文件不存在: {args.file}")
+    spans = [span for path in files for span in load_spans(path, args.request_id)]
+    print(render_waterfall(spans, args.width))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,185 @@
-# streamlit_front.py
-
-import streamlit as st
-import asyncio
-from Travel_Planning.backend.config import TravelAgent
-import logging
-
-# 设置页面配置
-st.set_page_config(
-    page_title="智能旅行规划助手",
-    page_icon="✈️",
-    layout="wide",
-)
-
-# 初始化会话状态
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-    st.session_state.travel_agent = None
-
-# 标题和简介
-st.title("🚄 智能旅行规划助手")
-st.markdown("""
-欢迎使用智能旅行规划助手！我可以帮助您：
-- 查询高铁票务信息
-- 规划市内公交地铁路线
-- 提供完整的出行方案
-""")
-
-
-# 清除聊天历史函数
-def clear_chat_history():
-    st.session_state.messages = []
-    st.session_state.travel_agent = None
-
-
-# 添加清除聊天按钮
-if st.session_state.messages:
-    if st.button("🧹 清除聊天记录"):
-        clear_chat_history()
-        st.rerun()
-
-# 侧边栏信息
-with st.sidebar:
-    st.header("关于")
-    st.markdown("""
-    ### 功能说明
-    本系统整合了高德地图API和12306票务数据，为您提供一站式旅行规划服务。
-
-    ### 使用提示
-    1. 请尽量详细描述您的需求
-    2. 包含出发地、目的地、日期等信息
-    3. 可以指定交通偏好（如只坐高铁）
-    """)
-    st.markdown("---")
-    st.markdown("© 2025 智能旅行规划系统 | 端口:8003")
-
-
-# 初始化旅行代理
-async def init_agent():
-    if st.session_state.travel_agent is None:
-        st.session_state.travel_agent = TravelAgent()
-        with st.spinner("正在初始化旅行规划引擎..."):
-            await st.session_state.travel_agent.initialize()
-
-
-# 处理用户输入并显示流式响应
-async def handle_user_input(user_input: str):
-    # 添加到聊天历史
-    st.session_state.messages.append({"role": "user", "content": user_input})
-
-    # 显示用户消息
-    with st.chat_message("user"):
-        st.markdown(user_input)
-
-    # 显示助手响应
-    with st.chat_message("assistant"):
-        response_placeholder = st.empty()
-        full_response = ""
-
-        try:
-            async for chunk in st.session_state.travel_agent.process_query(user_input):
-                full_response += chunk
-                response_placeholder.markdown(full_response + "▌")
-
-            response_placeholder.markdown(full_response)
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-        except Exception as e:
-            error_msg = f"抱歉，处理请求时出错: {str(e)}"
-            response_placeholder.markdown(error_msg)
-            st.session_state.messages.append({"role": "assistant", "content": error_msg})
-
-
-# 显示聊天历史
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-
-# 用户输入表单
-with st.form(key="user_input_form"):
-    user_input = st.text_area(
-        "请输入您的旅行需求:",
-        placeholder="例如: 查询上海东方明珠景点到上海迪士尼乐园的的驾车路线规划",
-        height=100,
-        key="user_input"
-    )
-
-    submit_button = st.form_submit_button("提交")
-
-    if submit_button and user_input.strip():
-        asyncio.run(init_agent())
-        asyncio.run(handle_user_input(user_input))
-        st.rerun()
-
-# 运行Streamlit应用
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# streamlit_front.py
+
+import streamlit as st
+import time
+import uuid
+from Travel_Planning.backend.config import BackgroundAgentRuntime
+import logging
+
+# 设置页面配置
+st.set_page_config(
+    page_title="智能旅行规划助手",
+    page_icon="✈️",
+    layout="wide",
+)
+
+# 初始化会话状态（每个浏览器会话只保存聊天记录和会话 ID，代理由进程内所有会话共享）
+if "messages" not in st.session_state:
+    st.session_state.messages = []
+    # 会话 ID：同一浏览器会话中的提问是多轮对话，追问可复用之前的查询结果
+    st.session_state.thread_id = uuid.uuid4().hex
+
+# 标题和简介
+st.title("🚄 智能旅行规划助手")
+st.markdown("""
+欢迎使用智能旅行规划助手！我可以帮助您：
+- 查询高铁票务信息
+- 规划市内公交地铁路线
+- 提供完整的出行方案
+""")
+
+
+# 进程内共享的旅行代理：运行在常驻的后台事件循环上，MCP 服务只启动一次
+@st.cache_resource(show_spinner="正在初始化旅行规划引擎...")
+def get_agent_runtime() -> BackgroundAgentRuntime:
+    runtime = BackgroundAgentRuntime()
+    try:
+        runtime.initialize()
+    except Exception:
+        # 初始化失败不缓存，下一次提交时重试
+        runtime.close()
+        raise
+    return runtime
+
+
+# 清除聊天历史函数
+def clear_chat_history():
+    runtime = get_agent_runtime()
+    runtime.run(runtime.agent.checkpointer.delete(st.session_state.thread_id))
+    st.session_state.messages = []
+    st.session_state.thread_id = uuid.uuid4().hex
+
+
+# 添加清除聊天按钮
+if st.session_state.messages:
+    if st.button("🧹 清除聊天记录"):
+        clear_chat_history()
+        st.rerun()
+
+# 侧边栏信息
+with st.sidebar:
+    st.header("关于")
+    st.markdown("""
+    ### 功能说明
+    本系统整合了高德地图API和12306票务数据，为您提供一站式旅行规划服务。
+
+    ### 使用提示
+    1. 请尽量详细描述您的需求
+    2. 包含出发地、目的地、日期等信息
+    3. 可以指定交通偏好（如只坐高铁）
+    """)
+    st.markdown("---")
+    st.markdown("© 2025 智能旅行规划系统 | 端口:8003")
+
+
+# 进度事件中专家代理的显示名称
+EXPERT_LABELS = {
+    "navigation_expert": "导航专家",
+    "ticketing_expert": "票务专家",
+    "door_to_door": "门到门规划",
+}
+
+
+class IncrementalMarkdown:
+    """
+    增量渲染流式输出的 markdown：完整的段落各自渲染一次后不再改动，
+    只有最后一段随新内容刷新，并且刷新按时间间隔节流
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.container = st.container()
+        self.interval = interval
+        self.text = ""
+        self.committed = 0  # 已渲染为完整段落的字符数
+        self.tail = self.container.empty()
+        self.rendered_at = 0.0
+
+    def _commit_paragraphs(self):
+        # 代码块内部的空行不是段落边界
+        start = self.committed
+        while (end := self.text.find("\n\n", start)) >= 0:
+            if self.text.count("```", self.committed, end) % 2 == 0:
+                self.tail.markdown(self.text[self.committed:end])
+                self.tail = self.container.empty()
+                self.committed = end + 2
+            start = end + 2
+
+    def append(self, chunk: str):
+        self.text += chunk
+        self._commit_paragraphs()
+        now = time.monotonic()
+        if now - self.rendered_at >= self.interval:
+            self.tail.markdown(self.text[self.committed:] + "▌")
+            self.rendered_at = now
+
+    def finish(self):
+        self.tail.markdown(self.text[self.committed:])
+
+
+# 处理用户输入并显示流式响应
+def handle_user_input(user_input: str):
+    # 添加到聊天历史
+    st.session_state.messages.append({"role": "user", "content": user_input})
+
+    # 显示用户消息
+    with st.chat_message("user"):
+        st.markdown(user_input)
+
+    # 显示助手响应
+    with st.chat_message("assistant"):
+        progress = st.status("正在规划行程...", expanded=False)
+        response = IncrementalMarkdown()
+
+        try:
+            for event in get_agent_runtime().stream_events(user_input, thread_id=st.session_state.thread_id):
+                event_type = event["type"]
+                if event_type == "resumed":
+                    progress.write("↻ 从上次中断的步骤继续")
+                elif event_type == "plan":
+                    progress.update(label="已完成任务规划，正在执行子任务...")
+                elif event_type == "subtask_started":
+                    progress.write(f"▶️ {EXPERT_LABELS.get(event['node'], event['node'])}：{event['task']}")
+                elif event_type == "tool_call":
+                    progress.write(f"🔧 调用工具 `{event['tool']}`")
+                elif event_type == "subtask_finished":
+                    progress.write(f"✅ {EXPERT_LABELS.get(event['node'], event['node'])}已完成")
+                elif event_type == "token":
+                    if not response.text:
+                        progress.update(label="规划完成", state="complete")
+                    response.append(event["content"])
+
+            response.finish()
+            st.session_state.messages.append({"role": "assistant", "content": response.text})
+        except Exception as e:
+            error_msg = f"抱歉，处理请求时出错: {str(e)}"
+            progress.update(label="规划失败", state="error")
+            st.markdown(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+
+# 显示聊天历史
+for message in st.session_state.messages:
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+# 用户输入表单
+with st.form(key="user_input_form"):
+    user_input = st.text_area(
+        "请输入您的旅行需求:",
+        placeholder="例如: 查询上海东方明珠景点到上海迪士尼乐园的的驾车路线规划",
+        height=100,
+        key="user_input"
+    )
+
+    submit_button = st.form_submit_button("提交")
+
+    if submit_button and user_input.strip():
+        handle_user_input(user_input)
+        st.rerun()
+
+# 运行Streamlit应用
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
\ No newline at end of file